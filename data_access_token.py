@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 """Functions for token management."""
 
-__copyright__ = 'Copyright (c) 2021, Utrecht University'
+__copyright__ = 'Copyright (c) 2021-2024, Utrecht University'
 __license__   = 'GPLv3, see LICENSE'
 
 import os
 import secrets
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from traceback import print_exc
 
@@ -42,12 +43,10 @@ def api_token_generate(ctx, label=None):
     gen_time = datetime.now()
     token_lifetime = timedelta(hours=config.token_lifetime)
     exp_time = gen_time + token_lifetime
-    conn = sqlite3.connect(config.token_database)
     result = None
 
     try:
-        with conn:
-            conn.execute("PRAGMA key='%s'" % (config.token_database_password))
+        with token_database() as conn:
             conn.execute('''INSERT INTO tokens VALUES (?, ?, ?, ?, ?)''', (user_id, label, token, gen_time, exp_time))
             result = token
     except sqlite3.IntegrityError:
@@ -56,10 +55,6 @@ def api_token_generate(ctx, label=None):
         print_exc()
         result = api.Error('DatabaseError', 'Error occurred while writing to database')
 
-    # Connection object used as context manager only commits or rollbacks transactions,
-    # so the connection object should be closed manually
-    conn.close()
-
     return result
 
 
@@ -76,12 +71,10 @@ def api_token_load(ctx):
         return api.Error('DatabaseError', 'Internal error: token database unavailable')
 
     user_id = user.name(ctx)
-    conn = sqlite3.connect(config.token_database)
     result = []
 
     try:
-        with conn:
-            conn.execute("PRAGMA key='%s'" % (config.token_database_password))
+        with token_database() as conn:
             for row in conn.execute('''SELECT label, exp_time FROM tokens WHERE user=:user_id AND exp_time > :now''',
                                     {"user_id": user_id, "now": datetime.now()}):
                 exp_time = datetime.strptime(row[1], '%Y-%m-%d %H:%M:%S.%f')
@@ -91,10 +84,6 @@ def api_token_load(ctx):
         print_exc()
         result = api.Error('DatabaseError', 'Error occurred while reading database')
 
-    # Connection object used as context manager only commits or rollbacks transactions,
-    # so the connection object should be closed manually
-    conn.close()
-
     return result
 
 
@@ -111,22 +100,16 @@ def api_token_delete(ctx, label):
         return api.Error('DatabaseError', 'Internal error: token database unavailable')
 
     user_id = user.name(ctx)
-    conn = sqlite3.connect(config.token_database)
     result = None
 
     try:
-        with conn:
-            conn.execute("PRAGMA key='%s'" % (config.token_database_password))
+        with token_database() as conn:
             conn.execute('''DELETE FROM tokens WHERE user = ? AND label = ?''', (user_id, label))
             result = api.Result.ok()
     except Exception:
         print_exc()
         result = api.Error('DatabaseError', 'Error during deletion from database')
 
-    # Connection object used as context manager only commits or rollbacks transactions,
-    # so the connection object should be closed manually
-    conn.close()
-
     return result
 
 
@@ -142,22 +125,16 @@ def api_token_delete_expired(ctx):
         return api.Error('DatabaseError', 'Internal error: token database unavailable')
 
     user_id = user.name(ctx)
-    conn = sqlite3.connect(config.token_database)
     result = None
 
     try:
-        with conn:
-            conn.execute("PRAGMA key='%s'" % (config.token_database_password))
+        with token_database() as conn:
             conn.execute('''DELETE FROM tokens WHERE user = ? AND exp_time < ? ''', (user_id, datetime.now()))
             result = api.Result.ok()
     except Exception:
         print_exc()
         result = api.Error('DatabaseError', 'Error during deletion from database')
 
-    # Connection object used as context manager only commits or rollbacks transactions,
-    # so the connection object should be closed manually
-    conn.close()
-
     return result
 
 
@@ -174,11 +151,9 @@ def get_all_tokens(ctx):
     if not token_database_initialized():
         return []
 
-    conn = sqlite3.connect(config.token_database)
     result = []
     try:
-        with conn:
-            conn.execute("PRAGMA key='%s'" % (config.token_database_password))
+        with token_database() as conn:
             for row in conn.execute('''SELECT user, label, exp_time FROM tokens WHERE exp_time > :now''',
                                     {"now": datetime.now()}):
                 result.append({"user": row[0], "label": row[1], "exp_time": row[2]})
@@ -186,16 +161,76 @@ def get_all_tokens(ctx):
         print_exc()
         result = api.Error('DatabaseError', 'Error occurred while reading database')
 
-    # Connection object used as context manager only commits or rollbacks transactions,
-    # so the connection object should be closed manually
-    conn.close()
-
     return result
 
 
+def delete_all_expired_tokens(ctx):
+    """Delete the expired tokens of all users.
+
+    :param ctx: Combined type of a callback and rei struct
+
+    :returns: Number of deleted tokens
+    """
+    # check permissions - rodsadmin only
+    if user.user_type(ctx) != 'rodsadmin':
+        return 0
+
+    if not token_database_initialized():
+        return 0
+
+    try:
+        with token_database() as conn:
+            return conn.execute('''DELETE FROM tokens WHERE exp_time < ?''', (datetime.now(),)).rowcount
+    except Exception:
+        print_exc()
+        return 0
+
+
 def token_database_initialized():
     """Checks whether token database has been initialized
 
     :returns: Boolean value
     """
-    return os.path.isfile(config.token_database)
+    return _connection is not None or os.path.isfile(config.token_database)
+
+
+# Connection to the token database of this agent, which is kept open between calls,
+# because opening the token database with its key is deliberately slow.
+_connection = None
+
+
+@contextmanager
+def token_database():
+    """Provides a connection to the token database in a transaction, committed on success."""
+    global _connection
+
+    if _connection is None:
+        _connection = _connect()
+
+    try:
+        with _connection:
+            yield _connection
+    except sqlite3.IntegrityError:
+        raise
+    except sqlite3.Error:
+        # The connection may be unusable (e.g. the database has been replaced), so open a new one next time.
+        _connection.close()
+        _connection = None
+        raise
+
+
+def _connect():
+    conn = sqlite3.connect(config.token_database)
+    try:
+        conn.execute("PRAGMA key='%s'" % (config.token_database_password))
+        # WAL mode is persistent: every process that opens the token database (including
+        # readers outside the ruleset) needs write access to its directory for the -wal and
+        # -shm files.
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            conn.execute('''CREATE INDEX IF NOT EXISTS tokens_user_exp_time ON tokens (user, exp_time)''')
+    except Exception:
+        conn.close()
+        raise
+
+    return conn
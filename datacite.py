@@ -1,14 +1,12 @@
 # -*- coding: utf-8 -*-
 """Functions for communicating with DataCite and some utilities."""
 
-__copyright__ = 'Copyright (c) 2019-2022, Utrecht University'
+__copyright__ = 'Copyright (c) 2019-2024, Utrecht University'
 __license__ = 'GPLv3, see LICENSE'
 
 import random
 import string
 
-import requests
-
 from util import *
 
 
@@ -18,12 +16,13 @@ def metadata_post(ctx, payload):
     auth = (config.datacite_username, config.datacite_password)
     headers = {'Content-Type': 'application/json', 'charset': 'UTF-8'}
 
-    response = requests.post(url,
-                             auth=auth,
-                             data=payload,
-                             headers=headers,
-                             timeout=30,
-                             verify=config.datacite_tls_verify)
+    response = http_client.post('datacite',
+                                url,
+                                auth=auth,
+                                data=payload,
+                                headers=headers,
+                                timeout=30,
+                                verify=config.datacite_tls_verify)
 
     return response.status_code
 
@@ -34,12 +33,13 @@ def metadata_put(ctx, doi, payload):
     auth = (config.datacite_username, config.datacite_password)
     headers = {'Content-Type': 'application/json', 'charset': 'UTF-8'}
 
-    response = requests.put(url,
-                            auth=auth,
-                            data=payload,
-                            headers=headers,
-                            timeout=30,
-                            verify=config.datacite_tls_verify)
+    response = http_client.put('datacite',
+                               url,
+                               auth=auth,
+                               data=payload,
+                               headers=headers,
+                               timeout=30,
+                               verify=config.datacite_tls_verify)
 
     return response.status_code
 
@@ -50,11 +50,12 @@ def metadata_get(ctx, doi):
     auth = (config.datacite_username, config.datacite_password)
     headers = {'Content-Type': 'application/json', 'charset': 'UTF-8'}
 
-    response = requests.get(url,
-                            auth=auth,
-                            headers=headers,
-                            timeout=30,
-                            verify=config.datacite_tls_verify)
+    response = http_client.get('datacite',
+                               url,
+                               auth=auth,
+                               headers=headers,
+                               timeout=30,
+                               verify=config.datacite_tls_verify)
 
     return response.status_code
 
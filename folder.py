@@ -260,6 +260,10 @@ def folder_secure(ctx, coll):
     # Copy provenance log from research folder to vault package.
     provenance.provenance_copy_log(ctx, coll, target)
 
+    # The metadata was ingested before the provenance log was copied, so the retention
+    # end date was based on the creation time. Store it based on the deposit date.
+    meta.store_retention_end_date(ctx, target)
+
     # Try to register EPIC PID if enabled.
     if not set_epic_pid(ctx, target):
         return False
@@ -282,19 +282,24 @@ def user_role(ctx, username, group_name):
 
     :returns: User role ('none' | 'reader' | 'normal' | 'manager')
     """
-    group = getGroupData(ctx, group_name)
     if '#' not in username:
         username = username + "#" + session_vars.get_map(ctx.rei)["client_user"]["irods_zone"]
 
-    if group:
-        if username in group["managers"]:
-            return "manager"
-        elif username in group["members"]:
-            return "normal"
-        elif username in group["read"]:
-            return "reader"
+    roles = group_membership_data_manager.GroupMembershipDataManager().get_group_roles(ctx, group_name)
+    return roles.get(username, "none")
+
 
-    return "none"
+def clear_membership_cache(ctx, group_name, usernames):
+    """Clear cached memberships and roles after group memberships have changed.
+
+    :param ctx:        Combined type of a ctx and rei struct
+    :param group_name: Name of the group of which the members have changed
+    :param usernames:  Names of the users of which the memberships have changed
+    """
+    manager = group_membership_data_manager.GroupMembershipDataManager()
+    manager.clear_group(ctx, group_name)
+    for username in usernames:
+        manager.clear_user(ctx, str(user.from_str(ctx, username)))
 
 
 """API to get role of user in group."""
@@ -777,11 +782,11 @@ def provisionExternalUser(ctx, username, creatorUser, creatorZone):
     data['creator_zone'] = creatorZone
 
     try:
-        response = requests.post(url, data=jsonutil.dump(data),
-                                 headers={'X-Yoda-External-User-Secret':
-                                          eus_api_secret},
-                                 timeout=10,
-                                 verify=eus_api_tls_verify)
+        response = http_client.post('eus', url, data=jsonutil.dump(data),
+                                    headers={'X-Yoda-External-User-Secret':
+                                             eus_api_secret},
+                                    timeout=10,
+                                    verify=eus_api_tls_verify)
     except (requests.ConnectionError, requests.ConnectTimeout):
         return -1
 
@@ -845,11 +850,11 @@ def removeExternalUser(ctx, username, userzone):
     data['username'] = username
     data['userzone'] = userzone
 
-    response = requests.post(url, data=jsonutil.dump(data),
-                             headers={'X-Yoda-External-User-Secret':
-                                      eus_api_secret},
-                             timeout=10,
-                             verify=eus_api_tls_verify)
+    response = http_client.post('eus', url, data=jsonutil.dump(data),
+                                headers={'X-Yoda-External-User-Secret':
+                                         eus_api_secret},
+                                timeout=10,
+                                verify=eus_api_tls_verify)
 
     return str(response.status_code)
 
@@ -992,6 +997,7 @@ def group_create(ctx, group_name, category, subcategory, schema_id, expiration_d
         status = response[8]
         message = response[9]
         if status == '0':
+            clear_membership_cache(ctx, group_name, [user.full_name(ctx)])
             return api.Result.ok()
         elif status == '-1089000' or status == '-809000' or status == '-806000':
             return api.Error('group_exists', "Group {} not created, it already exists".format(group_name))
@@ -1021,6 +1027,8 @@ def api_group_update(ctx, group_name, property_name, property_value):
         status = response[3]
         message = response[4]
         if status == '0':
+            if property_name in ['category', 'schema_id']:
+                schema.clear_cache()
             return api.Result.ok()
         else:
             return api.Error('policy_error', message)
@@ -1042,12 +1050,16 @@ def api_group_delete(ctx, group_name):
         if config.enable_sram:
             sram_group, co_identifier = sram_enabled(ctx, group_name)
 
+        members = group_membership_data_manager.GroupMembershipDataManager().get_group_roles(ctx, group_name).keys()
+
         response = ctx.uuGroupRemove(group_name, '', '')['arguments']
         status = response[1]
         message = response[2]
         if status != '0':
             return api.Error('policy_error', message)
 
+        clear_membership_cache(ctx, group_name, members)
+
         if config.enable_sram and sram_group:
             if not sram.sram_delete_collaboration(ctx, co_identifier):
                 return api.Error('sram_error', 'Something went wrong deleting group "{}" in SRAM'.format(group_name))
@@ -1109,6 +1121,8 @@ def group_user_add(ctx, username, group_name):
         status = response[2]
         message = response[3]
         if status == '0':
+            clear_membership_cache(ctx, group_name, [username])
+
             # Send invitation mail for SRAM CO.
             if config.enable_sram and sram_group:
                 if config.sram_flow == 'join_request':
@@ -1154,6 +1168,7 @@ def group_user_update_role(ctx, username, group_name, new_role):
         status = response[3]
         message = response[4]
         if status == '0':
+            clear_membership_cache(ctx, group_name, [username])
             return api.Result.ok()
         else:
             return api.Error('policy_error', message)
@@ -1184,6 +1199,8 @@ def group_remove_user_from_group(ctx, username, group_name):
         if status != '0':
             return api.Error('policy_error', message)
 
+        clear_membership_cache(ctx, group_name, [username])
+
         if config.enable_sram and sram_group:
             uid = sram.sram_get_uid(ctx, co_identifier, username)
             if uid == '':
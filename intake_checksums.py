@@ -43,11 +43,8 @@ def intake_generate_dataset_checksums(ctx, dataset_path, checksum_file):
                                   "COLL_NAME like '{}/%'".format(dataset_path),
                                   genquery.AS_LIST, ctx)
 
-    # Create checksums file.
-    checksums = ""
-    for row in itertools.chain(q_root, q_sub):
-        type, checksum = chop_checksum(row[2])
-        checksums += "{} {} {} {}/{}\n".format(type, checksum, row[3], row[0], row[1])
-
     # Write checksums file.
-    data_object.write(ctx, checksum_file, checksums)
+    with data_object.open_stream(ctx, checksum_file, 'w') as stream:
+        for row in itertools.chain(q_root, q_sub):
+            type, checksum = chop_checksum(row[2])
+            stream.write("{} {} {} {}/{}\n".format(type, checksum, row[3], row[0], row[1]))
@@ -18,7 +18,7 @@ import folder
 import groups
 import meta
 import schema
-from util import avu, collection, config, constants, data_object, group, jsonutil, log, msi, resource, rule, user
+from util import avu, collection, config, constants, data_object, group, group_membership_data_manager, jsonutil, log, msi, resource, rule, user
 
 
 def _call_msvc_stat_vault(ctx, resc_name, data_path):
@@ -638,6 +638,21 @@ basic_integration_tests = [
     {"name":   "util.collection.to_from_id",
      "test": lambda ctx: collection.name_from_id(ctx, collection.id_from_name(ctx, "/tempZone/home/research-initial")),
      "check": lambda x: x == "/tempZone/home/research-initial"},
+    {"name":   "util.collection.data_stats.aggregate_matches_rows",
+     "test": lambda ctx: (collection._data_stats_aggregate(ctx, "/tempZone/home/research-initial"),
+                          collection._data_stats_rows(ctx, "/tempZone/home/research-initial")),
+     "check": lambda x: x[0] == x[1] and x[0][0] > 0},
+    {"name":   "util.collection.data_stats.aggregate_matches_rows_nonrecursive",
+     "test": lambda ctx: (collection._data_stats_aggregate(ctx, "/tempZone/home/research-initial/testdata", False),
+                          collection._data_stats_rows(ctx, "/tempZone/home/research-initial/testdata", False)),
+     "check": lambda x: x[0] == x[1] and x[0][0] > 0},
+    {"name":   "util.collection.collection_count.aggregate_matches_rows",
+     "test": lambda ctx: (collection._collection_count_aggregate(ctx, "/tempZone/home/research-initial"),
+                          collection._collection_count_rows(ctx, "/tempZone/home/research-initial")),
+     "check": lambda x: x[0] == x[1] and x[0] > 0},
+    {"name":   "util.collection.size.empty",
+     "test": lambda ctx: collection.size(ctx, "/tempZone/chewbacca"),
+     "check": lambda x: x == 0},
     {"name":   "util.data_object.exists.yes",
      "test": lambda ctx: data_object.exists(ctx, "/tempZone/home/research-initial/testdata/lorem.txt"),
      "check": lambda x: x},
@@ -702,6 +717,12 @@ basic_integration_tests = [
     {"name":   "util.group.members.doesnotexist",
      "test": lambda ctx: user.exists(ctx, "research-doesnotexist"),
      "check": lambda x: x is False},
+    {"name":   "util.group_membership_data_manager.group_roles",
+     "test": lambda ctx: group_membership_data_manager.GroupMembershipDataManager().get_group_roles(ctx, "research-initial"),
+     "check": lambda x: x.get("researcher#tempZone") == "normal" and x.get("groupmanager#tempZone") == "manager" and "datamanager#tempZone" not in x},
+    {"name":   "util.group_membership_data_manager.user_groups",
+     "test": lambda ctx: group_membership_data_manager.GroupMembershipDataManager().get_user_groups(ctx, "researcher#tempZone"),
+     "check": lambda x: "research-initial" in x and "datamanager-test-automation" not in x},
     {"name":   "util.resource.exists.yes",
      "test": lambda ctx: resource.exists(ctx, "irodsResc"),
      "check": lambda x: x},
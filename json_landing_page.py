@@ -4,6 +4,7 @@
 __copyright__ = 'Copyright (c) 2019-2024, Utrecht University'
 __license__   = 'GPLv3, see LICENSE'
 
+import time
 from datetime import datetime
 
 import jinja2
@@ -11,6 +12,44 @@ from dateutil import parser
 
 from util import *
 
+# Per-agent cache of compiled landing page templates.
+# Cached templates are revalidated against their checksum after config.template_cache_ttl seconds.
+_template_cache = {}  # template path -> (expiry time, fingerprint, compiled template)
+
+# Enable autoescaping for all templates.
+# NOTE: autoescape is no longer an extension starting in jinja 2.9 (2017).
+_environment = jinja2.Environment(autoescape=True, extensions=["jinja2.ext.autoescape"])
+
+
+def clear_cache():
+    """Clear the landing page template cache of this agent."""
+    _template_cache.clear()
+
+
+def get_template(ctx, path):
+    """Get a compiled landing page template, using the template cache of this agent.
+
+    :param ctx:  Combined type of a callback and rei struct
+    :param path: Path of template file
+
+    :returns: Compiled Jinja template
+    """
+    now = time.time()
+    cached = _template_cache.get(path)
+    if cached is not None and cached[0] > now:
+        return cached[2]
+
+    fingerprint = data_object.fingerprint(ctx, path)
+    if cached is not None and cached[1] == fingerprint:
+        template = cached[2]
+    else:
+        template = _environment.from_string(data_object.read(ctx, path))
+        # Add custom function to transform a persistent identifier to URI.
+        template.globals["persistent_identifier_to_uri"] = persistent_identifier_to_uri
+
+    _template_cache[path] = (now + config.template_cache_ttl, fingerprint, template)
+    return template
+
 
 def persistent_identifier_to_uri(identifier_scheme, identifier):
     """Transform a persistent identifier to URI.
@@ -64,19 +103,13 @@ def json_landing_page_create_json_landing_page(ctx, zone, template_name, combi_j
     # Remove empty objects to prevent empty fields on landingpage.
     json_data = misc.remove_empty_objects(json_data)
 
-    # Load the Jinja template.
-    landingpage_template_path = "/{}/yoda/templates/{}".format(zone, template_name)
-    template = data_object.read(ctx, landingpage_template_path)
-
-    # Enable autoescaping for all templates.
-    # NOTE: autoescape is no longer an extension starting in jinja 2.9 (2017).
-    Template = jinja2.Environment(autoescape=True, extensions=["jinja2.ext.autoescape"]).from_string
+    # Load the compiled Jinja template.
+    tm = get_template(ctx, "/{}/yoda/templates/{}".format(zone, template_name))
 
     # Pre work input for render process.
     # When empty landing page, take a short cut
     if template_name == "emptylandingpage.html.j2":
         persistent_identifier_datapackage = json_data["System"]["Persistent_Identifier_Datapackage"]
-        tm = Template(template)
         landing_page = tm.render(persistent_identifier_datapackage=persistent_identifier_datapackage)
         return landing_page
 
@@ -198,10 +231,6 @@ def json_landing_page_create_json_landing_page(ctx, zone, template_name, combi_j
     publication_date = parser.parse(json_data["System"]["Publication_Date"])
     publication_date = publication_date.strftime("%Y-%m-%d %H:%M:%S%z")
 
-    tm = Template(template)
-    # Add custom function to transform a persistent identifier to URI.
-    tm.globals["persistent_identifier_to_uri"] = persistent_identifier_to_uri
-
     # Render landingpage template.
     return tm.render(
         title=title,
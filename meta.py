@@ -6,7 +6,7 @@ __license__   = 'GPLv3, see LICENSE'
 
 import json
 import re
-from collections import OrderedDict
+from collections import deque, OrderedDict
 from datetime import datetime
 
 import genquery
@@ -87,61 +87,8 @@ def get_json_metadata_errors(callback,
     if metadata is None:
         metadata = jsonutil.read(callback, metadata_path)
 
-    # Perform validation and filter errors.
-    # Validation is handed to a Python 3 interpreter to validate with the Draft201909 validator.
-    # This can be removed when we can use Python 3 in the ruleset (iRODS 4.3.x).
-    # validator = jsonschema.Draft7Validator(schema)
-    #
-    # errors = validator.iter_errors(metadata)
-    #
-    # if ignore_required:
-    #     errors = filter(lambda e: e.validator not in ['required', 'dependencies'], errors)
-    #
-    # def transform_error(e):
-    #     """Turn a ValidationError into a data structure for the frontend."""
-    #     return {'message':     e.message,
-    #             'path':        list(e.path),
-    #             'schema_path': list(e.schema_path),
-    #             'validator':   e.validator}
-    #
-    # return map(transform_error, errors)
-
-    # Can't serialize OrderedDict, so transform to dicts.
-    schema = json.loads(json.dumps(schema))
-    metadata = json.loads(json.dumps(metadata))
-
-    # Create gateway to Python 3.8.
-    import execnet
-    gw = execnet.makegateway("popen//python=" + config.python3_interpreter)
-
-    channel = gw.remote_exec("""
-        import jsonschema
-        errors = []
-        while 1:
-            schema, metadata, ignore_required = channel.receive()
-            if schema is None:
-                break
-
-            # Perform validation and filter errors.
-            validator = jsonschema.Draft201909Validator(schema)
-            errors = validator.iter_errors(metadata)
-
-            if ignore_required:
-                errors = filter(lambda e: e.validator not in ['required', 'dependencies'], errors)
-
-            def transform_error(e):
-                return {'message':     e.message,
-                        'path':        list(e.path),
-                        'schema_path': list(e.schema_path),
-                        'validator':   e.validator}
-
-            errors = list(map(transform_error, errors))
-        channel.send(errors)
-    """)
-
-    channel.send((schema, metadata, ignore_required))
-    channel.send((None, None, None))
-    errors = channel.receive()
+    # Validation is handed to the persistent Python 3 validation workers of this agent.
+    errors = json_validator.validate(schema, metadata, ignore_required)
 
     # Log metadata errors.
     for error in errors:
@@ -202,19 +149,30 @@ def get_latest_vault_metadata_path(ctx, vault_pkg_coll):
 
     :returns: string -- Metadata JSON path
     """
-    name = None
-
     iter = genquery.row_iterator(
-        "DATA_NAME",
+        "COLL_NAME, DATA_NAME",
         "COLL_NAME = '{}' AND DATA_NAME like 'yoda-metadata[%].json'".format(vault_pkg_coll),
         genquery.AS_LIST, ctx)
 
-    for row in iter:
-        data_name = row[0]
+    return latest_vault_metadata_paths(iter).get(vault_pkg_coll)
+
+
+def latest_vault_metadata_paths(rows):
+    """
+    Determine the latest vault metadata JSON file of each vault package.
+
+    :param rows: Iterable of (collection name, data name) rows of vault metadata JSON files
+
+    :returns: Dictionary mapping vault package collection to its latest metadata JSON path
+    """
+    names = {}
+
+    for coll_name, data_name in rows:
+        name = names.get(coll_name)
         if name is None or (name < data_name and len(name) <= len(data_name)):
-            name = data_name
+            names[coll_name] = data_name
 
-    return None if name is None else '{}/{}'.format(vault_pkg_coll, name)
+    return {coll_name: '{}/{}'.format(coll_name, name) for coll_name, name in names.items()}
 
 
 rule_get_latest_vault_metadata_path = (
@@ -512,6 +470,87 @@ def update_index_metadata(ctx, path, metadata, creation_time, data_package):
         log.write(ctx, 'update_index_metadata: Metadata index update unsuccessful on path {}'.format(path))
 
 
+def update_retention_end_date(ctx, coll, metadata, creation_time):
+    """Store the retention end date of a vault package (YYYY-MM-DD), so that vault packages
+       with an ending retention period can be found with a query.
+
+    :param ctx:           Combined type of a callback and rei struct
+    :param coll:          Vault package collection
+    :param metadata:      Metadata of the vault package
+    :param creation_time: Creation time of the vault package, used if the deposit date is unknown
+
+    :returns: Retention end date, or None if it could not be determined
+    """
+    date_end_retention = None
+    try:
+        retention = int(metadata['Retention_Period'])
+    except (KeyError, TypeError, ValueError):
+        retention = None
+
+    if retention is not None:
+        # Get deposit date from action log, or fall back to the creation time of the vault package.
+        deposit_timestamp = None
+        iter = genquery.row_iterator(
+            "order_desc(META_COLL_MODIFY_TIME), META_COLL_ATTR_VALUE",
+            "COLL_NAME = '{}' AND META_COLL_ATTR_NAME = '{}'".format(coll, constants.UUORGMETADATAPREFIX + 'action_log'),
+            genquery.AS_LIST, ctx
+        )
+        for row in iter:
+            # row contains json encoded [str(int(time.time())), action, actor]
+            log_item_list = jsonutil.parse(row[1])
+            if log_item_list[1] == "submitted for vault":
+                deposit_timestamp = int(log_item_list[0])
+                break
+
+        if deposit_timestamp is None and creation_time != "":
+            deposit_timestamp = int(creation_time)
+
+        if deposit_timestamp is not None:
+            date_deposit = datetime.fromtimestamp(deposit_timestamp).date()
+            try:
+                date_end_retention = date_deposit.replace(year=date_deposit.year + retention)
+            except ValueError:
+                log.write(ctx, 'update_retention_end_date: Could not determine retention end date on path {}'.format(coll))
+
+    if date_end_retention is not None:
+        avu.set_on_coll(ctx, coll, constants.IIRETENTIONENDDATE, date_end_retention.strftime('%Y-%m-%d'), catch=True)
+    elif any(a.attr == constants.IIRETENTIONENDDATE for a in avu.of_coll(ctx, coll)):
+        # Retention period has been removed from the metadata.
+        avu.rmw_from_coll(ctx, coll, constants.IIRETENTIONENDDATE, '%', catch=True)
+
+    return date_end_retention
+
+
+def store_retention_end_date(ctx, coll):
+    """Store the retention end date of a vault package, based on its latest metadata file.
+
+    :param ctx:  Combined type of a callback and rei struct
+    :param coll: Vault package collection
+
+    :returns: Retention end date, or None if it could not be determined
+    """
+    metadata_path = get_latest_vault_metadata_path(ctx, coll)
+    if not metadata_path:
+        return None
+
+    try:
+        metadata = jsonutil.read(ctx, metadata_path)
+    except error.UUError:
+        log.write(ctx, 'store_retention_end_date: Could not read {} as JSON'.format(metadata_path))
+        return None
+
+    creation_time = ""
+    iter = genquery.row_iterator(
+        "COLL_CREATE_TIME",
+        "COLL_NAME = '{}'".format(coll),
+        genquery.AS_LIST, ctx
+    )
+    for row in iter:
+        creation_time = str(int(row[0]))
+
+    return update_retention_end_date(ctx, coll, metadata, creation_time)
+
+
 def ingest_metadata_vault(ctx, path):
     """Ingest (pre-validated) JSON metadata in the vault."""
     # The JSON metadata file has just landed in the vault, required validation /
@@ -548,6 +587,9 @@ def ingest_metadata_vault(ctx, path):
         for row in iter:
             data_package = row[0]
 
+    # Store retention end date for retention notifications.
+    update_retention_end_date(ctx, coll, metadata, creation_time)
+
     # Update flat index metadata for OpenSearch.
     if config.enable_open_search and group.exists(ctx, coll.split("/")[3].replace("vault-", "deposit-", 1)):
         update_index_metadata(ctx, coll + "/index", metadata, creation_time, data_package)
@@ -810,31 +852,103 @@ def vault_metadata_matches_schema(ctx, coll_name, schema_cache, report_name, wri
         log.write(ctx, "{} skips {}, because metadata could not be found.".format(report_name, coll_name), write_stdout)
         return None
 
-    try:
-        metadata = jsonutil.read(ctx, metadata_path)
-    except Exception as exc:
-        log.write(ctx, "{} skips {}, because of exception while reading metadata file {}: {}".format(report_name, coll_name, metadata_path, str(exc)), write_stdout)
-        log.write(ctx, "vault_metadata_matches_schema: Error while reading metadata file {} of data package {}: {}".format(metadata_path, coll_name, str(exc)), write_stdout)
-        return None
+    for _, result in vault_metadata_matches_schema_batch(ctx, [(coll_name, metadata_path)], schema_cache, report_name, write_stdout):
+        return result
 
-    # Determine schema
-    schema_id = schema_.get_schema_id(ctx, metadata_path)
-    schema_shortname = schema_id.split("/")[-2]
+    return None
 
-    # Retrieve schema and cache it for future use
-    schema_path = schema_.get_schema_path_by_id(ctx, metadata_path, schema_id)
-    if schema_shortname in schema_cache:
-        schema_contents = schema_cache[schema_shortname]
-    else:
-        schema_contents = jsonutil.read(ctx, schema_path)
-        schema_cache[schema_shortname] = schema_contents
-
-    # Check whether metadata matches schema and log any errors
-    error_list = get_json_metadata_errors(ctx, metadata_path, metadata=metadata, schema=schema_contents)
-    match_schema = len(error_list) == 0
-    if not match_schema:
-        errors_formatted = [meta_form.humanize_validation_error(e).encode('utf-8') for e in error_list]
-        log.write(ctx, "{}: metadata {} did not match schema {}: {}".format(report_name, metadata_path, schema_shortname, str(errors_formatted)), write_stdout)
-        log.write(ctx, "vault_metadata_matches_schema: Metadata {} of data package {} did not match the schema {}. Error list: {}".format(metadata_path, coll_name, schema_shortname, str(errors_formatted)), write_stdout)
-
-    return {"schema": schema_shortname, "match_schema": match_schema}
+
+def vault_metadata_matches_schema_batch(ctx, packages, schema_cache, report_name, write_stdout):
+    """Validate that the metadata of a stream of data packages conforms to their schemas.
+
+    All packages are validated by the same validation workers, which compile each schema only once.
+    Results are produced incrementally, in the order of the packages. Packages whose metadata
+    or schema cannot be read or validated, or whose result cannot be processed, are logged
+    and skipped.
+
+    :param ctx:          Combined type of a callback and rei struct
+    :param packages:     Iterable of (data package collection path, metadata JSON path) tuples
+    :param schema_cache: Dictionary storing schema blueprints, can be empty.
+    :param report_name:  Name of report script (for logging)
+    :param write_stdout: A boolean representing whether to write to stdout or rodsLog
+
+    :yields:             (collection path, result) tuples, where result is a dictionary containing
+                         if schema matches and the schema short name.
+    """
+    # Packages submitted for validation, in order:
+    # (collection, metadata path, schema short name, schema, metadata).
+    submitted = deque()
+    # Packages to submit again after a failure of the validation workers.
+    resubmit = deque()
+    packages = iter(packages)
+
+    def documents():
+        while len(resubmit) > 0:
+            package = resubmit.popleft()
+            submitted.append(package)
+            yield package[3], package[4], False
+
+        for coll_name, metadata_path in packages:
+            try:
+                metadata = jsonutil.read(ctx, metadata_path)
+            except Exception as exc:
+                log.write(ctx, "{} skips {}, because of exception while reading metadata file {}: {}".format(report_name, coll_name, metadata_path, str(exc)), write_stdout)
+                log.write(ctx, "vault_metadata_matches_schema: Error while reading metadata file {} of data package {}: {}".format(metadata_path, coll_name, str(exc)), write_stdout)
+                continue
+
+            try:
+                # Determine schema
+                schema_id = schema_.get_schema_id(ctx, metadata_path, metadata=metadata)
+                schema_shortname = schema_id.split("/")[-2]
+
+                # Retrieve schema and cache it for future use
+                if schema_shortname in schema_cache:
+                    schema_contents = schema_cache[schema_shortname]
+                else:
+                    schema_path = schema_.get_schema_path_by_id(ctx, metadata_path, schema_id)
+                    schema_contents = jsonutil.read(ctx, schema_path)
+                    schema_cache[schema_shortname] = schema_contents
+            except Exception as exc:
+                log.write(ctx, "{} skips {}, because of exception while determining schema of metadata file {}: {}".format(report_name, coll_name, metadata_path, str(exc)), write_stdout)
+                continue
+
+            submitted.append((coll_name, metadata_path, schema_shortname, schema_contents, metadata))
+            yield schema_contents, metadata, False
+
+    results = json_validator.validate_many(documents())
+    while True:
+        try:
+            error_list = next(results)
+        except StopIteration:
+            break
+        except Exception as exc:
+            # The validation workers failed on the oldest pending package, even after a restart.
+            # Skip that package and submit the other pending packages again.
+            if len(submitted) == 0:
+                log.write(ctx, "{} stopped, because of exception while validating metadata: {}".format(report_name, str(exc)), write_stdout)
+                return
+            coll_name, metadata_path = submitted.popleft()[:2]
+            log.write(ctx, "{} skips {}, because of exception while validating metadata file {}: {}".format(report_name, coll_name, metadata_path, str(exc)), write_stdout)
+            resubmit.extend(submitted)
+            submitted.clear()
+            results = json_validator.validate_many(documents())
+            continue
+
+        coll_name, metadata_path, schema_shortname = submitted.popleft()[:3]
+
+        if isinstance(error_list, error.UUJsonValidationError):
+            log.write(ctx, "{} skips {}, because metadata file {} could not be validated against schema {}: {}".format(report_name, coll_name, metadata_path, schema_shortname, str(error_list)), write_stdout)
+            continue
+
+        try:
+            # Check whether metadata matches schema and log any errors
+            match_schema = len(error_list) == 0
+            if not match_schema:
+                errors_formatted = [meta_form.humanize_validation_error(e).encode('utf-8') for e in error_list]
+                log.write(ctx, "{}: metadata {} did not match schema {}: {}".format(report_name, metadata_path, schema_shortname, str(errors_formatted)), write_stdout)
+                log.write(ctx, "vault_metadata_matches_schema: Metadata {} of data package {} did not match the schema {}. Error list: {}".format(metadata_path, coll_name, schema_shortname, str(errors_formatted)), write_stdout)
+        except Exception as exc:
+            log.write(ctx, "{} skips {}, because of exception while processing validation result of metadata file {}: {}".format(report_name, coll_name, metadata_path, str(exc)), write_stdout)
+            continue
+
+        yield coll_name, {"schema": schema_shortname, "match_schema": match_schema}
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 """Functions for user notifications."""
 
-__copyright__ = 'Copyright (c) 2021-2023, Utrecht University'
+__copyright__ = 'Copyright (c) 2021-2024, Utrecht University'
 __license__   = 'GPLv3, see LICENSE'
 
 
@@ -28,12 +28,19 @@ __all__ = ['api_notifications_load',
            'api_notifications_dismiss_all',
            'rule_mail_notification_report',
            'rule_process_ending_retention_packages',
+           'rule_process_retention_end_dates',
            'rule_process_groups_expiration_date',
            'rule_process_inactive_research_groups',
            'rule_process_data_access_token_expiry']
 
 NOTIFICATION_KEY = constants.UUORGMETADATAPREFIX + "notification"
 
+NOTIFICATIONS_LOAD_LIMIT = 500
+"""Maximum number of notifications that are loaded at once"""
+
+NOTIFICATIONS_QUERY_CHUNK_SIZE = 20
+"""Maximum number of collections per query for additional notification information"""
+
 
 def generate_random_id(ctx):
     """Generate random ID for notification."""
@@ -64,24 +71,37 @@ def set(ctx, actor, receiver, target, message):
 
 
 @api.make()
-def api_notifications_load(ctx, sort_order="desc"):
+def api_notifications_load(ctx, sort_order="desc", offset=0, limit=NOTIFICATIONS_LOAD_LIMIT):
     """Load user notifications.
 
     :param ctx:        Combined type of a callback and rei struct
     :param sort_order: Sort order of notifications on timestamp ("asc" or "desc", default "desc")
+    :param offset:     Offset of the first notification to return (default 0, negative values are treated as 0)
+    :param limit:      Maximum number of notifications to return (0 to NOTIFICATIONS_LOAD_LIMIT)
 
-    :returns: Dict with all notifications
+    :returns: List of notifications
     """
-    results = [v for v
-               in Query(ctx, "META_USER_ATTR_VALUE",
-                             "USER_NAME = '{}' AND USER_TYPE != 'rodsgroup' AND META_USER_ATTR_NAME like '{}_%%'".format(user.name(ctx), NOTIFICATION_KEY))]
-
     notifications = []
-    for result in results:
+    for result in Query(ctx, "META_USER_ATTR_VALUE",
+                        "USER_NAME = '{}' AND USER_TYPE != 'rodsgroup' AND META_USER_ATTR_NAME like '{}_%%'".format(user.name(ctx), NOTIFICATION_KEY)):
         try:
             notification = jsonutil.parse(result)
             notification["datetime"] = (datetime.fromtimestamp(notification["timestamp"])).strftime('%Y-%m-%d %H:%M')
-            notification["actor"] = user.from_str(ctx, notification["actor"])[0]
+            notifications.append(notification)
+        except Exception:
+            continue
+
+    # Sort notifications on timestamp, and only retrieve additional information for the requested page.
+    notifications.sort(key=lambda k: k['timestamp'], reverse=(sort_order != "asc"))
+    offset = max(0, int(offset))
+    limit = max(0, min(int(limit), NOTIFICATIONS_LOAD_LIMIT))
+    notifications = notifications[offset:offset + limit]
+
+    results = []
+    deposits = []
+    for notification in notifications:
+        try:
+            notification["actor"] = notification["actor"].split('#')[0]
 
             # Get data package and link from target path for research and vault packages.
             space, _, group, subpath = pathutil.info(notification["target"])
@@ -94,54 +114,77 @@ def api_notifications_load(ctx, sort_order="desc"):
 
                 # Deposit situation required different information to be presented.
                 if subpath.startswith('deposit-'):
-                    data_package_reference = ""
-                    iter = genquery.row_iterator(
-                        "META_COLL_ATTR_VALUE",
-                        "COLL_NAME = '{}' AND META_COLL_ATTR_NAME = '{}'".format(notification["target"], constants.DATA_PACKAGE_REFERENCE),
-                        genquery.AS_LIST, ctx
-                    )
-
-                    for row in iter:
-                        data_package_reference = row[0]
-
-                    deposit_title = '(no title)'
-                    iter = genquery.row_iterator(
-                        "META_COLL_ATTR_VALUE",
-                        "COLL_NAME = '{}' AND META_COLL_ATTR_NAME = 'Title'".format(notification["target"]),
-                        genquery.AS_LIST, ctx
-                    )
-                    for row in iter:
-                        deposit_title = row[0]
-
-                    notification["data_package"] = deposit_title
-                    notification["link"] = "/vault/yoda/{}".format(data_package_reference)
-
-                    # Find real actor when
-                    if notification["actor"] == 'system':
-                        # Get actor from action log on action = "submitted for vault"
-                        iter2 = genquery.row_iterator(
-                            "order_desc(META_COLL_MODIFY_TIME), META_COLL_ATTR_VALUE",
-                            "COLL_NAME = '" + notification["target"] + "' AND META_COLL_ATTR_NAME = '" + constants.UUORGMETADATAPREFIX + 'action_log' + "'",
-                            genquery.AS_LIST, ctx
-                        )
-                        for row2 in iter2:
-                            # row2 contains json encoded [str(int(time.time())), action, actor]
-                            log_item_list = jsonutil.parse(row2[1])
-                            if log_item_list[1] == "submitted for vault":
-                                notification["actor"] = log_item_list[2].split('#')[0]
-                                break
+                    deposits.append(notification)
             elif notification["target"] != "":
                 notification["link"] = notification["target"]
 
-            notifications.append(notification)
+            results.append(notification)
         except Exception:
             continue
 
-    # Return notifications sorted on timestamp
-    if sort_order == "asc":
-        return sorted(notifications, key=lambda k: k['timestamp'], reverse=False)
-    else:
-        return sorted(notifications, key=lambda k: k['timestamp'], reverse=True)
+    if deposits:
+        try:
+            references, titles, submitters = get_deposit_information(ctx, [notification["target"] for notification in deposits])
+        except Exception:
+            references, titles, submitters = {}, {}, {}
+
+        for notification in deposits:
+            notification["data_package"] = titles.get(notification["target"], '(no title)')
+            notification["link"] = "/vault/yoda/{}".format(references.get(notification["target"], ""))
+
+            # Find real actor when notification was sent by the system.
+            if notification["actor"] == 'system' and notification["target"] in submitters:
+                notification["actor"] = submitters[notification["target"]]
+
+    return results
+
+
+def get_deposit_information(ctx, paths):
+    """Get data package references, titles and submitters of deposit vault packages.
+
+    :param ctx:   Combined type of a callback and rei struct
+    :param paths: List of vault package paths
+
+    :returns: 3-tuple of dicts of vault package path to data package reference, title and submitter
+    """
+    references = {}
+    titles = {}
+    submitters = {}
+    paths = sorted(frozenset(paths))
+
+    for i in range(0, len(paths), NOTIFICATIONS_QUERY_CHUNK_SIZE):
+        coll_names = ", ".join("'{}'".format(path) for path in paths[i:i + NOTIFICATIONS_QUERY_CHUNK_SIZE])
+
+        iter = genquery.row_iterator(
+            "COLL_NAME, META_COLL_ATTR_NAME, META_COLL_ATTR_VALUE",
+            "COLL_NAME in ({}) AND META_COLL_ATTR_NAME in ('{}', 'Title')".format(coll_names, constants.DATA_PACKAGE_REFERENCE),
+            genquery.AS_LIST, ctx
+        )
+        for row in iter:
+            if row[1] == constants.DATA_PACKAGE_REFERENCE:
+                references[row[0]] = row[2]
+            else:
+                titles[row[0]] = row[2]
+
+        # Get actor from action log on action = "submitted for vault".
+        iter = genquery.row_iterator(
+            "order_desc(META_COLL_MODIFY_TIME), COLL_NAME, META_COLL_ATTR_VALUE",
+            "COLL_NAME in ({}) AND META_COLL_ATTR_NAME = '{}'".format(coll_names, constants.UUORGMETADATAPREFIX + 'action_log'),
+            genquery.AS_LIST, ctx
+        )
+        for row in iter:
+            if row[1] in submitters:
+                continue
+
+            # row contains json encoded [str(int(time.time())), action, actor]
+            try:
+                log_item_list = jsonutil.parse(row[2])
+                if log_item_list[1] == "submitted for vault":
+                    submitters[row[1]] = log_item_list[2].split('#')[0]
+            except (jsonutil.ParseError, IndexError):
+                continue
+
+    return references, titles, submitters
 
 
 @api.make()
@@ -219,73 +262,53 @@ def rule_process_ending_retention_packages(ctx):
     zone = user.zone(ctx)
     errors = 0
     dp_notify_count = 0
+    today = datetime.now().date()
 
-    # Retrieve all data packages in this vault.
+    # Datamanagers per category and categories per vault group, to look these up only once.
+    datamanagers_per_category = {}
+    category_per_vault_group = {}
+
+    # Retrieve all data packages with a retention end date ranging from a year ago until two months from now.
+    # Retention end dates are stored in YYYY-MM-DD format on vault ingest, so they can be compared as strings.
     iter = genquery.row_iterator(
-        "COLL_NAME",
-        "META_COLL_ATTR_NAME = 'org_vault_status' AND COLL_NAME not like '%/original'",
+        "COLL_NAME, META_COLL_ATTR_VALUE",
+        "META_COLL_ATTR_NAME = '{}' AND META_COLL_ATTR_VALUE >= '{}' AND META_COLL_ATTR_VALUE <= '{}'".format(
+            constants.IIRETENTIONENDDATE,
+            (today - relativedelta.relativedelta(years=1)).strftime('%Y-%m-%d'),
+            (today + relativedelta.relativedelta(months=2)).strftime('%Y-%m-%d')),
         genquery.AS_LIST, ctx
     )
     for row in iter:
         dp_coll = row[0]
-        meta_path = meta.get_latest_vault_metadata_path(ctx, dp_coll)
-
-        # Try to load the metadata file.
-        try:
-            metadata = jsonutil.read(ctx, meta_path)
-            current_schema_id = meta.metadata_get_schema_id(metadata)
-            if current_schema_id is None:
-                log.write(ctx, 'retention - Schema id missing - Please check the structure of this file. <{}>'.format(dp_coll))
-                errors += 1
-                continue
-        except jsonutil.ParseError:
-            log.write(ctx, 'retention - JSON invalid - Please check the structure of this file. <{}>'.format(dp_coll))
-            errors += 1
-            continue
-        except msi.Error as e:
-            log.write(ctx, 'retention - The metadata file could not be read. ({}) <{}>'.format(e, dp_coll))
-            errors += 1
-            continue
-
-        # Get deposit date and end preservation date based upon retention period.
-        iter2 = genquery.row_iterator(
-            "order_desc(META_COLL_MODIFY_TIME), META_COLL_ATTR_VALUE",
-            "COLL_NAME = '" + dp_coll + "' AND META_COLL_ATTR_NAME = '" + constants.UUORGMETADATAPREFIX + 'action_log' + "'",
-            genquery.AS_LIST, ctx
-        )
-        for row2 in iter2:
-            # row2 contains json encoded [str(int(time.time())), action, actor]
-            log_item_list = jsonutil.parse(row2[1])
-            if log_item_list[1] == "submitted for vault":
-                deposit_timestamp = datetime.fromtimestamp(int(log_item_list[0]))
-                date_deposit = deposit_timestamp.date()
-                break
-
         try:
-            retention = int(metadata['Retention_Period'])
-        except KeyError:
-            log.write(ctx, 'retention - No retention period set in metadata. <{}>'.format(dp_coll))
-            continue
-
-        try:
-            date_end_retention = date_deposit.replace(year=date_deposit.year + retention)
+            date_end_retention = datetime.strptime(row[1], '%Y-%m-%d').date()
         except ValueError:
-            log.write(ctx, 'retention - Could not determine retention end date. Retention period: <{}>'.format(retention))
+            log.write(ctx, 'retention - Invalid retention end date {}. <{}>'.format(row[1], dp_coll))
+            errors += 1
             continue
 
-        r = relativedelta.relativedelta(date_end_retention, datetime.now().date())
+        r = relativedelta.relativedelta(date_end_retention, today)
         formatted_date = date_end_retention.strftime('%Y-%m-%d')
 
-        log.write(ctx, 'retention - Retention period ({} years) ending in {} years, {} months and {} days ({}): <{}>'.format(retention, r.years, r.months, r.days, formatted_date, dp_coll))
+        log.write(ctx, 'retention - Retention period ending in {} years, {} months and {} days ({}): <{}>'.format(r.years, r.months, r.days, formatted_date, dp_coll))
         if r.years == 0 and r.months <= 1:
-            group_name = folder.collection_group_name(ctx, dp_coll)
-            category = group.get_category(ctx, group_name)
-            datamanager_group_name = "datamanager-" + category
-
-            if group.exists(ctx, datamanager_group_name):
+            vault_group_name = pathutil.info(dp_coll).group
+            if vault_group_name not in category_per_vault_group:
+                group_name = folder.collection_group_name(ctx, dp_coll)
+                category_per_vault_group[vault_group_name] = group.get_category(ctx, group_name)
+            category = category_per_vault_group[vault_group_name]
+
+            if category not in datamanagers_per_category:
+                datamanager_group_name = "datamanager-" + category
+                if group.exists(ctx, datamanager_group_name):
+                    datamanagers_per_category[category] = folder.get_datamanagers(ctx, '/{}/home/'.format(zone) + datamanager_group_name)
+                else:
+                    datamanagers_per_category[category] = None
+            datamanagers = datamanagers_per_category[category]
+
+            if datamanagers is not None:
                 dp_notify_count += 1
                 # Send notifications to datamanager(s).
-                datamanagers = folder.get_datamanagers(ctx, '/{}/home/'.format(zone) + datamanager_group_name)
                 message = "Data package reaching end of preservation date: {}".format(formatted_date)
                 for datamanager in datamanagers:
                     datamanager = '{}#{}'.format(*datamanager)
@@ -296,6 +319,53 @@ def rule_process_ending_retention_packages(ctx):
     log.write(ctx, 'retention - Finished checking vault packages for ending retention | notified: {} | errors: {}'.format(dp_notify_count, errors))
 
 
+@rule.make()
+def rule_process_retention_end_dates(ctx):
+    """Rule interface for storing the retention end date of all vault packages.
+
+    Retention end dates are stored on vault ingest of metadata. This rule stores them
+    for vault packages that have been ingested before retention end dates were stored.
+
+    :param ctx: Combined type of a callback and rei struct
+    """
+    # check permissions - rodsadmin only
+    if user.user_type(ctx) != 'rodsadmin':
+        log.write(ctx, "retention - Insufficient permissions - should only be called by rodsadmin")
+        return
+
+    log.write(ctx, 'retention - Storing retention end dates of vault packages')
+
+    count = 0
+    errors = 0
+
+    # Retrieve all data packages in this vault.
+    iter = genquery.row_iterator(
+        "COLL_NAME, COLL_CREATE_TIME",
+        "META_COLL_ATTR_NAME = 'org_vault_status' AND COLL_NAME not like '%/original'",
+        genquery.AS_LIST, ctx
+    )
+    for row in iter:
+        dp_coll = row[0]
+        meta_path = meta.get_latest_vault_metadata_path(ctx, dp_coll)
+
+        # Try to load the metadata file.
+        try:
+            metadata = jsonutil.read(ctx, meta_path)
+        except jsonutil.ParseError:
+            log.write(ctx, 'retention - JSON invalid - Please check the structure of this file. <{}>'.format(dp_coll))
+            errors += 1
+            continue
+        except msi.Error as e:
+            log.write(ctx, 'retention - The metadata file could not be read. ({}) <{}>'.format(e, dp_coll))
+            errors += 1
+            continue
+
+        if meta.update_retention_end_date(ctx, dp_coll, metadata, str(int(row[1]))) is not None:
+            count += 1
+
+    log.write(ctx, 'retention - Finished storing retention end dates of vault packages | stored: {} | errors: {}'.format(count, errors))
+
+
 @rule.make()
 def rule_process_groups_expiration_date(ctx):
     """Rule interface for checking research groups for reaching group expiration date.
@@ -368,7 +438,26 @@ def rule_process_inactive_research_groups(ctx):
     inactivity_cutoff = datetime.now() - timedelta(weeks=4.35 * config.inactivity_cutoff_months)
     inactivity_cutoff_epoch = int((inactivity_cutoff - datetime(1970, 1, 1)).total_seconds())
 
-    # First query: obtain a list of groups with group attributes
+    # Latest modification time of data objects in research space per research group that has access to them.
+    last_modified = {}
+    iter = genquery.row_iterator(
+        "USER_GROUP_NAME, MAX(DATA_MODIFY_TIME)",
+        "COLL_NAME like '/{}/home/research-%' AND USER_GROUP_NAME like 'research-%'".format(zone),
+        genquery.AS_LIST, ctx
+    )
+    for row in iter:
+        last_modified[row[0]] = int(row[1])
+
+    # Modification time of research group collections, for empty research groups.
+    coll_modified = {}
+    iter = genquery.row_iterator(
+        "COLL_NAME, COLL_MODIFY_TIME",
+        "COLL_PARENT_NAME = '/{}/home' AND COLL_NAME like '/{}/home/research-%'".format(zone, zone),
+        genquery.AS_LIST, ctx
+    )
+    for row in iter:
+        coll_modified[row[0]] = int(row[1])
+
     iter = genquery.row_iterator(
         "USER_GROUP_NAME",
         "USER_TYPE = 'rodsgroup' AND USER_GROUP_NAME like 'research-%'",
@@ -378,67 +467,13 @@ def rule_process_inactive_research_groups(ctx):
     for row in iter:
         group_name = row[0]
         coll = '/{}/home/{}'.format(zone, group_name)
-        # Trigger this flag if there are any files that have been modified after the cut off
-        # If the flag is still false after going through all the files, then that is when we send the notification
-        recent_files_modified = False
-        data_objects_count = 0
-        where_clause = {
-            'self': "COLL_NAME = '{}' AND USER_GROUP_NAME = '{}'".format(coll, group_name),
-            'subfolders': "COLL_NAME LIKE '{}/%' AND USER_GROUP_NAME = '{}'".format(coll, group_name)
-        }
-
-        # Per group two statements are required to gather all data
-        # 1) data in folder itself
-        # 2) data in all subfolders of the folder
-        for folder_type in ['self', 'subfolders']:
-            iter_subcoll = genquery.row_iterator(
-                "COUNT(DATA_NAME)",
-                where_clause[folder_type],
-                genquery.AS_LIST, ctx
-            )
-            # This loop should only run once
-            for sub_row in iter_subcoll:
-                data_objects_count += int(sub_row[0])
-
-        if data_objects_count > 0:
-            for folder_type in ['self', 'subfolders']:
-                if recent_files_modified:
-                    break
-
-                iter_subcoll = genquery.row_iterator(
-                    "DATA_NAME, COLL_NAME",
-                    where_clause[folder_type],
-                    genquery.AS_LIST, ctx
-                )
-
-                for sub_row in iter_subcoll:
-                    if recent_files_modified:
-                        break
-
-                    sub_coll = sub_row[1]
-
-                    # Get count of any data objects that have been modified after the inactivity cut off
-                    iter_recent_data = genquery.row_iterator(
-                        "COUNT(DATA_NAME)",
-                        "COLL_NAME = '{}' AND USER_GROUP_NAME = '{}' AND DATA_MODIFY_TIME n> '{}'".format(sub_coll, group_name, inactivity_cutoff_epoch),
-                        genquery.AS_LIST, ctx
-                    )
-
-                    # This loop should only run once
-                    for count_row in iter_recent_data:
-                        if int(count_row[0]) > 0:
-                            recent_files_modified = True
+
+        if group_name in last_modified:
+            # Check whether any data objects have been modified after the cut off.
+            recent_files_modified = last_modified[group_name] > inactivity_cutoff_epoch
         else:
-            # Empty research group, so check the modified date of the collection, then send a notification
-            iter_data = genquery.row_iterator(
-                "COLL_MODIFY_TIME",
-                "COLL_NAME = '{}'".format(coll),
-                genquery.AS_LIST, ctx
-            )
-            # This loop should only run once
-            for sub_row in iter_data:
-                if int(sub_row[0]) > inactivity_cutoff_epoch:
-                    recent_files_modified = True
+            # Empty research group, so check the modified date of the collection.
+            recent_files_modified = coll_modified.get(coll, 0) > inactivity_cutoff_epoch
 
         if not recent_files_modified:
             # find corresponding datamanager
@@ -463,17 +498,22 @@ def rule_process_inactive_research_groups(ctx):
 def rule_process_data_access_token_expiry(ctx):
     """Rule interface for checking for data access tokens that are expiring soon.
 
+    Expired tokens of all users are removed as well.
+
     :param ctx: Combined type of a callback and rei struct
     """
-    # Only send notifications if expiration notifications are enabled.
-    if config.token_expiration_notification == 0:
-        return
-
     # check permissions - rodsadmin only
     if user.user_type(ctx) != 'rodsadmin':
         log.write(ctx, "data access token - Insufficient permissions - should only be called by rodsadmin")
         return
 
+    deleted = data_access_token.delete_all_expired_tokens(ctx)
+    log.write(ctx, 'data access token - Removed {} expired data access tokens'.format(deleted))
+
+    # Only send notifications if expiration notifications are enabled.
+    if config.token_expiration_notification == 0:
+        return
+
     log.write(ctx, 'data access token - Checking for expiring data access tokens')
     tokens = data_access_token.get_all_tokens(ctx)
     for token in tokens:
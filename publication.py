@@ -4,8 +4,13 @@
 __copyright__ = 'Copyright (c) 2019-2024, Utrecht University'
 __license__   = 'GPLv3, see LICENSE'
 
+import hashlib
 import re
+import time
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
 
 import genquery
 from requests.exceptions import ReadTimeout
@@ -132,7 +137,7 @@ def generate_system_json(ctx, publication_state):
         }
     }
 
-    data_object.write(ctx, system_json_path, jsonutil.dump(system_json_data))
+    jsonutil.write(ctx, system_json_path, system_json_data)
     publication_state["combiJsonPath"] = system_json_path
 
 
@@ -240,9 +245,11 @@ def set_update_publication_state(ctx, vault_package):
     # Generate new landingpage
     publication_state["landingPagePath"] = ""
     publication_state["landingPageUploaded"] = ""
+    publication_state["baseLandingPageUploaded"] = ""
 
     # Update OAI-PMH metadata
     publication_state["oaiUploaded"] = ""
+    publication_state["baseOaiUploaded"] = ""
 
     # Update anonymous access
     publication_state["anonymousAccess"] = ""
@@ -349,7 +356,7 @@ def generate_datacite_json(ctx, publication_state):
     # Based on content of *combiJsonPath, get DataciteJson as string
     datacite_json = json_datacite.json_datacite_create_datacite_json(ctx, publication_state["landingPageUrl"], combiJsonPath)
 
-    data_object.write(ctx, datacite_json_path, jsonutil.dump(datacite_json))
+    jsonutil.write(ctx, datacite_json_path, datacite_json)
 
     publication_state["dataCiteJsonPath"] = datacite_json_path
 
@@ -363,31 +370,58 @@ def post_metadata_to_datacite(ctx, publication_state, doi, send_method, base_doi
     :param send_method:        http verb (either 'post' or 'put')
     :param base_doi:           Indicates if we are sending metadata for base DOI
     """
-    datacite_json_path = publication_state["dataCiteJsonPath"]
-    datacite_json = data_object.read(ctx, datacite_json_path)
-
-    if base_doi:
-        datacite_json = datacite_json.replace(publication_state['versionDOI'], doi)
+    datacite_json = get_datacite_payload(ctx, publication_state, doi, base_doi)
 
     try:
         if send_method == 'post':
             httpCode = datacite.metadata_post(ctx, datacite_json)
         else:
             httpCode = datacite.metadata_put(ctx, doi, datacite_json)
-
-        if (send_method == 'post' and httpCode == 201) or (send_method == 'put' and httpCode == 200):
-            publication_state["dataCiteMetadataPosted"] = "yes"
-        elif httpCode in [401, 403, 500, 503, 504]:
-            # Unauthorized, Forbidden, Precondition failed, Internal Server Error
-            log.write(ctx, "post_metadata_to_datacite: httpCode " + str(httpCode) + " received. Will be retried later")
-            publication_state["status"] = "Retry"
-        else:
-            log.write(ctx, "post_metadata_to_datacite: httpCode " + str(httpCode) + " received. Unrecoverable error.")
-            publication_state["status"] = "Unrecoverable"
     except ReadTimeout:
+        httpCode = None
+
+    process_datacite_response(ctx, publication_state, send_method, httpCode)
+
+
+def get_datacite_payload(ctx, publication_state, doi, base_doi=False):
+    """Read the DataCite JSON to upload to DataCite for a DOI.
+
+    :param ctx:                Combined type of a callback and rei struct
+    :param publication_state:  Dict with state of the publication process
+    :param doi:                DataCite DOI to update metadata
+    :param base_doi:           Indicates if we are sending metadata for base DOI
+
+    :returns: DataCite JSON, as a string
+    """
+    datacite_json = data_object.read(ctx, publication_state["dataCiteJsonPath"])
+
+    if base_doi:
+        datacite_json = datacite_json.replace(publication_state['versionDOI'], doi)
+
+    return datacite_json
+
+
+def process_datacite_response(ctx, publication_state, send_method, httpCode):
+    """Update the publication state with the response of DataCite to an upload of DataCite JSON.
+
+    :param ctx:                Combined type of a callback and rei struct
+    :param publication_state:  Dict with state of the publication process
+    :param send_method:        http verb (either 'post' or 'put')
+    :param httpCode:           HTTP status code of the response, or None if DataCite timed out
+    """
+    if httpCode is None:
         # DataCite timeout.
         log.write(ctx, "post_metadata_to_datacite: timeout received. Will be retried later")
         publication_state["status"] = "Retry"
+    elif (send_method == 'post' and httpCode == 201) or (send_method == 'put' and httpCode == 200):
+        publication_state["dataCiteMetadataPosted"] = "yes"
+    elif httpCode in [401, 403, 500, 503, 504]:
+        # Unauthorized, Forbidden, Precondition failed, Internal Server Error
+        log.write(ctx, "post_metadata_to_datacite: httpCode " + str(httpCode) + " received. Will be retried later")
+        publication_state["status"] = "Retry"
+    else:
+        log.write(ctx, "post_metadata_to_datacite: httpCode " + str(httpCode) + " received. Unrecoverable error.")
+        publication_state["status"] = "Unrecoverable"
 
 
 def post_draft_doi_to_datacite(ctx, publication_state):
@@ -541,53 +575,76 @@ def generate_landing_page(ctx, publication_state, publish):
     publication_state["landingPagePath"] = landing_page_path
 
 
-def copy_landingpage_to_public_host(ctx, random_id, publication_config, publication_state):
-    """Copy the resulting landing page to configured public host.
+# Files of a publication that are uploaded to the public host, by the publication state key that
+# records their upload: (state key of the path, state key of the random ID, destination directory, extension).
+PUBLICATION_UPLOADS = {
+    "landingPageUploaded":     ("landingPagePath", "randomId", "/var/www/landingpages/", ".html"),
+    "baseLandingPageUploaded": ("landingPagePath", "baseRandomId", "/var/www/landingpages/", ".html"),
+    "oaiUploaded":             ("combiJsonPath", "randomId", "/var/www/moai/metadata/", ".json"),
+    "baseOaiUploaded":         ("combiJsonPath", "baseRandomId", "/var/www/moai/metadata/", ".json")
+}
 
-    :param ctx:                Combined type of a callback and rei struct
-    :param random_id:          Random ID part of DOI used for landingpage file
-    :param publication_config: Dict with publication configuration
-    :param publication_state:  Dict with state of the publication process
+
+def publication_uploads(update_base_doi, landing_page=True, moai=True):
+    """Determine the files of a publication to upload to the public host.
+
+    :param update_base_doi: Whether the files of the base DOI are uploaded as well
+    :param landing_page:    Whether the landing page is uploaded
+    :param moai:            Whether the combi JSON is uploaded to MOAI
+
+    :returns: List of publication state keys of the files to upload (see PUBLICATION_UPLOADS)
     """
-    publicHost = publication_config["publicHost"]
-    landingPagePath = publication_state["landingPagePath"]
-    yodaInstance = publication_config["yodaInstance"]
-    yodaPrefix = publication_config["yodaPrefix"]
-    publicPath = yodaInstance + "/" + yodaPrefix + "/" + random_id + ".html"
+    uploads = []
+    if landing_page:
+        uploads.append("landingPageUploaded")
+        if update_base_doi:
+            uploads.append("baseLandingPageUploaded")
+    if moai:
+        uploads.append("oaiUploaded")
+        if update_base_doi:
+            uploads.append("baseOaiUploaded")
+    return uploads
 
-    argv = publicHost + " inbox /var/www/landingpages/" + publicPath
 
-    copy_result = ctx.iiGenericSecureCopy(argv, landingPagePath, '')
-    error = copy_result['arguments'][2]
-    if int(error) >= 0:
-        publication_state["landingPageUploaded"] = "yes"
-    else:
-        publication_state["status"] = "Retry"
-        log.write(ctx, "copy_landingpage_to_public: " + error)
+def pending_publication_uploads(publication_state, uploads):
+    """Determine which files of a publication have not been uploaded to the public host yet.
 
+    :param publication_state: Dict with state of the publication process
+    :param uploads:           List of publication state keys of the files to upload
+
+    :returns: List of publication state keys of the files that have not been uploaded
+    """
+    return [key for key in uploads if publication_state.get(key) != "yes"]
+
+
+def sync_publication_files(ctx, publication_config, publication_state, uploads):
+    """Upload the pending files of a publication to the public host (landing pages and MOAI).
 
-def copy_metadata_to_moai(ctx, random_id, publication_config, publication_state):
-    """Copy the metadata json file to configured MOAI.
+    The files are uploaded by consecutive secure copies, which share one SSH connection
+    to the public host (see tools/securecopy.sh). Each file that is uploaded is recorded in
+    the publication state, so that a retry only uploads the files that failed.
 
     :param ctx:                Combined type of a callback and rei struct
-    :param random_id:          Random ID part of DOI used for MOAI metadata file
     :param publication_config: Dict with publication configuration
     :param publication_state:  Dict with state of the publication process
+    :param uploads:            List of publication state keys of the files to upload
     """
-    publicHost = publication_config["publicHost"]
-    yodaInstance = publication_config["yodaInstance"]
-    yodaPrefix = publication_config["yodaPrefix"]
-    # randomId = publication_state["randomId"]  ##### in case of base? ###### revert to original
-    combiJsonPath = publication_state["combiJsonPath"]
-
-    argv = publicHost + " inbox /var/www/moai/metadata/" + yodaInstance + "/" + yodaPrefix + "/" + random_id + ".json"
-    copy_result = ctx.iiGenericSecureCopy(argv, combiJsonPath, '')
-    error = copy_result['arguments'][2]
-    if int(error) >= 0:
-        publication_state["oaiUploaded"] = "yes"
-    else:
-        publication_state["status"] = "Retry"
-        log.write(ctx, "copy_metadata_to_public: " + error)
+    for key in pending_publication_uploads(publication_state, uploads):
+        path_key, random_id_key, directory, extension = PUBLICATION_UPLOADS[key]
+        destination = "{}{}/{}/{}{}".format(directory,
+                                            publication_config["yodaInstance"],
+                                            publication_config["yodaPrefix"],
+                                            publication_state[random_id_key],
+                                            extension)
+
+        copy_result = ctx.iiGenericSecureCopy(publication_config["publicHost"] + " inbox " + destination,
+                                              publication_state[path_key], '')
+        error = copy_result['arguments'][2]
+        if int(error) >= 0:
+            publication_state[key] = "yes"
+        else:
+            publication_state["status"] = "Retry"
+            log.write(ctx, "sync_publication_files: upload of {} to {} failed: {}".format(publication_state[path_key], destination, error))
 
 
 def set_access_restrictions(ctx, vault_package, publication_state):
@@ -905,42 +962,17 @@ def process_publication(ctx, vault_package):
             log.write(ctx, "Error status after creating landing page: " + publication_state["status"])
             return publication_state["status"]
 
-    # Use secure copy to push landing page to the public host
-    if "landingPageUploaded" not in publication_state:
+    # Use secure copy to push landing page to the public host and combi JSON to MOAI server
+    uploads = publication_uploads(update_base_doi)
+    if len(pending_publication_uploads(publication_state, uploads)) > 0:
         if verbose:
-            log.write(ctx, "Uploading landing page.")
-        random_id = publication_state["randomId"]
-        copy_landingpage_to_public_host(ctx, random_id, publication_config, publication_state)
-
-        if update_base_doi:
-            base_random_id = publication_state["baseRandomId"]
-            if verbose:
-                log.write(ctx, "Updating base DOI landing page.")
-            copy_landingpage_to_public_host(ctx, base_random_id, publication_config, publication_state)
+            log.write(ctx, "Uploading landing page and MOAI metadata: " + ", ".join(pending_publication_uploads(publication_state, uploads)))
+        sync_publication_files(ctx, publication_config, publication_state, uploads)
 
         save_publication_state(ctx, vault_package, publication_state)
 
         if publication_state["status"] == "Retry":
-            log.write(ctx, "Error status after uploading landing page:" + publication_state["status"])
-            return publication_state["status"]
-
-    # Use secure copy to push combi JSON to MOAI server
-    if "oaiUploaded" not in publication_state:
-        if verbose:
-            log.write(ctx, "Uploading to MOAI.")
-        random_id = publication_state["randomId"]
-        copy_metadata_to_moai(ctx, random_id, publication_config, publication_state)
-
-        if update_base_doi:
-            base_random_id = publication_state["baseRandomId"]
-            if verbose:
-                log.write(ctx, "Updating base DOI at MOAI.")
-            copy_metadata_to_moai(ctx, base_random_id, publication_config, publication_state)
-
-        save_publication_state(ctx, vault_package, publication_state)
-
-        if publication_state["status"] == "Retry":
-            log.write(ctx, "Error status after uploading to MOAI: " + publication_state["status"])
+            log.write(ctx, "Error status after uploading landing page and MOAI metadata: " + publication_state["status"])
             return publication_state["status"]
 
     # Set access restriction for vault package.
@@ -1095,32 +1127,12 @@ def process_depublication(ctx, vault_package):
         if publication_state["status"] == "Unrecoverable":
             return publication_state["status"]
 
-    # Use secure copy to push landing page to the public host
-    if "landingPageUploaded" not in publication_state:
+    # Use secure copy to push landing page to the public host and combi JSON to MOAI server
+    uploads = publication_uploads(update_base_doi)
+    if len(pending_publication_uploads(publication_state, uploads)) > 0:
         if verbose:
-            log.write(ctx, "Uploading landing page.")
-        random_id = publication_state["randomId"]
-        copy_landingpage_to_public_host(ctx, random_id, publication_config, publication_state)
-
-        if update_base_doi:
-            base_random_id = publication_state["baseRandomId"]
-            copy_landingpage_to_public_host(ctx, base_random_id, publication_config, publication_state)
-
-        save_publication_state(ctx, vault_package, publication_state)
-
-        if publication_state["status"] == "Retry":
-            return publication_state["status"]
-
-    # Use secure copy to push combi JSON to MOAI server
-    if "oaiUploaded" not in publication_state:
-        if verbose:
-            log.write(ctx, "Uploading to MOAI.")
-        random_id = publication_state["randomId"]
-        copy_metadata_to_moai(ctx, random_id, publication_config, publication_state)
-
-        if update_base_doi:
-            base_random_id = publication_state["baseRandomId"]
-            copy_metadata_to_moai(ctx, base_random_id, publication_config, publication_state)
+            log.write(ctx, "Uploading landing page and MOAI metadata: " + ", ".join(pending_publication_uploads(publication_state, uploads)))
+        sync_publication_files(ctx, publication_config, publication_state, uploads)
 
         save_publication_state(ctx, vault_package, publication_state)
 
@@ -1264,32 +1276,12 @@ def process_republication(ctx, vault_package):
         if publication_state["status"] == "Unrecoverable":
             return publication_state["status"]
 
-    # Use secure copy to push landing page to the public host
-    if "landingPageUploaded" not in publication_state:
+    # Use secure copy to push landing page to the public host and combi JSON to MOAI server
+    uploads = publication_uploads(update_base_doi)
+    if len(pending_publication_uploads(publication_state, uploads)) > 0:
         if verbose:
-            log.write(ctx, "Uploading landing page.")
-        random_id = publication_state["randomId"]
-        copy_landingpage_to_public_host(ctx, random_id, publication_config, publication_state)
-
-        if update_base_doi:
-            base_random_id = publication_state["baseRandomId"]
-            copy_landingpage_to_public_host(ctx, base_random_id, publication_config, publication_state)
-
-        save_publication_state(ctx, vault_package, publication_state)
-
-        if publication_state["status"] == "Retry":
-            return publication_state["status"]
-
-    # Use secure copy to push combi JSON to MOAI server
-    if "oaiUploaded" not in publication_state:
-        if verbose:
-            log.write(ctx, "Uploading to MOAI.")
-        random_id = publication_state["randomId"]
-        copy_metadata_to_moai(ctx, random_id, publication_config, publication_state)
-
-        if update_base_doi:
-            base_random_id = publication_state["baseRandomId"]
-            copy_metadata_to_moai(ctx, base_random_id, publication_config, publication_state)
+            log.write(ctx, "Uploading landing page and MOAI metadata: " + ", ".join(pending_publication_uploads(publication_state, uploads)))
+        sync_publication_files(ctx, publication_config, publication_state, uploads)
 
         save_publication_state(ctx, vault_package, publication_state)
 
@@ -1339,18 +1331,20 @@ def rule_update_publication(ctx, vault_package, update_datacite, update_landingp
         ctx
     )
 
-    packages_found = False
-    for collection in collections:
-        coll_name = collection[0]
-        if ((vault_package == '*' and re.match(r'/[^/]+/home/vault-.*', coll_name)) or (vault_package != '*' and re.match(r'/[^/]+/home/vault-.*', coll_name) and coll_name == vault_package)):
-            packages_found = True
-            output = update_publication(ctx, coll_name, update_datacite == 'Yes', update_landingpage == 'Yes', update_moai == 'Yes')
-            log.write(ctx, coll_name + ': ' + output, True)
+    vault_packages = [collection[0] for collection in collections
+                      if re.match(r'/[^/]+/home/vault-.*', collection[0]) and vault_package in ('*', collection[0])]
 
-    if not packages_found:
+    if len(vault_packages) == 0:
         log.write(ctx, "[UPDATE PUBLICATIONS] No packages found for {}".format(vault_package), True)
+        return
+
+    if vault_package == '*':
+        update_publications(ctx, vault_packages, update_datacite == 'Yes', update_landingpage == 'Yes', update_moai == 'Yes')
     else:
-        log.write(ctx, "[UPDATE PUBLICATIONS] Finished for {}".format(vault_package), True)
+        output = update_publication(ctx, vault_package, update_datacite == 'Yes', update_landingpage == 'Yes', update_moai == 'Yes')
+        log.write(ctx, vault_package + ': ' + output, True)
+
+    log.write(ctx, "[UPDATE PUBLICATIONS] Finished for {}".format(vault_package), True)
 
 
 def update_publication(ctx, vault_package, update_datacite=False, update_landingpage=False, update_moai=False):
@@ -1477,27 +1471,18 @@ def update_publication(ctx, vault_package, update_datacite=False, update_landing
         if _check_return_if_publication_status(["Unrecoverable"], "before upload landing page"):
             return publication_state["status"]
 
-        # Use secure copy to push landing page to the public host
-        random_id = publication_state["randomId"]
+    # Use secure copy to push landing page to the public host and combi JSON to MOAI server
+    uploads = publication_uploads(update_base_doi, update_landingpage, update_moai)
+    if len(uploads) > 0:
+        if update_moai:
+            log.write(ctx, 'Update MOAI for package {}'.format(vault_package))
         if verbose:
-            log.write(ctx, "Uploading landing page.")
-        copy_landingpage_to_public_host(ctx, random_id, publication_config, publication_state)
-        if update_base_doi:
-            base_random_id = publication_state["baseRandomId"]
-            copy_landingpage_to_public_host(ctx, base_random_id, publication_config, publication_state)
-        save_publication_state(ctx, vault_package, publication_state)
-
-        if _check_return_if_publication_status(["Retry"], "before update MOAI"):
-            return publication_state["status"]
+            log.write(ctx, "Uploading landing page and MOAI metadata.")
 
-    if update_moai:
-        # Use secure copy to push combi JSON to MOAI server
-        log.write(ctx, 'Update MOAI for package {}'.format(vault_package))
-        random_id = publication_state["randomId"]
-        copy_metadata_to_moai(ctx, random_id, publication_config, publication_state)
-        if update_base_doi:
-            base_random_id = publication_state["baseRandomId"]
-            copy_metadata_to_moai(ctx, base_random_id, publication_config, publication_state)
+        # Files were uploaded before, upload them again.
+        for key in uploads:
+            publication_state.pop(key, None)
+        sync_publication_files(ctx, publication_config, publication_state, uploads)
         save_publication_state(ctx, vault_package, publication_state)
 
         if _check_return_if_publication_status(["Retry"], "before publication OK"):
@@ -1510,6 +1495,231 @@ def update_publication(ctx, vault_package, update_datacite=False, update_landing
     return publication_state["status"]
 
 
+PUBLICATION_UPDATE_STAGES = ["generate combi JSON",
+                             "generate DataCite JSON",
+                             "generate landing page",
+                             "hash files",
+                             "DataCite upload",
+                             "file upload",
+                             "save state"]
+
+
+def update_publications(ctx, vault_packages, update_datacite=False, update_landingpage=False, update_moai=False):
+    """Routine to update the publications of many vault packages at once.
+
+    Files are generated one package at a time, while the DataCite uploads of packages run
+    in a pool of config.publication_update_workers threads. The callback cannot be used
+    from other threads, so secure copies are done by the main thread, overlapping with
+    the DataCite uploads in progress.
+
+    Each upload stage records a hash of the file it uploaded in the publication state,
+    and is skipped when the regenerated file has the same hash. This makes an interrupted
+    update resume where it stopped, and leaves unchanged packages untouched. A package
+    that fails is marked for retry (or as unrecoverable) without stopping the update.
+
+    :param ctx:                Combined type of a callback and rei struct
+    :param vault_packages:     List of paths to packages in the vault
+    :param update_datacite:    Flag that indicates updating DataCite
+    :param update_landingpage: Flag that indicates updating landingpage
+    :param update_moai:        Flag that indicates updating MOAI (OAI-PMH)
+
+    :returns: Dict with the number of packages for each resulting status
+    """
+    publication_config = get_publication_config(ctx)
+    workers = max(1, config.publication_update_workers)
+    pool = ThreadPool(workers)
+    http_client.reset_metrics()
+
+    # Packages with DataCite uploads in progress, oldest first.
+    pending = deque()
+    timings = {}
+    results = {}
+
+    def finish(vault_package, publication_state, original_state, updated, datacite_hash, uploads):
+        uploaded = True
+        for result in uploads:
+            try:
+                httpCode, duration = result.get()
+            except Exception as e:
+                log.write(ctx, "Exception while posting metadata to Datacite after metadata update: " + str(e))
+                publication_state["status"] = "Retry"
+                uploaded = False
+                continue
+
+            add_stage_timing(timings, "DataCite upload", duration)
+            process_datacite_response(ctx, publication_state, 'put', httpCode)
+            uploaded = uploaded and httpCode == 200
+
+        if len(uploads) > 0 and uploaded:
+            publication_state["dataCiteJsonHash"] = datacite_hash
+
+        if publication_state != original_state:
+            with stage_timer(timings, "save state"):
+                save_publication_state(ctx, vault_package, publication_state)
+
+        if publication_state["status"] == "OK" and not updated:
+            output = "Unchanged"
+        else:
+            output = publication_state["status"]
+        results[output] = results.get(output, 0) + 1
+        log.write(ctx, vault_package + ': ' + output, True)
+
+    try:
+        for vault_package in vault_packages:
+            publication_state = get_publication_state(ctx, vault_package)
+            if publication_state["status"] != "OK":
+                log.write(ctx, vault_package + ': ' + publication_state["status"], True)
+                results[publication_state["status"]] = results.get(publication_state["status"], 0) + 1
+                continue
+
+            original_state = dict(publication_state)
+            update_base_doi = ("baseDOI" in publication_state
+                               and "previous_version" in publication_state
+                               and "next_version" not in publication_state)
+
+            if "publicationDate" not in publication_state:
+                publication_state["publicationDate"] = get_publication_date(ctx, vault_package)
+            publication_state["lastModifiedDateTime"] = get_last_modified_datetime(ctx, vault_package)
+
+            try:
+                with stage_timer(timings, "generate combi JSON"):
+                    generate_combi_json(ctx, publication_config, publication_state)
+                if update_datacite:
+                    with stage_timer(timings, "generate DataCite JSON"):
+                        generate_datacite_json(ctx, publication_state)
+                if update_landingpage:
+                    with stage_timer(timings, "generate landing page"):
+                        generate_landing_page(ctx, publication_state, "publish")
+            except Exception as e:
+                log.write(ctx, "Exception while generating files for publication update of <{}>: {}".format(vault_package, str(e)))
+                publication_state["status"] = "Unrecoverable"
+                finish(vault_package, publication_state, original_state, True, None, [])
+                continue
+
+            try:
+                with stage_timer(timings, "hash files"):
+                    combi_json_hash = get_publication_file_hash(ctx, publication_state["combiJsonPath"])
+                    datacite_hash = get_publication_file_hash(ctx, publication_state["dataCiteJsonPath"]) if update_datacite else None
+                    landing_page_hash = get_publication_file_hash(ctx, publication_state["landingPagePath"]) if update_landingpage else None
+
+                payloads = []
+                if update_datacite and datacite_hash != publication_state.get("dataCiteJsonHash"):
+                    payloads.append((publication_state["versionDOI"],
+                                     get_datacite_payload(ctx, publication_state, publication_state["versionDOI"])))
+                    if update_base_doi:
+                        payloads.append((publication_state["baseDOI"],
+                                         get_datacite_payload(ctx, publication_state, publication_state["baseDOI"], base_doi=True)))
+            except Exception as e:
+                log.write(ctx, "Exception while reading files for publication update of <{}>: {}".format(vault_package, str(e)))
+                publication_state["status"] = "Unrecoverable"
+                finish(vault_package, publication_state, original_state, True, None, [])
+                continue
+
+            updated = False
+            uploads = []
+            if len(payloads) > 0:
+                log.write(ctx, 'Update datacite for package {}'.format(vault_package))
+                updated = True
+                uploads = [pool.apply_async(put_datacite_metadata, payload) for payload in payloads]
+
+            update_landing_page = update_landingpage and landing_page_hash != publication_state.get("landingPageHash")
+            update_oai = update_moai and combi_json_hash != publication_state.get("combiJsonHash")
+            files = publication_uploads(update_base_doi, update_landing_page, update_oai)
+            if len(files) > 0:
+                log.write(ctx, 'Update landing page and/or MOAI for package {}'.format(vault_package))
+                updated = True
+
+                # Files were uploaded before, upload them again.
+                for key in files:
+                    publication_state.pop(key, None)
+                try:
+                    with stage_timer(timings, "file upload"):
+                        sync_publication_files(ctx, publication_config, publication_state, files)
+                except Exception as e:
+                    # Still collect the DataCite uploads in progress of this package.
+                    log.write(ctx, "Exception while uploading files for publication update of <{}>: {}".format(vault_package, str(e)))
+                    publication_state["status"] = "Retry"
+                    finish(vault_package, publication_state, original_state, updated, datacite_hash, uploads)
+                    continue
+
+                if update_landing_page and len(pending_publication_uploads(publication_state, publication_uploads(update_base_doi, moai=False))) == 0:
+                    publication_state["landingPageHash"] = landing_page_hash
+                if update_oai and len(pending_publication_uploads(publication_state, publication_uploads(update_base_doi, landing_page=False))) == 0:
+                    publication_state["combiJsonHash"] = combi_json_hash
+
+            pending.append((vault_package, publication_state, original_state, updated, datacite_hash, uploads))
+            while len(pending) > workers:
+                finish(*pending.popleft())
+
+        while len(pending) > 0:
+            finish(*pending.popleft())
+    finally:
+        pool.close()
+        pool.join()
+
+    log.write(ctx, "[UPDATE PUBLICATIONS] Packages: {}".format(
+        ", ".join("{} {}".format(count, status) for status, count in sorted(results.items()))), True)
+    for stage in PUBLICATION_UPDATE_STAGES:
+        if stage in timings:
+            count, duration = timings[stage]
+            log.write(ctx, "[UPDATE PUBLICATIONS] {:<24} {:>6} times {:>10.1f} s total {:>10.1f} ms average"
+                           .format(stage, count, duration, 1000.0 * duration / count), True)
+    for line in http_client.format_metrics():
+        log.write(ctx, "[UPDATE PUBLICATIONS] HTTP " + line, True)
+
+    return results
+
+
+def put_datacite_metadata(doi, payload):
+    """Update metadata with DataCite, from a worker thread of a bulk publication update.
+
+    :param doi:     DataCite DOI to update metadata
+    :param payload: DataCite JSON to upload
+
+    :returns: Tuple with the HTTP status code (None if DataCite timed out) and the duration in seconds
+    """
+    start = time.time()
+    try:
+        # The callback must not be used from worker threads.
+        httpCode = datacite.metadata_put(None, doi, payload)
+    except ReadTimeout:
+        httpCode = None
+
+    return httpCode, time.time() - start
+
+
+def get_publication_file_hash(ctx, path):
+    """Determine the hash of a file generated for a publication, to detect changes.
+
+    :param ctx:  Combined type of a callback and rei struct
+    :param path: Path to the generated file
+
+    :returns: SHA256 digest of the file, in hexadecimal
+    """
+    return hashlib.sha256(data_object.read(ctx, path)).hexdigest()
+
+
+@contextmanager
+def stage_timer(timings, stage):
+    """Measure the duration of a stage of a bulk publication update."""
+    start = time.time()
+    try:
+        yield
+    finally:
+        add_stage_timing(timings, stage, time.time() - start)
+
+
+def add_stage_timing(timings, stage, duration):
+    """Add the duration of a stage of a bulk publication update to the timings.
+
+    :param timings:  Dict of stage to the number of times and total duration of the stage
+    :param stage:    Name of the stage
+    :param duration: Duration of the stage in seconds
+    """
+    count, total = timings.get(stage, (0, 0.0))
+    timings[stage] = (count + 1, total + duration)
+
+
 def get_collection_metadata(ctx, coll, prefix):
     """Retrieve all collection metadata.
 
@@ -4,9 +4,11 @@
 __copyright__ = 'Copyright (c) 2019-2024, Utrecht University'
 __license__   = 'GPLv3, see LICENSE'
 
+import itertools
 import random
 import re
 import time
+from contextlib import contextmanager
 
 import genquery
 import irods_types
@@ -82,6 +84,13 @@ def rule_replicate_batch(ctx, verbose, balance_id_min, balance_id_max, batch_siz
     To enable efficient parallel batch processing, each batch job gets assigned a range of numbers. For instance 1-32.
     The corresponding job will only process data objects with a balance id within the range.
 
+    Data objects are processed in chunks. Within a chunk, data objects are grouped by source and destination
+    resource, and the throughput per pair of resources is logged when the job has finished.
+
+    Multiple batch jobs can replicate concurrently. The number of concurrent replications to a destination
+    resource is limited, and at most one large data object is replicated to a destination resource at a time.
+    Data objects that cannot be replicated because of these limits are postponed to a next batch job.
+
     :param ctx:              Combined type of a callback and rei struct
     :param verbose:          Whether to log verbose messages for troubleshooting ('1': yes, anything else: no)
     :param balance_id_min:   Minimum balance id for batch jobs (value 1-64)
@@ -92,6 +101,7 @@ def rule_replicate_batch(ctx, verbose, balance_id_min, balance_id_max, batch_siz
     """
     count         = 0
     count_ok      = 0
+    count_postponed = 0
     print_verbose = (verbose == '1')
     no_action     = (dry_run == '1')
 
@@ -110,15 +120,32 @@ def rule_replicate_batch(ctx, verbose, balance_id_min, balance_id_max, batch_siz
         if print_verbose:
             log.write(ctx, "async_replication_delay_time = {} seconds".format(config.async_replication_delay_time))
             log.write(ctx, "max_rss = {} bytes".format(config.async_replication_max_rss))
+            log.write(ctx, "chunk_size = {}".format(config.async_replication_chunk_size))
+            log.write(ctx, "resource_concurrency = {}".format(config.async_replication_resource_concurrency))
+            log.write(ctx, "large_file_size = {} bytes".format(config.async_replication_large_file_size))
             log.write(ctx, "dry_run = {}".format(dry_run))
             show_memory_usage(ctx)
 
-        # Get list of up to batch size limit of data objects scheduled for replication, taking into account their modification time.
-        iter = list(genquery.Query(ctx,
-                    ['ORDER(DATA_ID)', 'COLL_NAME', 'DATA_NAME', 'META_DATA_ATTR_VALUE', 'DATA_RESC_NAME'],
-                    "META_DATA_ATTR_NAME = '{}' AND DATA_MODIFY_TIME n<= '{}'".format(attr, minimum_timestamp),
-                    offset=0, limit=int(batch_size_limit), output=genquery.AS_LIST))
-        for row in iter:
+        # Get data objects scheduled for replication within the balance id range of this job,
+        # taking into account their modification time. Data objects are queried in chunks ordered by data ID.
+        columns = ['COLL_NAME', 'DATA_NAME', 'META_DATA_ATTR_VALUE']
+        condition = "META_DATA_ATTR_NAME = '{}' AND DATA_MODIFY_TIME n<= '{}'".format(attr, minimum_timestamp)
+        chunk_size = int(config.async_replication_chunk_size)
+        rows = batch.balance_id_rows(ctx, columns, condition, balance_id_min, balance_id_max, chunk_size)
+
+        if int(balance_id_min) == 1:
+            # Replication metadata without a balance id is invalid. It is handled by the job that processes
+            # the first balance id, so that it is not handled by all parallel jobs.
+            rows = batch.merge_rows([rows, batch.chunked_rows(ctx, columns, condition + " AND META_DATA_ATTR_VALUE not like '%,%,%'", chunk_size)])
+
+        rows = itertools.islice(rows, int(batch_size_limit))
+        pair_metrics = {}
+
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+
             # Stop further execution if admin has blocked replication process.
             if is_replication_blocked_by_admin(ctx):
                 log.write(ctx, "Batch replication job is stopped")
@@ -130,83 +157,24 @@ def rule_replicate_batch(ctx, verbose, balance_id_min, balance_id_max, batch_siz
                 log.write(ctx, "Memory used is now above specified limit of {} bytes, stopping further processing".format(config.async_replication_max_rss))
                 break
 
-            count += 1
-            path = row[1] + "/" + row[2]
-
-            # Metadata value contains from_path, to_path and balance id for load balancing purposes.
-            info = row[3].split(',')
-            from_path = info[0]
-            to_path = info[1]
-
-            if len(info) == 3:
-                balance_id = int(info[2])
-            else:
-                # Not replicable.
-                log.write(ctx, "ERROR - Invalid replication data for {}".format(path))
-                try:
-                    add_operation = {
-                        "entity_name": path,
-                        "entity_type": "data_object",
-                        "operations": [
-                            {
-                                "operation": "add",
-                                "attribute": errorattr,
-                                "value": "Invalid,Invalid",
-                                "units": ""
-                            }
-                        ]
-                    }
-                    avu.apply_atomic_operations(ctx, add_operation)
-                except Exception:
-                    pass
-
-                # Go to next record and skip further processing.
-                continue
-
-            # Check whether balance id is within the range for this job
-            if balance_id < int(balance_id_min) or balance_id > int(balance_id_max):
-                # Skip this one and go to the next data object to be replicated.
-                continue
-
-            # For totalization only count the data objects that are within the specified balancing range
-            count += 1
-            data_resc_name = row[4]
-
-            # "No action" is meant for easier memory usage debugging.
-            if no_action:
-                show_memory_usage(ctx)
-                log.write(ctx, "Skipping batch replication (dry_run): would have replicated \"{}\" from {} to {}".format(path, from_path, to_path))
-                continue
-
-            if print_verbose:
-                log.write(ctx, "Batch replication: copying {} from {} to {}".format(path, from_path, to_path))
+            replicas = get_replicas(ctx, [row[0] for row in chunk])
 
-            # Actual replication
-            try:
-                # Ensure first replica has checksum before replication.
-                msi.data_obj_chksum(ctx, path, "irodsAdmin=", irods_types.BytesBuf())
+            # Group data objects by source and destination resource, and replicate small data objects first,
+            # so that they do not have to wait for large data objects.
+            def schedule_key(row):
+                data_size = replicas.get(row[0], (0, []))[0]
+                return (is_large_data_object(data_size), row[3].split(',')[:2], data_size)
 
-                # Workaround the PREP deadlock issue: Restrict threads to 1.
-                ofFlags = "numThreads=1++++rescName={}++++destRescName={}++++irodsAdmin=++++verifyChksum=".format(from_path, to_path)
-                msi.data_obj_repl(ctx, path, ofFlags, irods_types.BytesBuf())
-                # Mark as correctly replicated
-                count_ok += 1
-            except msi.Error as e:
-                log.write(ctx, 'ERROR - The file {} could not be replicated from {} to {}: {}'.format(file, from_path, to_path, str(e)))
+            for row in sorted(chunk, key=schedule_key):
+                count += 1
+                data_id = row[0]
+                path = row[1] + "/" + row[2]
 
-                if print_verbose:
-                    log.write(ctx, "Batch replication retry: copying {} from {} to {}".format(path, data_resc_name, to_path))
-
-                # Retry replication with data resource name (covers case where resource is removed from the resource hierarchy).
-                try:
-                    log.write(ctx, 'Fallback replication triggered: {}'.format(path))
-                    # Workaround the PREP deadlock issue: Restrict threads to 1.
-                    ofFlags = "numThreads=1++++rescName={}++++destRescName={}++++irodsAdmin=++++verifyChksum=".format(data_resc_name, to_path)
-                    msi.data_obj_repl(ctx, path, ofFlags, irods_types.BytesBuf())
-                    # Mark as correctly replicated
-                    count_ok += 1
-                except msi.Error as e:
-                    log.write(ctx, 'ERROR - The file could not be replicated: {}'.format(str(e)))
+                # Metadata value contains from_path, to_path and balance id for load balancing purposes.
+                info = row[3].split(',')
+                if len(info) != 3:
+                    # Not replicable.
+                    log.write(ctx, "ERROR - Invalid replication data for {}".format(path))
                     try:
                         add_operation = {
                             "entity_name": path,
@@ -215,7 +183,7 @@ def rule_replicate_batch(ctx, verbose, balance_id_min, balance_id_max, batch_siz
                                 {
                                     "operation": "add",
                                     "attribute": errorattr,
-                                    "value": "{},{}".format(from_path, to_path),
+                                    "value": "Invalid,Invalid",
                                     "units": ""
                                 }
                             ]
@@ -224,31 +192,194 @@ def rule_replicate_batch(ctx, verbose, balance_id_min, balance_id_max, batch_siz
                     except Exception:
                         pass
 
-            # Remove replication_scheduled flag no matter if replication succeeded or not.
-            # rods should have been given own access via policy to allow AVU changes
-            avu_deleted = False
-            try:
-                avu.rmw_from_data(ctx, path, attr, "{},{},{}".format(from_path, to_path, balance_id))
-                avu_deleted = True
-            except Exception:
-                avu_deleted = False
-
-            # Try removing attr/resc meta data again with other ACL's
-            if not avu_deleted:
-                try:
-                    # The object's ACLs may have changed.
-                    # Force the ACL and try one more time.
-                    msi.sudo_obj_acl_set(ctx, "", "own", user.full_name(ctx), path, "")
-                    avu.rmw_from_data(ctx, path, attr, "{},{},{}".format(from_path, to_path, balance_id))
-                except Exception:
-                    # error => report it but still continue
-                    log.write(ctx, "ERROR - Scheduled replication of <{}>: could not remove schedule flag".format(path))
+                    # Go to next record and skip further processing.
+                    continue
+
+                from_path, to_path, balance_id = info
+                data_size, data_resc_names = replicas.get(data_id, (0, []))
+                metrics = pair_metrics.setdefault((from_path, to_path), {"count": 0, "count_ok": 0, "count_postponed": 0, "size": 0, "time": 0.0})
+                metrics["count"] += 1
+
+                # "No action" is meant for easier memory usage debugging.
+                if no_action:
+                    show_memory_usage(ctx)
+                    log.write(ctx, "Skipping batch replication (dry_run): would have replicated \"{}\" from {} to {}".format(path, from_path, to_path))
+                    continue
+
+                if print_verbose:
+                    log.write(ctx, "Batch replication: copying {} from {} to {}".format(path, from_path, to_path))
+
+                with replication_slot(to_path, is_large_data_object(data_size)) as acquired:
+                    if not acquired:
+                        # Too many replications to the destination resource are in progress.
+                        # The data object stays scheduled, so it will be replicated by a next batch job.
+                        if print_verbose:
+                            log.write(ctx, "Batch replication: postponing replication of {} to {}".format(path, to_path))
+                        count_postponed += 1
+                        metrics["count_postponed"] += 1
+                        continue
+
+                    start_time = time.time()
+                    if replicate_scheduled_data_object(ctx, print_verbose, attr, errorattr, path, from_path, to_path, balance_id, data_resc_names):
+                        count_ok += 1
+                        metrics["count_ok"] += 1
+                        metrics["size"] += data_size
+                    metrics["time"] += time.time() - start_time
 
         if print_verbose:
             show_memory_usage(ctx)
 
+        for (from_path, to_path), metrics in sorted(pair_metrics.items()):
+            log.write(ctx, "Batch replication from {} to {}: {}/{} objects replicated successfully, {} postponed, {} in {:.1f} seconds ({}/s).".format(
+                from_path,
+                to_path,
+                metrics["count_ok"],
+                metrics["count"],
+                metrics["count_postponed"],
+                misc.human_readable_size(metrics["size"]),
+                metrics["time"],
+                misc.human_readable_size(int(metrics["size"] / metrics["time"]) if metrics["time"] > 0 else 0)))
+
         # Total replication process completed
-        log.write(ctx, "Batch replication job finished. {}/{} objects replicated successfully.".format(count_ok, count))
+        log.write(ctx, "Batch replication job finished. {}/{} objects replicated successfully, {} postponed.".format(count_ok, count, count_postponed))
+
+
+def is_large_data_object(data_size):
+    """Check whether a data object is large, for scheduling purposes.
+
+    :param data_size: Size of the data object in bytes
+
+    :returns: Boolean indicating whether the data object is large
+    """
+    return data_size >= int(config.async_replication_large_file_size)
+
+
+@contextmanager
+def replication_slot(to_path, large):
+    """Acquires a slot for replication to a destination resource, and yields whether it was acquired."""
+    if large:
+        # At most one large data object is replicated to a resource at a time, so that large data objects
+        # are spread out over batch jobs. Do not wait for it, but replicate other data objects in the mean time.
+        with slots.slot("replication-large-{}".format(to_path), 1) as acquired:
+            if not acquired:
+                yield False
+                return
+
+            with slots.slot("replication-{}".format(to_path),
+                            int(config.async_replication_resource_concurrency),
+                            int(config.async_replication_slot_wait_time)) as acquired:
+                yield acquired
+    else:
+        with slots.slot("replication-{}".format(to_path),
+                        int(config.async_replication_resource_concurrency),
+                        int(config.async_replication_slot_wait_time)) as acquired:
+            yield acquired
+
+
+def get_replicas(ctx, data_ids):
+    """Get the size and the resources of the replicas of data objects.
+
+    :param ctx:      Combined type of a callback and rei struct
+    :param data_ids: List of data IDs
+
+    :returns: Dict of data ID to 2-tuple (size, list of resource names of the replicas)
+    """
+    replicas = {}
+    if not data_ids:
+        return replicas
+
+    for row in genquery.row_iterator(
+            "DATA_ID, DATA_SIZE, DATA_RESC_NAME",
+            "DATA_ID in ({})".format(", ".join("'{}'".format(data_id) for data_id in data_ids)),
+            genquery.AS_LIST, ctx):
+        data_size, data_resc_names = replicas.get(row[0], (0, []))
+        replicas[row[0]] = (max(data_size, int(row[1])), data_resc_names + [row[2]])
+
+    return replicas
+
+
+def replicate_scheduled_data_object(ctx, print_verbose, attr, errorattr, path, from_path, to_path, balance_id, data_resc_names):
+    """Replicate a data object that has been scheduled for replication, and remove its replication flag.
+
+    :param ctx:             Combined type of a callback and rei struct
+    :param print_verbose:   Whether to log verbose messages for troubleshooting (Boolean)
+    :param attr:            replication_scheduled flag name
+    :param errorattr:       replication_failed flag name
+    :param path:            Path to the data object
+    :param from_path:       Resource to be used as source
+    :param to_path:         Resource to be used as destination
+    :param balance_id:      Balance id of the data object
+    :param data_resc_names: Resources of the replicas of the data object
+
+    :returns: Whether the data object was replicated successfully
+    """
+    replicated = False
+
+    # Actual replication
+    try:
+        # Ensure first replica has checksum before replication.
+        msi.data_obj_chksum(ctx, path, "irodsAdmin=", irods_types.BytesBuf())
+
+        # Workaround the PREP deadlock issue: Restrict threads to 1.
+        ofFlags = "numThreads=1++++rescName={}++++destRescName={}++++irodsAdmin=++++verifyChksum=".format(from_path, to_path)
+        msi.data_obj_repl(ctx, path, ofFlags, irods_types.BytesBuf())
+        # Mark as correctly replicated
+        replicated = True
+    except msi.Error as e:
+        log.write(ctx, 'ERROR - The file {} could not be replicated from {} to {}: {}'.format(path, from_path, to_path, str(e)))
+
+        # Retry replication with data resource name (covers case where resource is removed from the resource hierarchy).
+        data_resc_name = next((resc for resc in data_resc_names if resc != to_path), from_path)
+        if print_verbose:
+            log.write(ctx, "Batch replication retry: copying {} from {} to {}".format(path, data_resc_name, to_path))
+
+        try:
+            log.write(ctx, 'Fallback replication triggered: {}'.format(path))
+            # Workaround the PREP deadlock issue: Restrict threads to 1.
+            ofFlags = "numThreads=1++++rescName={}++++destRescName={}++++irodsAdmin=++++verifyChksum=".format(data_resc_name, to_path)
+            msi.data_obj_repl(ctx, path, ofFlags, irods_types.BytesBuf())
+            # Mark as correctly replicated
+            replicated = True
+        except msi.Error as e:
+            log.write(ctx, 'ERROR - The file could not be replicated: {}'.format(str(e)))
+            try:
+                add_operation = {
+                    "entity_name": path,
+                    "entity_type": "data_object",
+                    "operations": [
+                        {
+                            "operation": "add",
+                            "attribute": errorattr,
+                            "value": "{},{}".format(from_path, to_path),
+                            "units": ""
+                        }
+                    ]
+                }
+                avu.apply_atomic_operations(ctx, add_operation)
+            except Exception:
+                pass
+
+    # Remove replication_scheduled flag no matter if replication succeeded or not.
+    # rods should have been given own access via policy to allow AVU changes
+    avu_deleted = False
+    try:
+        avu.rmw_from_data(ctx, path, attr, "{},{},{}".format(from_path, to_path, balance_id))
+        avu_deleted = True
+    except Exception:
+        avu_deleted = False
+
+    # Try removing attr/resc meta data again with other ACL's
+    if not avu_deleted:
+        try:
+            # The object's ACLs may have changed.
+            # Force the ACL and try one more time.
+            msi.sudo_obj_acl_set(ctx, "", "own", user.full_name(ctx), path, "")
+            avu.rmw_from_data(ctx, path, attr, "{},{},{}".format(from_path, to_path, balance_id))
+        except Exception:
+            # error => report it but still continue
+            log.write(ctx, "ERROR - Scheduled replication of <{}>: could not remove schedule flag".format(path))
+
+    return replicated
 
 
 def is_replication_blocked_by_admin(ctx):
@@ -619,9 +619,9 @@ def api_research_system_metadata(ctx, coll):
 
     :returns: Dict with research system metadata
     """
-    data_count = collection.data_count(ctx, coll)
-    collection_count = collection.collection_count(ctx, coll)
-    size = collection.size(ctx, coll)
+    data_count = collection.data_count(ctx, coll, cache=True)
+    collection_count = collection.collection_count(ctx, coll, cache=True)
+    size = collection.size(ctx, coll, cache=True)
     size_readable = misc.human_readable_size(size)
 
     result = "{} files, {} folders, total of {}".format(data_count, collection_count, size_readable)
@@ -4,6 +4,7 @@
 __copyright__ = 'Copyright (c) 2018-2024, Utrecht University'
 __license__   = 'GPLv3, see LICENSE'
 
+import time
 from datetime import datetime
 
 import genquery
@@ -421,6 +422,9 @@ def rule_resource_store_storage_statistics(ctx):
 
     Store as metadata on group level as [category, research, vault, revision, total]
 
+    Sizes are retrieved for all groups at once, summed per collection by the catalog,
+    and aggregated per group in memory.
+
     :param ctx:  Combined type of a callback and rei struct
 
     :returns: Storage data for each group of each category
@@ -429,135 +433,131 @@ def rule_resource_store_storage_statistics(ctx):
 
     dt = datetime.today()
     md_storage_date = constants.UUMETADATAGROUPSTORAGETOTALS + dt.strftime("%Y_%m_%d")
+    timer = _PhaseTimer(ctx)
 
-    # Delete previous data for this particular day if present at all
-    # Each group should only have one aggrageted totals attribute per day
+    # Previous data for this particular day, if present at all.
+    # Each group should only have one aggregated totals attribute per day.
+    previous_values = {}
     iter = genquery.row_iterator(
-        "META_USER_ATTR_VALUE, USER_GROUP_NAME",
+        "USER_GROUP_NAME, META_USER_ATTR_VALUE, META_USER_ATTR_UNITS",
         "META_USER_ATTR_NAME = '" + md_storage_date + "'",
         genquery.AS_LIST, ctx
     )
     for row in iter:
-        if (md_storage_date, row[0], '') not in list(avu.of_group(ctx, row[1])):
-            continue
-        avu.rm_from_group(ctx, row[1], md_storage_date, row[0])
+        if row[2] == '':
+            previous_values.setdefault(row[0], []).append(row[1])
+    timer.phase("retrieve previous data of today")
 
-    # Get all categories
-    categories = []
+    # Get categories of all groups.
+    group_categories = {}
     iter = genquery.row_iterator(
-        "META_USER_ATTR_VALUE",
+        "USER_NAME, META_USER_ATTR_VALUE",
         "USER_TYPE = 'rodsgroup' AND META_USER_ATTR_NAME = 'category'",
         genquery.AS_LIST, ctx
     )
     for row in iter:
-        categories.append(row[0])
+        group_categories[row[0]] = row[1]
+    timer.phase("retrieve group categories")
 
-    # Steps to be taken per group
-    # The software distinguishes 2 separate areas.
-    # 1) VAULT AREA
-    # 2) RESEARCH AREA - which includes research and deposit groups
+    # The software distinguishes 3 separate areas.
+    # 1) RESEARCH AREA - which includes research and deposit groups
+    # 2) VAULT AREA
     # 3) REVISION AREA
-    steps = ['research', 'vault']
-    total = {'research': 0, 'vault': 0, 'revision': 0}
+    home_sizes = _get_collection_sizes_per_name(ctx, '/{}/home'.format(zone), True)
+    timer.phase("retrieve research and vault sizes")
+    revision_sizes = _get_collection_sizes_per_name(ctx, '/{}{}'.format(zone, constants.UUREVISIONCOLLECTION), False)
+    timer.phase("retrieve revision sizes")
+
+    for group, category in sorted(group_categories.items()):
+        # COLLECT GROUP DATA
+        # Per group collect totals for vault, research and revision
+        # Look at research, deposit, intake and grp groups
+        if not group.startswith(('research', 'deposit', 'intake', 'grp')):
+            log.write(ctx, 'Skipping group as not prefixed with either research-, deposit-, intake- or grp- <{}>'.format(group))
+            continue
 
-    # Loop through all categories
-    for category in categories:
-        groups = get_groups_on_category(ctx, category)
+        # STORE GROUP DATA
+        # STORAGE_TOTAL_REVISION_2023_01_09
+        # constructed this way to be backwards compatible (not using json.dump)
 
-        for group in groups:
-            # COLLECT GROUP DATA
-            # Per group collect totals for vault, research and revision
-            # Look at research, deposit, intake and grp groups
-            if group.startswith(('research', 'deposit', 'intake', 'grp')):
-                # RESEARCH AND VAULT SPACE
-                for step in steps:
-                    total[step] = 0
-
-                    if step == 'research':
-                        path = '/' + zone + '/home/' + group
-                    else:
-                        # groupname can start with 'research-' or 'deposit-'
-                        if group.startswith('research-'):
-                            vault_group = group.replace('research-', 'vault-', 1)
-                        else:
-                            vault_group = group.replace('deposit-', 'vault-', 1)
-                        path = '/' + zone + '/home/' + vault_group
-
-                    # Per group two statements are required to gather all data
-                    # 1) data in folder itself
-                    # 2) data in all subfolders of the folder
-                    for folder in ['self', 'subfolders']:
-                        if folder == 'self':
-                            whereClause = "COLL_NAME = '" + path + "'"
-                        else:
-                            whereClause = "COLL_NAME like '" + path + "/%'"
-
-                        iter = genquery.row_iterator(
-                            "SUM(DATA_SIZE)",
-                            whereClause,
-                            genquery.AS_LIST, ctx
-                        )
-
-                        for row in iter:
-                            if row[0] != '':
-                                total[step] += int(row[0])
-
-                # REVISION SPACE
-                total['revision'] = 0
-                revision_path = '/{}{}/{}'.format(zone, constants.UUREVISIONCOLLECTION, group)
-                whereClause = "COLL_NAME like '" + revision_path + "/%'"
-                iter = genquery.row_iterator(
-                    "SUM(DATA_SIZE)",
-                    whereClause,
-                    genquery.AS_LIST, ctx
-                )
-                for row in iter:
-                    if row[0] != '':
-                        total['revision'] += int(row[0])
-
-                # For intake and grp groups.
-                total['other'] = 0
-                group_path = '/' + zone + '/home/' + group
-                for folder in ['self', 'subfolders']:
-                    if folder == 'self':
-                        whereClause = "COLL_NAME = '" + group_path + "'"
-                    else:
-                        whereClause = "COLL_NAME like '" + group_path + "/%'"
-
-                iter = genquery.row_iterator(
-                    "SUM(DATA_SIZE)",
-                    whereClause,
-                    genquery.AS_LIST, ctx
-                )
-                for row in iter:
-                    if row[0] != '':
-                        total['other'] += int(row[0])
-
-                # STORE GROUP DATA
-                # STORAGE_TOTAL_REVISION_2023_01_09
-                # constructed this way to be backwards compatible (not using json.dump)
-
-                # [category, research, vault, revision, total]
-                storage_total = total['research'] + total['vault'] + total['revision']
-                storage_val = "[\"{}\", {}, {}, {}, {}]".format(category, total['research'], total['vault'], total['revision'], storage_total)
-                storage_val_other = "[\"{}\", {}, {}, {}, {}]".format(category, 0, 0, 0, total['other'])
-
-                # Only store if storage_total>0???
-                # Sla maar wel op want anders niet duidelijk of het gebeurd is
-
-                # write as metadata (kv-pair) to current group
-                if group.startswith(('research', 'deposit')):
-                    avu.associate_to_group(ctx, group, md_storage_date, storage_val)
-                if group.startswith(('intake', 'grp')):
-                    avu.associate_to_group(ctx, group, md_storage_date, storage_val_other)
-
-                log.write(ctx, 'Storage data collected and stored for current month <{}>'.format(group))
-            else:  # except Exception:
-                log.write(ctx, 'Skipping group as not prefixed with either research-, deposit-, intake- or grp- <{}>'.format(group))
+        # [category, research, vault, revision, total]
+        if group.startswith(('research', 'deposit')):
+            # groupname can start with 'research-' or 'deposit-'
+            if group.startswith('research-'):
+                vault_group = group.replace('research-', 'vault-', 1)
+            else:
+                vault_group = group.replace('deposit-', 'vault-', 1)
+
+            research = home_sizes.get(group, 0)
+            vault = home_sizes.get(vault_group, 0)
+            revision = revision_sizes.get(group, 0)
+            storage_val = "[\"{}\", {}, {}, {}, {}]".format(category, research, vault, revision, research + vault + revision)
+        else:
+            # For intake and grp groups.
+            storage_val = "[\"{}\", {}, {}, {}, {}]".format(category, 0, 0, 0, home_sizes.get(group, 0))
+
+        # write as metadata (kv-pair) to current group, replacing data of today in the same transaction
+        operations = [{"operation": "remove", "attribute": md_storage_date, "value": value, "units": ""}
+                      for value in previous_values.pop(group, [])]
+        operations.append({"operation": "add", "attribute": md_storage_date, "value": storage_val, "units": ""})
+        if avu.apply_atomic_operations(ctx, {"entity_name": group, "entity_type": "user", "operations": operations}):
+            log.write(ctx, 'Storage data collected and stored for current month <{}>'.format(group))
+        else:
+            log.write(ctx, 'Storing storage data failed for current month <{}>'.format(group))
+
+    # Remove data of today of groups that no longer have a category.
+    for group, values in previous_values.items():
+        operations = [{"operation": "remove", "attribute": md_storage_date, "value": value, "units": ""}
+                      for value in values]
+        avu.apply_atomic_operations(ctx, {"entity_name": group, "entity_type": "user", "operations": operations})
+    timer.phase("store storage data")
 
     return 'ok'
 
 
+class _PhaseTimer(object):
+    """Logs the duration of consecutive phases of a job."""
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.start = time.time()
+
+    def phase(self, name):
+        now = time.time()
+        log.write(self.ctx, 'Storage statistics: {} took {:.1f}s'.format(name, now - self.start))
+        self.start = now
+
+
+def _get_collection_sizes_per_name(ctx, parent, include_self):
+    """Get the total data size per collection directly below a parent collection.
+
+    Data sizes are summed per collection by the catalog, and the sums of all
+    subcollections are added up in memory. All replicas are counted.
+
+    :param ctx:          Combined type of a callback and rei struct
+    :param parent:       Path of parent collection (e.g. /tempZone/home)
+    :param include_self: Include data objects directly in the collections below the parent,
+                         in addition to the data objects in their subcollections
+
+    :returns: Dict of collection name to total data size in bytes
+    """
+    sizes = {}
+    iter = genquery.row_iterator(
+        "COLL_NAME, SUM(DATA_SIZE)",
+        "COLL_NAME like '" + parent + "/%'",
+        genquery.AS_LIST, ctx
+    )
+    for row in iter:
+        if row[1] == '':
+            continue
+
+        name, _, subcollection = row[0][len(parent) + 1:].partition('/')
+        if include_self or subcollection:
+            sizes[name] = sizes.get(name, 0) + int(row[1])
+
+    return sizes
+
+
 @rule.make(inputs=[0, 1, 2], outputs=[])
 def rule_resource_update_resc_arb_data(ctx, resc_name, bytes_free, bytes_total):
     """
@@ -2,9 +2,11 @@
 """Functions for revision strategies, which control which revisions are kept and which ones are to
    be discarded."""
 
-__copyright__ = 'Copyright (c) 2019-2023, Utrecht University'
+__copyright__ = 'Copyright (c) 2019-2024, Utrecht University'
 __license__   = 'GPLv3, see LICENSE'
 
+from bisect import bisect_right
+
 
 def get_revision_strategy(strategy_name):
     """Returns a revision strategy object for a particular revision strategy name. This
@@ -73,6 +75,14 @@ class RevisionStrategy(object):
         self._name = strategy_name
         self._buckets = buckets_configuration
 
+        # Cumulative timespans: bucket i covers ages [boundaries[i-1], boundaries[i])
+        # relative to the upper time bound, where boundaries[-1] is 0.
+        self._bucket_boundaries = []
+        timespan = 0
+        for bucket in buckets_configuration:
+            timespan += bucket[0]
+            self._bucket_boundaries.append(timespan)
+
     def get_name(self):
         return self._name
 
@@ -84,3 +94,37 @@ class RevisionStrategy(object):
 
     def get_total_bucket_timespan(self):
         return sum(map(lambda bucket_timespan_bucket_size_offset1: bucket_timespan_bucket_size_offset1[0], self.get_buckets()))
+
+    def get_bucket_boundaries(self):
+        return self._bucket_boundaries
+
+    def sort_into_buckets(self, revisions, upper_time_bound):
+        """Sorts revisions into the buckets of this strategy in a single pass.
+
+           Revisions keep their relative order within a bucket. Revisions that are newer than the
+           upper time bound do not belong to any bucket, and neither do revisions that fall exactly
+           on the lower bound of the last bucket.
+
+           :param revisions:        List of revisions. Each revision is represented by a 3-tuple
+                                    (revision ID, modification time in epoch time, original path)
+           :param upper_time_bound: Upper time bound of the first bucket
+
+           :returns: 2-tuple containing a list with the revision IDs of each bucket, and a list
+                     with the revision IDs of revisions that predate all buckets
+        """
+        boundaries = self._bucket_boundaries
+        total_timespan = boundaries[-1] if len(boundaries) > 0 else 0
+
+        bucket_revisions = [[] for _ in boundaries]
+        non_bucket_revisions = []
+
+        for revision in revisions:
+            age = upper_time_bound - revision[1]
+            if age < 0:
+                continue
+            elif age < total_timespan:
+                bucket_revisions[bisect_right(boundaries, age)].append(revision[0])
+            elif age > total_timespan:
+                non_bucket_revisions.append(revision[0])
+
+        return bucket_revisions, non_bucket_revisions
@@ -107,33 +107,10 @@ def get_deletion_candidates(ctx, revision_strategy, revisions, initial_upper_tim
     buckets = revision_strategy.get_buckets()
     deletion_candidates = []
 
-    # Set initial upper bound
-    t2 = initial_upper_time_bound
-
     # List of bucket index with per bucket a list of its revisions within that bucket
-    # [[data_ids0],[data_ids1]]
-    bucket_revisions = []
-    non_bucket_revisions = []
-    revision_found_in_bucket = False
-
-    # Sort revisions by bucket
-    for bucket in buckets:
-        t1 = t2
-        t2 = t1 - bucket[0]
-
-        revision_list = []
-        for revision in revisions:
-            if revision[1] <= t1 and revision[1] > t2:
-                # Link the bucket and the revision together so its clear which revisions belong into which bucket
-                revision_found_in_bucket = True
-                revision_list.append(revision[0])  # append data-id
-        # Link the collected data_ids (revision_ids) to the corresponding bucket
-        bucket_revisions.append(revision_list)
-
-    # Get revisions that predate all buckets
-    for revision in revisions:
-        if revision[1] < t2:
-            non_bucket_revisions.append(revision[0])
+    # [[data_ids0],[data_ids1]], and list of revisions that predate all buckets
+    bucket_revisions, non_bucket_revisions = revision_strategy.sort_into_buckets(revisions, initial_upper_time_bound)
+    revision_found_in_bucket = any(len(rev_list) > 0 for rev_list in bucket_revisions)
 
     # Per bucket find the revision candidates for deletion
     bucket_counter = 0
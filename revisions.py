@@ -5,6 +5,7 @@ __copyright__ = 'Copyright (c) 2019-2024, Utrecht University'
 __license__   = 'GPLv3, see LICENSE'
 
 import datetime
+import itertools
 import os
 import random
 import re
@@ -19,7 +20,7 @@ import groups
 from revision_strategies import get_revision_strategy
 from revision_utils import calculate_end_of_calendar_day, get_balance_id, get_deletion_candidates, get_resc, get_revision_store_path, revision_cleanup_prefilter, revision_eligible
 from util import *
-from util.spool import get_spool_data, has_spool_data, put_spool_data
+from util.spool import ack_spool_data, has_spool_data, lease_spool_data, nack_spool_data, put_spool_data
 
 __all__ = ['api_revisions_restore',
            'api_revisions_search_on_filename',
@@ -365,34 +366,43 @@ def rule_revision_batch(ctx, verbose, balance_id_min, balance_id_max, batch_size
         # This makes it easier to monitor the number of data objects waiting for revision creation.
         remove_revision_creation_avu_from_deleted_data_objects(ctx, print_verbose)
 
-        # Get list of up to batch size limit of data objects (in research space) scheduled for revision, taking into account
-        # modification time.
         log.write(ctx, "verbose = {}".format(verbose))
         if print_verbose:
             log.write(ctx, "async_revision_delay_time = {} seconds".format(config.async_revision_delay_time))
             log.write(ctx, "max_rss = {} bytes".format(config.async_revision_max_rss))
+            log.write(ctx, "chunk_size = {}".format(config.async_revision_chunk_size))
             log.write(ctx, "dry_run = {}".format(dry_run))
             show_memory_usage(ctx)
 
-        iter = list(genquery.Query(ctx,
-                    ['ORDER(DATA_ID)', 'COLL_NAME', 'DATA_NAME', 'META_DATA_ATTR_VALUE'],
-                    "META_DATA_ATTR_NAME = '{}' AND COLL_NAME like '/{}/home/{}%' AND DATA_MODIFY_TIME n<= '{}'".format(
-                        attr,
-                        user.zone(ctx),
-                        constants.IIGROUPPREFIX,
-                        minimum_timestamp),
-                    offset=0, limit=int(batch_size_limit), output=genquery.AS_LIST))
-        for row in iter:
-            # Stop further execution if admin has blocked revision process.
-            if is_revision_blocked_by_admin(ctx):
-                log.write(ctx, "Batch revision job is stopped")
-                break
-
-            # Check current memory usage and stop if it is above the limit.
-            if memory_limit_exceeded(config.async_revision_max_rss):
-                show_memory_usage(ctx)
-                log.write(ctx, "Memory used is now above specified limit of {} bytes, stopping further processing".format(config.async_revision_max_rss))
-                break
+        # Get data objects (in research space) scheduled for revision within the balance id range of this job,
+        # taking into account modification time. Data objects are queried in chunks ordered by data ID.
+        columns = ['COLL_NAME', 'DATA_NAME', 'META_DATA_ATTR_VALUE']
+        condition = "META_DATA_ATTR_NAME = '{}' AND COLL_NAME like '/{}/home/{}%' AND DATA_MODIFY_TIME n<= '{}'".format(
+            attr,
+            user.zone(ctx),
+            constants.IIGROUPPREFIX,
+            minimum_timestamp)
+        chunk_size = int(config.async_revision_chunk_size)
+
+        # Revision metadata created in v1.8 or earlier does not contain a balance id,
+        # so its balance id has to be determined based on the path of the data object.
+        legacy_rows = (row for row in batch.chunked_rows(ctx, columns, condition + " AND META_DATA_ATTR_VALUE not like '%,%'", chunk_size)
+                       if int(balance_id_min) <= get_balance_id(row, row[1] + "/" + row[2]) <= int(balance_id_max))
+        rows = batch.merge_rows([batch.balance_id_rows(ctx, columns, condition, balance_id_min, balance_id_max, chunk_size),
+                                 legacy_rows])
+
+        for row in itertools.islice(rows, int(batch_size_limit)):
+            # Check once per chunk whether the admin has blocked the revision process
+            # and whether memory usage is above the limit.
+            if count > 0 and count % chunk_size == 0:
+                if is_revision_blocked_by_admin(ctx):
+                    log.write(ctx, "Batch revision job is stopped")
+                    break
+
+                if memory_limit_exceeded(config.async_revision_max_rss):
+                    show_memory_usage(ctx)
+                    log.write(ctx, "Memory used is now above specified limit of {} bytes, stopping further processing".format(config.async_revision_max_rss))
+                    break
 
             # Perform scheduled revision creation for one data object.
             data_id = row[0]
@@ -400,14 +410,7 @@ def rule_revision_batch(ctx, verbose, balance_id_min, balance_id_max, batch_size
 
             # Metadata value contains resc and balance id for load balancing purposes.
             resc = get_resc(row)
-            balance_id = get_balance_id(row, path)
-
-            # Check whether balance id is within the range for this job.
-            if balance_id < int(balance_id_min) or balance_id > int(balance_id_max):
-                # Skip this one and go to the next data object for revision creation.
-                continue
 
-            # For getting the total count, only count the data objects within the wanted range
             count += 1
 
             # "No action" is meant for easier memory usage debugging.
@@ -840,12 +843,32 @@ def rule_revisions_cleanup_scan(ctx, revision_strategy_name, verbose_flag):
 
     log.write(ctx, 'Revision cleanup scan job starting.')
     verbose = verbose_flag == "1"
-    revisions_list = get_spool_data(constants.PROC_REVISION_CLEANUP_SCAN)
+    lease = lease_spool_data(constants.PROC_REVISION_CLEANUP_SCAN)
 
-    if revisions_list is None:
+    if lease is None:
         log.write(ctx, 'Revision cleanup scan job stopping - no more spooled revision scan data.')
         return "No more revision cleanup data"
 
+    lease_id, revisions_list = lease
+    try:
+        revision_cleanup_scan(ctx, revisions_list, revision_strategy_name, verbose)
+    except Exception:
+        nack_spool_data(constants.PROC_REVISION_CLEANUP_SCAN, lease_id)
+        raise
+    ack_spool_data(constants.PROC_REVISION_CLEANUP_SCAN, lease_id)
+
+    log.write(ctx, 'Revision cleanup scan job finished.')
+    return 'Revision store cleanup scan job completed'
+
+
+def revision_cleanup_scan(ctx, revisions_list, revision_strategy_name, verbose):
+    """Scan a batch of revisions and spool the versioned data objects that need processing
+
+       :param ctx:                    Combined type of a callback and rei struct
+       :param revisions_list:         List of revision data object IDs
+       :param revision_strategy_name: Select a revision strategy based on a string ('A', 'B', 'Simple')
+       :param verbose:                Whether to print additional information for troubleshooting (boolean)
+    """
     if verbose:
         log.write(ctx, "Number of revisions to scan: " + str(len(revisions_list)))
         log.write(ctx, "Scanning revisions: " + str(revisions_list))
@@ -857,18 +880,22 @@ def rule_revisions_cleanup_scan(ctx, revision_strategy_name, verbose_flag):
     if output_data_size > 0:
         if verbose:
             log.write(ctx, "Revision cleanup job scan spooling {} objects for processing.".format(str(output_data_size)))
-        put_spool_data(constants.PROC_REVISION_CLEANUP, [prefiltered_revision_data])
+        # Pass on whether the versioned data objects exist, so that the processing job does not need to check again.
+        put_spool_data(constants.PROC_REVISION_CLEANUP, [{
+            "revisions": prefiltered_revision_data,
+            "original_exists": [original_exists_dict[revisions[0][2]] for revisions in prefiltered_revision_data]}])
     else:
         if verbose:
             log.write(ctx, "Revision cleanup job scan - all data has been processed in prefilter stage. Processing not needed.")
 
-    log.write(ctx, 'Revision cleanup scan job finished.')
-    return 'Revision store cleanup scan job completed'
-
 
 def get_original_exists_dict(ctx, revision_data):
     """Returns a dictionary that indicates which original data objects of revision data still exist
 
+     The revision AVUs that refer to the versioned data objects are retrieved for the whole batch
+     at once, after which the existence of the versioned data objects is checked with one query
+     per original collection.
+
      :param ctx:                    Combined type of a callback and rei struct
      :param revision_data:          List of lists of revision tuples in (data_id, timestamp, revision_path) format
 
@@ -876,59 +903,94 @@ def get_original_exists_dict(ctx, revision_data):
                the versioned data object of the revision still exists. If the revision data object does not
                have AVUs that refer to the versioned data object, assume it still exists.
     """
-    result = {}
+    QUERY_BATCH_SIZE = 100
+    ORIGINAL_COLL_ATTRIBUTE = constants.UUORGMETADATAPREFIX + 'original_coll_name'
+    ORIGINAL_DATA_ATTRIBUTE = constants.UUORGMETADATAPREFIX + 'original_data_name'
+
+    revision_paths = {}
     for data_object_data in revision_data:
-        for (_data_id, _timestamp, revision_path) in data_object_data:
+        for (data_id, _timestamp, revision_path) in data_object_data:
+            revision_paths[str(data_id)] = revision_path
 
-            try:
-                result[revision_path] = versioned_data_object_exists(ctx, revision_path)
-            except (KeyError, UnicodeEncodeError):
-                # If we can't determine the original path (maybe because it doesn't exist
-                # or because of its encoding), we assume the original data object still exists,
-                # so that it is not automatically cleaned up by the revision cleanup job.
-                # An error is logged by versioned_data_object_exists
-                result[revision_path] = True
+    # Retrieve references to the versioned data objects in chunks of revisions.
+    ids = list(revision_paths.keys())
+    revision_avus = {}
+    while len(ids) > 0:
+        batch_id_string = "({})".format(",".join(map(lambda e: "'{}'".format(e), ids[:QUERY_BATCH_SIZE])))
+        ids = ids[QUERY_BATCH_SIZE:]
 
-    return result
+        iter = genquery.row_iterator(
+            "DATA_ID, META_DATA_ATTR_NAME, META_DATA_ATTR_VALUE",
+            "META_DATA_ATTR_NAME IN ('" + ORIGINAL_COLL_ATTRIBUTE + "', '" + ORIGINAL_DATA_ATTRIBUTE + "')"
+            " AND DATA_ID IN " + batch_id_string,
+            genquery.AS_LIST, ctx)
 
+        for row in iter:
+            revision_avus.setdefault(row[0], {})[row[1]] = row[2]
 
-def versioned_data_object_exists(ctx, revision_path):
-    """Checks whether the version data object of a revision still exists
+    # Group versioned data objects by collection.
+    originals = {}
+    original_names = {}
+    result = {}
+    for data_id, revision_path in revision_paths.items():
+        avu_dict = revision_avus.get(data_id, {})
+        try:
+            original = (avu_dict[ORIGINAL_COLL_ATTRIBUTE], avu_dict[ORIGINAL_DATA_ATTRIBUTE])
+        except KeyError:
+            # If we can't determine the original path, we assume the original data object
+            # still exists, so that it is not automatically cleaned up by the revision cleanup job.
+            log.write(ctx, "Error: could not find original data object for revision " + revision_path
+                           + " because revision does not have expected revision AVUs.")
+            result[revision_path] = True
+            continue
 
-     :param ctx:                    Combined type of a callback and rei struct
-     :param revision_path:          Logical path of revision data object
+        originals[revision_path] = original
+        original_names.setdefault(original[0], set()).add(original[1])
+
+    existing = set()
+    for coll_name, data_names in original_names.items():
+        existing.update(_existing_data_objects(ctx, coll_name, data_names, QUERY_BATCH_SIZE))
+
+    for revision_path, original in originals.items():
+        result[revision_path] = original in existing
+
+    return result
 
-     :returns: boolean value that indicates whether the versioned data object still
-               exists.
 
-     :raises KeyError:              If revision data object does not have revision AVUs
-                                    that point to versioned data object.
+def _existing_data_objects(ctx, coll_name, data_names, batch_size):
+    """Determines which of a set of data objects in a collection exist
 
-     :raises UnicodeEncodeError:    If the revision path cannot be converted to a utf-8 byte string.
+     :param ctx:        Combined type of a callback and rei struct
+     :param coll_name:  Collection name
+     :param data_names: Iterable of data object names in this collection
+     :param batch_size: Maximum number of data object names per query
+
+     :returns: Set of (collection name, data object name) tuples of existing data objects
     """
+    existing = set()
+
+    # Names that cannot be quoted in a query are checked one by one.
+    names = []
+    for data_name in data_names:
+        if "'" in data_name or "'" in coll_name:
+            if data_object.exists(ctx, os.path.join(coll_name, data_name)):
+                existing.add((coll_name, data_name))
+        else:
+            names.append(data_name)
 
-    if isinstance(revision_path, unicode):
-        try:
-            # Switch back to bytes for now
-            # TODO change logic in Python 3
-            revision_path = revision_path.encode('utf-8')
-        except UnicodeEncodeError:
-            log.write(ctx, "File path {} is not UTF-8 encoded or is not compatible with UTF-8 encoding".format(revision_path))
-            raise
+    while len(names) > 0:
+        batch_name_string = "({})".format(",".join(map(lambda e: "'{}'".format(e), names[:batch_size])))
+        names = names[batch_size:]
 
-    revision_avus = avu.of_data(ctx, revision_path)
-    avu_dict = {a: v for (a, v, u) in revision_avus}
+        iter = genquery.row_iterator(
+            "DATA_NAME",
+            "COLL_NAME = '{}' AND DATA_NAME IN {}".format(coll_name, batch_name_string),
+            genquery.AS_LIST, ctx)
 
-    try:
-        original_path = os.path.join(avu_dict["org_original_coll_name"],
-                                     avu_dict["org_original_data_name"])
-        return data_object.exists(ctx, original_path)
-    except KeyError:
-        # If we can't determine the original path, we assume the original data object
-        # still exists, so that it is not automatically cleaned up by the revision cleanup job.
-        log.write(ctx, "Error: could not find original data object for revision " + revision_path
-                       + " because revision does not have expected revision AVUs.")
-        raise
+        for row in iter:
+            existing.add((coll_name, row[0]))
+
+    return existing
 
 
 @rule.make(inputs=[0, 1, 2], outputs=[3])
@@ -953,12 +1015,42 @@ def rule_revisions_cleanup_process(ctx, revision_strategy_name, endOfCalendarDay
     log.write(ctx, 'Revision cleanup job processing starting.')
     verbose = verbose_flag == "1"
     _update_revision_store_acls(ctx)
-    revisions_list = get_spool_data(constants.PROC_REVISION_CLEANUP)
+    lease = lease_spool_data(constants.PROC_REVISION_CLEANUP)
 
-    if revisions_list is None:
+    if lease is None:
         log.write(ctx, 'Revision cleanup processing job stopping - no more spooled revision data.')
         return "No more revision cleanup data"
 
+    lease_id, spool_data = lease
+    try:
+        revision_cleanup_process(ctx, spool_data, revision_strategy_name, endOfCalendarDay, verbose)
+    except Exception:
+        nack_spool_data(constants.PROC_REVISION_CLEANUP, lease_id)
+        raise
+    ack_spool_data(constants.PROC_REVISION_CLEANUP, lease_id)
+
+    return 'Revision store cleanup processing job completed'
+
+
+def revision_cleanup_process(ctx, spool_data, revision_strategy_name, endOfCalendarDay, verbose):
+    """Applies the selected revision strategy to a batch of spooled revision data
+
+    :param ctx:                    Combined type of a callback and rei struct
+    :param spool_data:             Spooled revision data, as produced by the revision cleanup scan job
+    :param revision_strategy_name: Select a revision strategy based on a string ('A', 'B', 'Simple')
+    :param endOfCalendarDay:       If zero, system will determine end of current day in seconds since epoch (1970-01-01 00:00 UTC)
+    :param verbose:                Whether to print additional information for troubleshooting (boolean)
+    """
+    if isinstance(spool_data, dict):
+        revisions_list = spool_data["revisions"]
+        original_exists_list = spool_data["original_exists"]
+    else:
+        # Spool data without scan results (spooled by a previous version of the scan job).
+        revisions_list = spool_data
+        original_exists_dict = get_original_exists_dict(ctx, revisions_list)
+        original_exists_list = [original_exists_dict[revisions[0][2]] if len(revisions) > 0 else False
+                                for revisions in revisions_list]
+
     end_of_calendar_day = int(endOfCalendarDay)
     if end_of_calendar_day == 0:
         end_of_calendar_day = calculate_end_of_calendar_day()
@@ -969,11 +1061,10 @@ def rule_revisions_cleanup_process(ctx, revision_strategy_name, endOfCalendarDay
     num_candidates = 0
     num_errors = 0
 
-    for revisions in revisions_list:
+    for revisions, original_exists in zip(revisions_list, original_exists_list):
         if verbose:
             log.write(ctx, 'Processing revisions {} ...'.format(str(revisions)))
         # Process the original path conform the bucket settings
-        original_exists = versioned_data_object_exists(ctx, revisions[0][2]) if len(revisions) > 0 else False
         candidates = get_deletion_candidates(ctx, revision_strategy, revisions, end_of_calendar_day, original_exists, verbose)
         num_candidates += len(candidates)
 
@@ -997,7 +1088,6 @@ def rule_revisions_cleanup_process(ctx, revision_strategy_name, endOfCalendarDay
         str(len(revisions_list)),
         str(num_candidates - num_errors),
         str(num_errors)))
-    return 'Revision store cleanup processing job completed'
 
 
 def revision_remove(ctx, revision_id, revision_path):
@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 """Functions for finding the active schema."""
 
-__copyright__ = 'Copyright (c) 2018-2023, Utrecht University'
+__copyright__ = 'Copyright (c) 2018-2024, Utrecht University'
 __license__   = 'GPLv3, see LICENSE'
 
 import re
+import time
 
 import genquery
 
@@ -13,6 +14,43 @@ from util import *
 
 __all__ = ['api_schema_get_schemas']
 
+# Per-agent caches of group schema resolutions and parsed schema files.
+# Group resolutions expire after config.schema_cache_ttl seconds.
+# Cached schema files are revalidated against their checksum after that time.
+_schema_path_cache = {}  # (zone, group name) -> (expiry time, schema path)
+_schema_file_cache = {}  # schema file path -> (expiry time, fingerprint, parsed JSON)
+
+
+def clear_cache():
+    """Clear the schema caches of this agent."""
+    _schema_path_cache.clear()
+    _schema_file_cache.clear()
+
+
+def _read_schema_file(ctx, path):
+    """Read and parse a schema (or uischema) file, using the schema cache of this agent.
+
+    The returned object is shared between callers and must not be modified.
+
+    :param ctx:  Combined type of a callback and rei struct
+    :param path: Path of schema file
+
+    :returns: Schema object (parsed from JSON)
+    """
+    now = time.time()
+    cached = _schema_file_cache.get(path)
+    if cached is not None and cached[0] > now:
+        return cached[2]
+
+    fingerprint = data_object.fingerprint(ctx, path)
+    if cached is not None and cached[1] == fingerprint:
+        data = cached[2]
+    else:
+        data = jsonutil.read(ctx, path)
+
+    _schema_file_cache[path] = (now + config.schema_cache_ttl, fingerprint, data)
+    return data
+
 
 @api.make()
 def api_schema_get_schemas(ctx):
@@ -128,6 +166,11 @@ def get_active_schema_path(ctx, path):
     if group_name.startswith("datamanager-"):
         group_name = path_parts[4]
 
+    now = time.time()
+    cached = _schema_path_cache.get((rods_zone, group_name))
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
     if group_name.startswith("vault-"):
         schema_coll = get_schema_id_from_group(ctx, group_name)
         if schema_coll is None:
@@ -141,7 +184,10 @@ def get_active_schema_path(ctx, path):
     else:
         schema_coll = get_schema_collection(ctx, rods_zone, group_name)
 
-    return '/{}/yoda/schemas/{}/metadata.json'.format(rods_zone, schema_coll)
+    schema_path = '/{}/yoda/schemas/{}/metadata.json'.format(rods_zone, schema_coll)
+    _schema_path_cache[(rods_zone, group_name)] = (now + config.schema_cache_ttl, schema_path)
+
+    return schema_path
 
 
 def get_active_schema(ctx, path):
@@ -153,7 +199,7 @@ def get_active_schema(ctx, path):
 
     :returns: Schema object (parsed from JSON)
     """
-    return jsonutil.read(ctx, get_active_schema_path(ctx, path))
+    return _read_schema_file(ctx, get_active_schema_path(ctx, path))
 
 
 def get_active_schema_uischema(ctx, path):
@@ -168,8 +214,8 @@ def get_active_schema_uischema(ctx, path):
     schema_path   = get_active_schema_path(ctx, path)
     uischema_path = '{}/{}'.format(pathutil.chop(schema_path)[0], 'uischema.json')
 
-    return jsonutil.read(ctx, schema_path), \
-        jsonutil.read(ctx, uischema_path)
+    return _read_schema_file(ctx, schema_path), \
+        _read_schema_file(ctx, uischema_path)
 
 
 def get_active_schema_id(ctx, path):
@@ -220,4 +266,4 @@ def get_schema_by_id(ctx, path, schema_id):
     path = get_schema_path_by_id(ctx, path, schema_id)
     if path is None:
         return None
-    return jsonutil.read(ctx, path)
+    return _read_schema_file(ctx, path)
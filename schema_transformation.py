@@ -395,21 +395,16 @@ def rule_batch_vault_metadata_schema_report(ctx):
     results = {}
     schema_cache = {}
 
-    # Find all vault collections
+    # Find the metadata files of all vault collections
     iter = genquery.row_iterator(
-        "COLL_NAME",
-        "COLL_NAME like '/%s/home/vault-%%' AND COLL_NAME not like '%%/original' AND COLL_NAME NOT LIKE '%%/original/%%' AND DATA_NAME like 'yoda-metadata%%json'" %
+        "COLL_NAME, DATA_NAME",
+        "COLL_NAME like '/%s/home/vault-%%' AND COLL_NAME not like '%%/original' AND COLL_NAME NOT LIKE '%%/original/%%' AND DATA_NAME like 'yoda-metadata[%%].json'" %
         (user.zone(ctx)),
         genquery.AS_LIST, ctx)
 
-    for row in iter:
-        try:
-            coll_name = row[0]
-            result = meta.vault_metadata_matches_schema(ctx, coll_name, schema_cache, "Vault metadata schema report", True)
-            if result:
-                results[coll_name] = result
-        except Exception as e:
-            log.write(ctx, "Error processing collection {}: {}".format(coll_name, str(e)))
-            continue
+    # Validate all data packages in one batch. Packages that cannot be validated are logged.
+    packages = sorted(meta.latest_vault_metadata_paths(iter).items())
+    for coll_name, result in meta.vault_metadata_matches_schema_batch(ctx, packages, schema_cache, "Vault metadata schema report", True):
+        results[coll_name] = result
 
     return json.dumps(results)
@@ -7,7 +7,6 @@ __license__ = 'GPLv3, see LICENSE'
 import datetime
 import time
 
-import requests
 import session_vars
 
 import mail
@@ -49,7 +48,7 @@ def sram_post_collaboration(ctx, group_name, description):
     if config.sram_verbose_logging:
         log.write(ctx, "post {}: {}".format(url, payload))
 
-    response = requests.post(url, json=payload, headers=headers, timeout=30, verify=config.sram_tls_verify)
+    response = http_client.post('sram', url, json=payload, headers=headers, timeout=30, verify=config.sram_tls_verify)
     data = response.json()
 
     if config.sram_verbose_logging:
@@ -73,7 +72,7 @@ def sram_get_uid(ctx, co_identifier, user_name):
     if config.sram_verbose_logging:
         log.write(ctx, "get {}".format(url))
 
-    response = requests.get(url, headers=headers, timeout=30, verify=config.sram_tls_verify)
+    response = http_client.get('sram', url, headers=headers, timeout=30, verify=config.sram_tls_verify)
     data = response.json()
 
     if config.sram_verbose_logging:
@@ -106,7 +105,7 @@ def sram_delete_collaboration(ctx, co_identifier):
     if config.sram_verbose_logging:
         log.write(ctx, "post {}".format(url))
 
-    response = requests.delete(url, headers=headers, timeout=30, verify=config.sram_tls_verify)
+    response = http_client.delete('sram', url, headers=headers, timeout=30, verify=config.sram_tls_verify)
 
     if config.sram_verbose_logging:
         log.write(ctx, "response: {}".format(response.status_code))
@@ -129,7 +128,7 @@ def sram_delete_collaboration_membership(ctx, co_identifier, uuid):
     if config.sram_verbose_logging:
         log.write(ctx, "post {}".format(url))
 
-    response = requests.delete(url, headers=headers, timeout=30, verify=config.sram_tls_verify)
+    response = http_client.delete('sram', url, headers=headers, timeout=30, verify=config.sram_tls_verify)
 
     if config.sram_verbose_logging:
         log.write(ctx, "response: {}".format(response.status_code))
@@ -173,7 +172,7 @@ def sram_put_collaboration_invitation(ctx, group_name, username, co_identifier):
     if config.sram_verbose_logging:
         log.write(ctx, "put {}: {}".format(url, payload))
 
-    response = requests.put(url, json=payload, headers=headers, timeout=30, verify=config.sram_tls_verify)
+    response = http_client.put('sram', url, json=payload, headers=headers, timeout=30, verify=config.sram_tls_verify)
 
     if config.sram_verbose_logging:
         log.write(ctx, "response: {}".format(response.status_code))
@@ -201,7 +200,7 @@ def sram_connect_service_collaboration(ctx, short_name):
     if config.sram_verbose_logging:
         log.write(ctx, "put {}: {}".format(url, payload))
 
-    response = requests.put(url, json=payload, headers=headers, timeout=30, verify=config.sram_tls_verify)
+    response = http_client.put('sram', url, json=payload, headers=headers, timeout=30, verify=config.sram_tls_verify)
 
     if config.sram_verbose_logging:
         log.write(ctx, "response: {}".format(response.status_code))
@@ -262,7 +261,7 @@ def sram_update_collaboration_membership(ctx, co_identifier, uuid, new_role):
     if config.sram_verbose_logging:
         log.write(ctx, "put {}".format(url))
 
-    response = requests.put(url, json=payload, headers=headers, timeout=30, verify=config.sram_tls_verify)
+    response = http_client.put('sram', url, json=payload, headers=headers, timeout=30, verify=config.sram_tls_verify)
 
     if config.sram_verbose_logging:
         log.write(ctx, "response: {}".format(response.status_code))
@@ -284,7 +283,7 @@ def sram_get_co_members(ctx, co_identifier):
     if config.sram_verbose_logging:
         log.write(ctx, "get {}".format(url))
 
-    response = requests.get(url, headers=headers, timeout=30, verify=config.sram_tls_verify)
+    response = http_client.get('sram', url, headers=headers, timeout=30, verify=config.sram_tls_verify)
     data = response.json()
 
     if config.sram_verbose_logging:
@@ -12,6 +12,13 @@ Feature: Notifications API
             | asc        |
 
 
+    Scenario: Notifications load with pagination
+        Given user researcher is authenticated
+        And the Yoda notifications load API is queried with offset 0 and limit 1
+        Then the response status code is "200"
+        And at most 1 notification is returned
+
+
     Scenario Outline: Notifications dismiss all
         Given user researcher is authenticated
         And the Yoda notifications dismiss all API is queried
@@ -8,6 +8,7 @@ from pytest_bdd import (
     given,
     parsers,
     scenarios,
+    then,
 )
 
 from conftest import api_request
@@ -24,6 +25,21 @@ def api_notifications_load(user, sort_order):
     )
 
 
+@given(parsers.parse("the Yoda notifications load API is queried with offset {offset:d} and limit {limit:d}"), target_fixture="api_response")
+def api_notifications_load_page(user, offset, limit):
+    return api_request(
+        user,
+        "notifications_load",
+        {"offset": offset, "limit": limit}
+    )
+
+
+@then(parsers.parse("at most {limit:d} notification is returned"))
+def notifications_limit(api_response, limit):
+    _, body = api_response
+    assert len(body["data"]) <= limit
+
+
 @given('the Yoda notifications dismiss all API is queried', target_fixture="api_response")
 def api_notifications_dismiss_all(user):
     return api_request(
@@ -16,6 +16,7 @@ import atexit
 # When created or modified data objects are given a random balance id between 1-64.
 # This script can be run to handle replications or revisions within a range that is passed to the script.
 # Making it possible to have multiple replication/revision processes running in parallel where each process covers its own range.
+# With --workers the range is split up, and a batch job is started for each part of the range in parallel.
 
 NAME          = os.path.basename(sys.argv[0])
 
@@ -33,9 +34,23 @@ def get_args():
                         help='Maximum number of items to be processed per batch job')
     parser.add_argument('--dry-run', '-n', action='store_const', default="0", const="1",
                         help='Perform a trial run for troubleshooting purposes')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of batch jobs to run in parallel, each handling a part of the balance id range')
     return parser.parse_args()
 
 
+def balance_id_ranges(balance_id_min, balance_id_max, workers):
+    """Split a balance id range into at most the given number of consecutive ranges of (nearly) equal size"""
+    size = balance_id_max - balance_id_min + 1
+    workers = max(1, min(workers, size))
+    ranges = []
+    for i in range(workers):
+        start = balance_id_min + (i * size) // workers
+        end = balance_id_min + ((i + 1) * size) // workers - 1
+        ranges.append((start, end))
+    return ranges
+
+
 def lock_or_die(balance_id_min, balance_id_max):
     """Prevent running multiple instances of this job simultaneously.
        Incorporate the balance_id_min, balance_id_max in the name of the lockfile so it will only lock the corresponding range.
@@ -68,6 +83,13 @@ else:
 
 args = get_args()
 lock_or_die(args.balance_id_min, args.balance_id_max)
-rule_options = "*verbose={}%*balance_id_min={}%*balance_id_max={}%*batch_size_limit={}%*dry_run={}".format(args.verbose, args.balance_id_min, args.balance_id_max, args.batch_size_limit, args.dry_run)
-subprocess.call(['irule', '-r', 'irods_rule_engine_plugin-irods_rule_language-instance',
-                rule_name, rule_options, 'ruleExecOut'])
+
+# Each batch job runs in its own agent, so the batch jobs process their ranges concurrently.
+jobs = []
+for balance_id_min, balance_id_max in balance_id_ranges(args.balance_id_min, args.balance_id_max, args.workers):
+    rule_options = "*verbose={}%*balance_id_min={}%*balance_id_max={}%*batch_size_limit={}%*dry_run={}".format(args.verbose, balance_id_min, balance_id_max, args.batch_size_limit, args.dry_run)
+    jobs.append(subprocess.Popen(['irule', '-r', 'irods_rule_engine_plugin-irods_rule_language-instance',
+                                  rule_name, rule_options, 'ruleExecOut']))
+
+for job in jobs:
+    job.wait()
@@ -0,0 +1,36 @@
+#!/usr/bin/irule -r irods_rule_engine_plugin-python-instance -F
+#
+# Compares the row-streaming and catalog-side aggregate implementations of
+# the collection statistics (data count, size and collection count).
+#
+# Usage: irule -r irods_rule_engine_plugin-python-instance -F benchmark-collection-statistics.r \
+#        '*path="/tempZone/home/research-initial"' '*iterations=5'
+#
+import time
+
+from rules_uu.util import collection
+
+
+def measure(func, callback, path, iterations):
+    start = time.time()
+    for _ in range(iterations):
+        result = func(callback, path)
+    return result, (time.time() - start) / iterations
+
+
+def main(rule_args, callback, rei):
+    path = global_vars["*path"].strip('"')
+    iterations = int(global_vars["*iterations"].strip('"'))
+
+    callback.writeLine("stdout", "{:<24} {:>10} {:>24} {:>14}".format("statistic", "mode", "result", "time (ms)"))
+    for name, modes in [("data count and size", [("rows", collection._data_stats_rows),
+                                                 ("aggregate", collection._data_stats_aggregate)]),
+                        ("collection count", [("rows", collection._collection_count_rows),
+                                              ("aggregate", collection._collection_count_aggregate)])]:
+        for mode, func in modes:
+            result, duration = measure(func, callback, path, iterations)
+            callback.writeLine("stdout", "{:<24} {:>10} {:>24} {:>14.1f}".format(name, mode, str(result), 1000.0 * duration))
+
+
+INPUT *path="/tempZone/home/research-initial", *iterations=5
+OUTPUT ruleExecOut
@@ -0,0 +1,45 @@
+#!/usr/bin/irule -r irods_rule_engine_plugin-python-instance -F
+#
+# Measures landing page rendering of a corpus of combi JSON files (e.g. of earlier publications),
+# with and without the landing page template cache.
+#
+# Usage: irule -r irods_rule_engine_plugin-python-instance -F benchmark-landing-pages.r \
+#        '*coll="/tempZone/yoda/publication"' '*template="landingpage.html.j2"'
+#
+import time
+
+import genquery
+
+from rules_uu import json_landing_page, meta, schema
+from rules_uu.util import jsonutil, user
+
+
+def main(rule_args, callback, rei):
+    coll = global_vars["*coll"].strip('"')
+    template = global_vars["*template"].strip('"')
+    zone = user.zone(callback)
+
+    corpus = []
+    for row in genquery.row_iterator("COLL_NAME, DATA_NAME",
+                                     "COLL_NAME = '{}' AND DATA_NAME like '%-combi.json'".format(coll),
+                                     genquery.AS_LIST, callback):
+        path = row[0] + "/" + row[1]
+        metadata_schema = schema.get_schema_by_id(callback, "/{}/home".format(zone), meta.metadata_get_schema_id(jsonutil.read(callback, path)))
+        if metadata_schema is not None:
+            corpus.append((path, metadata_schema))
+
+    callback.writeLine("stdout", "{} combi JSON files".format(len(corpus)))
+    callback.writeLine("stdout", "{:<10} {:>16}".format("mode", "pages/second"))
+    for mode in ["uncached", "cached"]:
+        json_landing_page.clear_cache()
+        start = time.time()
+        for path, metadata_schema in corpus:
+            if mode == "uncached":
+                json_landing_page.clear_cache()
+            json_landing_page.json_landing_page_create_json_landing_page(callback, zone, template, path, metadata_schema, "", [])
+        duration = time.time() - start
+        callback.writeLine("stdout", "{:<10} {:>16.1f}".format(mode, len(corpus) / duration if duration > 0 else 0))
+
+
+INPUT *coll="/tempZone/yoda/publication", *template="landingpage.html.j2"
+OUTPUT ruleExecOut
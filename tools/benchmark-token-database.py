@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""This script measures the number of data access token logins per second, with a new connection
+   to the token database per login and with a cached connection (as used by the ruleset).
+
+   It uses a temporary token database, so it does not need access to the token database of Yoda.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def exit_with_error(message):
+    print(message, file=sys.stderr)
+    sys.exit(1)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-u", "--users", type=int, default=1000,
+                        help="Number of users with tokens in the temporary token database")
+    parser.add_argument("-t", "--tokens", type=int, default=5,
+                        help="Number of tokens per user")
+    parser.add_argument("-l", "--logins", type=int, default=200,
+                        help="Number of logins to measure per mode")
+    return parser.parse_args()
+
+
+def connect(sqlite3, database, password, cached):
+    conn = sqlite3.connect(database)
+    conn.execute("PRAGMA key='%s'" % (password))
+    if cached:
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            conn.execute("CREATE INDEX IF NOT EXISTS tokens_user_exp_time ON tokens (user, exp_time)")
+    return conn
+
+
+def login(conn, user, token):
+    with conn:
+        for row in conn.execute("SELECT token FROM tokens WHERE user = ? AND exp_time > ?", (user, datetime.now())):
+            if row[0] == token:
+                return True
+    return False
+
+
+def create_database(sqlite3, database, password, users, tokens):
+    conn = connect(sqlite3, database, password, False)
+    with conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS tokens (user TEXT NOT NULL, label TEXT NOT NULL, token TEXT NOT NULL, "
+                     "gen_time INTEGER, exp_time INTEGER, UNIQUE (user, label) ON CONFLICT ABORT)")
+        now = datetime.now()
+        conn.executemany("INSERT INTO tokens VALUES (?, ?, ?, ?, ?)",
+                         (("user{}".format(u), "label{}".format(t), "token{}-{}".format(u, t), now, now + timedelta(hours=72))
+                          for u in range(users) for t in range(tokens)))
+    conn.close()
+
+
+def main():
+    args = get_args()
+
+    try:
+        from pysqlcipher3 import dbapi2 as sqlite3
+    except ImportError:
+        exit_with_error("Error: pysqlcipher3 not available. It should have been installed by the Yoda playbook.")
+
+    directory = tempfile.mkdtemp()
+    try:
+        database = os.path.join(directory, "tokens.db")
+        password = "benchmark"
+        create_database(sqlite3, database, password, args.users, args.tokens)
+        logins = [("user{}".format(i % args.users), "token{}-0".format(i % args.users)) for i in range(args.logins)]
+
+        start = time.time()
+        for user, token in logins:
+            conn = connect(sqlite3, database, password, False)
+            assert login(conn, user, token)
+            conn.close()
+        uncached = time.time() - start
+
+        start = time.time()
+        conn = connect(sqlite3, database, password, True)
+        for user, token in logins:
+            assert login(conn, user, token)
+        conn.close()
+        cached = time.time() - start
+
+        print("{:<24} {:>14}".format("mode", "logins/second"))
+        print("{:<24} {:>14.1f}".format("connection per login", args.logins / uncached))
+        print("{:<24} {:>14.1f}".format("cached connection", args.logins / cached))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
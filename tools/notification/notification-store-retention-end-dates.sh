@@ -0,0 +1,2 @@
+#!/bin/bash
+irule -r irods_rule_engine_plugin-python-instance rule_process_retention_end_dates "null" "null"
@@ -1,5 +1,10 @@
 #!/usr/bin/env python
-"""This script cleans up data object revisions, by invoking the revision cleanup rules."""
+"""This script cleans up data object revisions, by invoking the revision cleanup rules.
+
+Revisions are collected once, after which a number of scan workers and process workers
+run concurrently. Each worker takes batches from the spool queue of its stage; a batch
+(and therefore each versioned data object) is only handed out to a single worker.
+"""
 
 import argparse
 import atexit
@@ -7,6 +12,8 @@ from datetime import datetime
 import os
 import subprocess
 import sys
+import threading
+import time
 
 NAME                = os.path.basename(sys.argv[0])
 LOCKFILE_PATH       = '/tmp/irods-{}.lock'.format(NAME)
@@ -19,6 +26,10 @@ def get_args():
     parser.add_argument("strategyname",  choices=["A", "B", "Simple"], help="Revision strategy name (also referred to as 'bucket case')")
     parser.add_argument("--batch-size", type=int, default=10000,
                         help="Number of revisions to process at a time (default: 10000).", required=False)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of concurrent scan workers and of concurrent process workers (default: 1).", required=False)
+    parser.add_argument("--poll-interval", type=int, default=10,
+                        help="Seconds for idle process workers to wait for new scan results (default: 10).", required=False)
     parser.add_argument("-v", "--verbose", action="store_true", default=False,
                         help="Make the revision cleanup rules print additional information for troubleshooting purposes.")
     return parser.parse_args()
@@ -45,17 +56,21 @@ def lock_or_die():
 
 def process_revision_cleanup_data(strategy_name, endofcalendarday, verbose_flag):
     rule = "rule_revisions_cleanup_process('{}', '{}', '{}', *out);".format(strategy_name, endofcalendarday, verbose_flag)
-    return subprocess.check_output(_rule_command_for_rule(rule))
+    return _run_rule(rule)
 
 
 def scan_revision_cleanup_data(strategy_name, verbose_flag):
     rule = "rule_revisions_cleanup_scan('{}', '{}', *out);".format(strategy_name, verbose_flag)
-    return subprocess.check_output(_rule_command_for_rule(rule))
+    return _run_rule(rule)
 
 
 def collect_revision_cleanup_data(batch_size):
     rule = "rule_revisions_cleanup_collect('{}', *out);".format(str(batch_size))
-    return subprocess.check_output(_rule_command_for_rule(rule))
+    return _run_rule(rule)
+
+
+def _run_rule(rule_text):
+    return subprocess.check_output(_rule_command_for_rule(rule_text)).decode("utf-8").strip()
 
 
 def _rule_command_for_rule(rule_text):
@@ -69,6 +84,73 @@ def _rule_command_for_rule(rule_text):
     ])
 
 
+class Progress(object):
+    """Keeps track of the number of batches handled per stage, shared by all workers."""
+
+    def __init__(self, verbose):
+        self._lock = threading.Lock()
+        self._verbose = verbose
+        self._start = time.time()
+        self.batches = {"scan": 0, "process": 0}
+        self.errors = []
+
+    def batch_done(self, stage):
+        with self._lock:
+            self.batches[stage] += 1
+            if self._verbose:
+                self.report()
+
+    def error(self, worker_name, exception):
+        with self._lock:
+            self.errors.append((worker_name, exception))
+            print('{} failed at {}: {}'.format(worker_name, str(datetime.now()), str(exception)))
+
+    def report(self):
+        print('{}: {} scan batches and {} process batches done in {:.0f} seconds'.format(
+            str(datetime.now()), self.batches["scan"], self.batches["process"], time.time() - self._start))
+
+
+def scan_worker(args, progress):
+    """Scans spooled revision batches until the scan spool is empty."""
+    while scan_revision_cleanup_data(args.strategyname, "1" if args.verbose else "0") != NO_MORE_WORK_STATUS:
+        progress.batch_done("scan")
+
+
+def process_worker(args, progress, scanning_done):
+    """Processes spooled revision batches until the process spool is empty and all scan workers are done."""
+    while True:
+        # Check whether scanning is done before looking at the spool, so that no batches
+        # spooled by the last scan are missed.
+        last_round = scanning_done.is_set()
+        status = process_revision_cleanup_data(
+            args.strategyname,
+            args.endofcalendarday,
+            "1" if args.verbose else "0")
+
+        if status != NO_MORE_WORK_STATUS:
+            progress.batch_done("process")
+        elif last_round:
+            return
+        else:
+            scanning_done.wait(args.poll_interval)
+
+
+def start_workers(name, count, target, progress, *target_args):
+    def run(worker_name):
+        try:
+            target(*target_args)
+        except Exception as e:
+            progress.error(worker_name, e)
+
+    workers = []
+    for i in range(count):
+        worker = threading.Thread(target=run, args=('{} worker {}'.format(name, i + 1),))
+        worker.daemon = True
+        worker.start()
+        workers.append(worker)
+    return workers
+
+
 def main():
     args = get_args()
     lock_or_die()
@@ -78,17 +160,26 @@ def main():
 
     collect_revision_cleanup_data(args.batch_size)
 
-    (scan_status, process_status) = ("INITIAL", "INITIAL")
-    while scan_status != NO_MORE_WORK_STATUS or process_status != NO_MORE_WORK_STATUS:
-        scan_status = scan_revision_cleanup_data(args.strategyname, "1" if args.verbose else "0")
-        process_status = process_revision_cleanup_data(
-            args.strategyname,
-            args.endofcalendarday,
-            "1" if args.verbose else "0")
+    progress = Progress(args.verbose)
+    scanning_done = threading.Event()
+    workers = max(1, args.workers)
+
+    scan_workers = start_workers("Scan", workers, scan_worker, progress, args, progress)
+    process_workers = start_workers("Process", workers, process_worker, progress, args, progress, scanning_done)
+
+    for worker in scan_workers:
+        worker.join()
+    scanning_done.set()
+    for worker in process_workers:
+        worker.join()
 
     if args.verbose:
+        progress.report()
         print('END cleaning up revision store at ' + str(datetime.now()))
 
+    if len(progress.errors) > 0:
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
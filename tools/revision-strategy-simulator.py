@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""This script simulates the effect of a revision strategy on a snapshot of the revision store,
+without removing any revisions.
+
+First export a snapshot of the revision store (as a rodsadmin user):
+
+    revision-strategy-simulator.py export tempZone snapshot.csv
+
+Then simulate one of the revision strategies ("A", "B", "Simple"), or a custom bucket
+configuration in a JSON file with a list of [timespan in seconds, bucket size, start index]
+buckets:
+
+    revision-strategy-simulator.py simulate snapshot.csv --strategy B
+    revision-strategy-simulator.py simulate snapshot.csv --buckets buckets.json
+
+The simulation applies the same rules as get_deletion_candidates in the revision cleanup
+jobs, vectorized with NumPy, so that snapshots with millions of revisions can be simulated
+in seconds. Use --verify to compare the results for a sample of versioned data objects with
+get_deletion_candidates itself.
+
+This script requires Python 3 with NumPy. It does not need to run on the iRODS server.
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import unittest  # noqa: F401 Limits the util imports of the ruleset to those usable outside iRODS.
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'util'))
+
+from revision_strategies import get_revision_strategy, RevisionStrategy  # noqa: E402
+from revision_utils import calculate_end_of_calendar_day, get_deletion_candidates  # noqa: E402
+
+SNAPSHOT_COLUMNS = ["original_path", "revision_id", "modify_time", "size", "original_exists"]
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    export_parser = subparsers.add_parser("export", help="Export a snapshot of the revision store")
+    export_parser.add_argument("zone", help="Zone name")
+    export_parser.add_argument("snapshot", help="Snapshot file to write (CSV)")
+    export_parser.add_argument("--assume-originals-exist", action="store_true", default=False,
+                               help="Do not check whether the versioned data objects still exist.")
+
+    simulate_parser = subparsers.add_parser("simulate", help="Simulate a revision strategy on a snapshot")
+    simulate_parser.add_argument("snapshot", help="Snapshot file (CSV)")
+    strategy_group = simulate_parser.add_mutually_exclusive_group(required=True)
+    strategy_group.add_argument("--strategy", choices=["A", "B", "Simple"], help="Revision strategy name")
+    strategy_group.add_argument("--buckets", help="JSON file with custom bucket configuration")
+    simulate_parser.add_argument("--end-of-calendar-day", type=int, default=0,
+                                 help="End of calendar day (epoch time, default: end of today)")
+    simulate_parser.add_argument("--verify", type=int, default=0, metavar="N",
+                                 help="Compare results for N random versioned data objects with get_deletion_candidates.")
+    simulate_parser.add_argument("--json", action="store_true", default=False,
+                                 help="Print the report as JSON.")
+    return parser.parse_args()
+
+
+def _iquest(query):
+    """Runs a query with iquest, and returns the tab-separated columns of the result rows."""
+    columns = query.split(" WHERE ")[0].count(",") + 1
+    output = subprocess.check_output(["iquest", "--no-page", "\t".join(["%s"] * columns) + "\n", query]).decode("utf-8")
+    if "CAT_NO_ROWS_FOUND" in output:
+        return []
+    return [line.split("\t", columns - 1) for line in output.splitlines() if line != ""]
+
+
+def export_snapshot(zone, snapshot, assume_originals_exist):
+    revision_store = "/{}/yoda/revisions".format(zone)
+
+    revisions = {}
+    for data_id, data_size, original_path in _iquest(
+            "SELECT DATA_ID, DATA_SIZE, META_DATA_ATTR_VALUE WHERE META_DATA_ATTR_NAME = 'org_original_path'"
+            " AND COLL_NAME like '{}/%'".format(revision_store)):
+        revisions[data_id] = [original_path, data_id, None, data_size]
+
+    for data_id, modify_time in _iquest(
+            "SELECT DATA_ID, META_DATA_ATTR_VALUE WHERE META_DATA_ATTR_NAME = 'org_original_modify_time'"
+            " AND COLL_NAME like '{}/%'".format(revision_store)):
+        if data_id in revisions:
+            revisions[data_id][2] = modify_time
+
+    if assume_originals_exist:
+        existing = None
+    else:
+        existing = set(coll_name + "/" + data_name
+                       for coll_name, data_name in _iquest("SELECT COLL_NAME, DATA_NAME WHERE COLL_NAME like '/{}/home/%'".format(zone)))
+
+    with open(snapshot, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(SNAPSHOT_COLUMNS)
+        for original_path, data_id, modify_time, data_size in revisions.values():
+            # The cleanup jobs skip revisions without a modification time as well.
+            if modify_time is not None:
+                writer.writerow([original_path, data_id, modify_time, data_size,
+                                 1 if existing is None or original_path in existing else 0])
+
+    print("Exported {} revisions to {}".format(len(revisions), snapshot))
+
+
+class Snapshot(object):
+    """Revisions of a snapshot as arrays, ordered like the revision cleanup jobs order them:
+       grouped per versioned data object, newest revision ID first."""
+
+    def __init__(self, filename):
+        with open(filename, newline="") as f:
+            rows = list(csv.DictReader(f))
+
+        paths, objects = np.unique([row["original_path"] for row in rows], return_inverse=True)
+        revision_ids = np.array([int(row["revision_id"]) for row in rows], dtype=np.int64)
+        order = np.lexsort((-revision_ids, objects))
+
+        self.paths = paths
+        self.objects = objects[order]
+        self.revision_ids = revision_ids[order]
+        self.modify_times = np.array([int(row["modify_time"]) for row in rows], dtype=np.int64)[order]
+        self.sizes = np.array([int(row["size"]) for row in rows], dtype=np.int64)[order]
+        self.original_exists = np.array([row["original_exists"] == "1" for row in rows], dtype=bool)[order]
+
+    def revisions_of(self, object_index):
+        """Returns the revisions of a versioned data object in the format used by get_deletion_candidates."""
+        rows = np.nonzero(self.objects == object_index)[0]
+        return ([(int(self.revision_ids[i]), int(self.modify_times[i]), self.paths[object_index]) for i in rows],
+                bool(self.original_exists[rows[0]]))
+
+
+def _ranks_in_groups(keys):
+    """Returns the rank of each element within its group of consecutive equal keys, and the group size."""
+    n = len(keys)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    starts = np.concatenate(([True], keys[1:] != keys[:-1]))
+    start_indices = np.nonzero(starts)[0]
+    group_of_element = np.cumsum(starts) - 1
+    group_sizes = np.diff(np.append(start_indices, n))
+    return np.arange(n) - start_indices[group_of_element], group_sizes[group_of_element]
+
+
+def simulate(snapshot, revision_strategy, upper_time_bound):
+    """Determines which revisions of a snapshot would be removed by a revision strategy.
+
+    :param snapshot:          Snapshot of the revision store
+    :param revision_strategy: Revision strategy object
+    :param upper_time_bound:  Upper time bound of the first bucket
+
+    :returns: Tuple of boolean arrays with removed revisions: because the original no longer exists,
+              because of bucket sizes, and because they are older than all buckets
+    """
+    buckets = revision_strategy.get_buckets()
+    boundaries = np.array(revision_strategy.get_bucket_boundaries(), dtype=np.int64)
+    total_timespan = boundaries[-1] if len(boundaries) > 0 else 0
+    objects = snapshot.objects
+    exists = snapshot.original_exists
+
+    # Revisions of versioned data objects that no longer exist are all removed.
+    removed_original = ~exists
+
+    age = upper_time_bound - snapshot.modify_times
+    in_bucket = exists & (age >= 0) & (age < total_timespan)
+    older_than_buckets = exists & (age > total_timespan)
+
+    # Revisions per bucket: the bucket size and start index determine which ones are removed.
+    removed_bucket = np.zeros(len(objects), dtype=bool)
+    rows = np.nonzero(in_bucket)[0]
+    bucket = np.searchsorted(boundaries, age[rows], side="right")
+    order = np.lexsort((rows, bucket, objects[rows]))
+    rows, bucket = rows[order], bucket[order]
+    rank, count = _ranks_in_groups(objects[rows] * (len(buckets) + 1) + bucket)
+    max_size = np.array([b[1] for b in buckets], dtype=np.int64)[bucket]
+    start = np.array([b[2] for b in buckets], dtype=np.int64)[bucket]
+    nr_to_be_removed = count - max_size
+
+    # Start index >= 0: remove [start, start + n). Otherwise remove indexes
+    # len + start - n + 1 up to len + start, where negative indexes count from the end.
+    lowest = np.where(start >= 0, start, count + start - nr_to_be_removed + 1)
+    highest = np.where(start >= 0, start + nr_to_be_removed - 1, count + start)
+    removed = (nr_to_be_removed > 0) & (((rank >= lowest) & (rank <= highest))
+                                        | ((start < 0) & (rank - count >= lowest) & (rank - count <= highest)))
+    removed_bucket[rows[removed]] = True
+
+    # Revisions older than all buckets are removed, except for the newest one if the
+    # versioned data object has no revisions in buckets.
+    object_has_bucket_revisions = np.zeros(len(snapshot.paths), dtype=bool)
+    object_has_bucket_revisions[objects[in_bucket]] = True
+    rows = np.nonzero(older_than_buckets)[0]
+    rank, _ = _ranks_in_groups(objects[rows])
+    removed_older = np.zeros(len(objects), dtype=bool)
+    removed_older[rows[object_has_bucket_revisions[objects[rows]] | (rank >= 1)]] = True
+
+    return removed_original, removed_bucket, removed_older
+
+
+def load_strategy(args):
+    if args.strategy:
+        return get_revision_strategy(args.strategy)
+
+    with open(args.buckets) as f:
+        buckets = json.load(f)
+
+    for bucket in buckets:
+        if len(bucket) != 3 or bucket[0] <= 0 or bucket[1] < 0:
+            sys.exit("Invalid bucket {}: expected [timespan in seconds, bucket size, start index].".format(bucket))
+        if bucket[2] > bucket[1]:
+            # get_deletion_candidates would index past the end of the bucket.
+            sys.exit("Invalid bucket {}: start index cannot be larger than bucket size.".format(bucket))
+
+    return RevisionStrategy("custom", buckets)
+
+
+def verify(snapshot, revision_strategy, upper_time_bound, removed, sample_size):
+    """Compares simulation results with get_deletion_candidates for a sample of versioned data objects.
+
+    :returns: Number of versioned data objects with different results
+    """
+    mismatches = 0
+    object_indexes = random.sample(range(len(snapshot.paths)), min(sample_size, len(snapshot.paths)))
+    for object_index in object_indexes:
+        revisions, original_exists = snapshot.revisions_of(object_index)
+        expected = set(get_deletion_candidates(None, revision_strategy, revisions, upper_time_bound, original_exists, False))
+        rows = np.nonzero(snapshot.objects == object_index)[0]
+        actual = set(int(revision_id) for revision_id in snapshot.revision_ids[rows[removed[rows]]])
+        if expected != actual:
+            mismatches += 1
+            print("Mismatch for {}: expected {}, simulated {}".format(snapshot.paths[object_index], sorted(expected), sorted(actual)))
+
+    return mismatches
+
+
+def main():
+    args = get_args()
+
+    if args.command == "export":
+        export_snapshot(args.zone, args.snapshot, args.assume_originals_exist)
+        return
+
+    revision_strategy = load_strategy(args)
+    upper_time_bound = args.end_of_calendar_day or calculate_end_of_calendar_day()
+    snapshot = Snapshot(args.snapshot)
+    removed_original, removed_bucket, removed_older = simulate(snapshot, revision_strategy, upper_time_bound)
+    removed = removed_original | removed_bucket | removed_older
+
+    report = {
+        "strategy": revision_strategy.get_name(),
+        "end_of_calendar_day": upper_time_bound,
+        "versioned_objects": len(snapshot.paths),
+        "revisions": int(len(snapshot.objects)),
+        "revision_bytes": int(snapshot.sizes.sum()),
+        "removed_revisions": int(removed.sum()),
+        "removed_bytes": int(snapshot.sizes[removed].sum()),
+        "affected_versioned_objects": int(len(np.unique(snapshot.objects[removed]))),
+        "removed_revisions_original_removed": int(removed_original.sum()),
+        "removed_revisions_bucket_full": int(removed_bucket.sum()),
+        "removed_revisions_older_than_buckets": int(removed_older.sum()),
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        for key, value in report.items():
+            print("{:<40} {}".format(key, value))
+
+    if args.verify > 0:
+        mismatches = verify(snapshot, revision_strategy, upper_time_bound, removed, args.verify)
+        print("Verified {} versioned data objects with get_deletion_candidates: {} mismatches".format(
+            min(args.verify, len(snapshot.paths)), mismatches))
+        if mismatches > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
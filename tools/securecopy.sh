@@ -5,10 +5,13 @@ HOST=$2
 USER=$3
 DESTINATION=$4
 DESTDIR=$(dirname $DESTINATION)
+# Consecutive copies to the same host (e.g. the landing pages and MOAI metadata of
+# a publication) share one SSH connection, which is kept open for a minute.
+SSHOPTS="-o ControlMaster=auto -o ControlPath=$HOME/.ssh/securecopy-%r@%h:%p -o ControlPersist=60"
 echo "Calling:"
 echo "ssh $USER@$HOST mkdir -p $DESTDIR"
-timeout 5s ssh $USER@$HOST mkdir -p $DESTDIR
+timeout 5s ssh $SSHOPTS $USER@$HOST mkdir -p $DESTDIR
 echo "scp -i $HOME/.ssh/$4 $PHYPATH $USER@$HOST:$DESTINATION"
-timeout 5s scp $PHYPATH $USER@$HOST:$DESTINATION
+timeout 5s scp $SSHOPTS $PHYPATH $USER@$HOST:$DESTINATION
 echo "ssh $USER@$HOST chmod go+r $DESTINATION"
-timeout 5s ssh $USER@$HOST chmod go+r $DESTINATION
+timeout 5s ssh $SSHOPTS $USER@$HOST chmod go+r $DESTINATION
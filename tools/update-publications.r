@@ -10,6 +10,11 @@
 # To update all data packages:
 # $ irule -r irods_rule_engine_plugin-irods_rule_language-instance -F /etc/irods/yoda-ruleset/tools/update-publications.r
 #
+# When updating all data packages, DataCite is updated by publication_update_workers parallel workers,
+# and only files that have changed since the last update are uploaded. An interrupted update
+# therefore continues where it stopped when it is started again. A timing report per stage is
+# printed at the end.
+#
 updatePublications() {
 	rule_update_publication(*package, *updateDatacite, *updateLandingpage, *updateMOAI);
 }
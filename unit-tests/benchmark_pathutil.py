@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Micro-benchmark for pathutil.info.
+
+Not part of the unit test suite. Run from this directory:
+
+    python benchmark_pathutil.py
+"""
+
+__copyright__ = 'Copyright (c) 2024, Utrecht University'
+__license__   = 'GPLv3, see LICENSE'
+
+import random
+import sys
+import timeit
+
+sys.path.append('../util')
+
+# Imports unittest, which limits the util imports to those usable outside iRODS.
+from test_util_pathutil import info_test_paths, legacy_info
+
+import pathutil
+
+
+def policy_workload(info, paths):
+    # Path checks of the policies for a file operation: the collection and data object
+    # are checked by the data create/write policies, the metadata policy and the
+    # resource modified policy.
+    for path in paths:
+        coll = pathutil.dirname(path)
+        info(coll).space
+        info(coll).space
+        info(path).space
+        info(path)
+        info(path).space
+
+
+def main():
+    rng = random.Random(42)
+    groups = ["research-{}".format(i) for i in range(50)] + ["vault-{}".format(i) for i in range(50)]
+    paths = ["/tempZone/home/{}/dir{}/file{}.txt".format(rng.choice(groups), rng.randint(0, 20), rng.randint(0, 100))
+             for _ in range(1000)]
+
+    def uncached_info(path):
+        return pathutil._parse_info(path)
+
+    print("{:<10} {:>14} {:>14} {:>14}".format("workload", "legacy (us)", "uncached (us)", "cached (us)"))
+    for name, workload, calls in [("per call", lambda info: [info(path) for path in info_test_paths], len(info_test_paths)),
+                                  ("policies", lambda info: policy_workload(info, paths), 5 * len(paths))]:
+        number = 3
+        legacy = timeit.timeit(lambda: workload(legacy_info), number=number)
+        uncached = timeit.timeit(lambda: workload(uncached_info), number=number)
+        pathutil._info_cache.clear()
+        pathutil._info_cache_previous.clear()
+        cached = timeit.timeit(lambda: workload(pathutil.info), number=number)
+
+        times = tuple(1000000.0 * t / number / calls for t in (legacy, uncached, cached))
+        print("{:<10} {:>14.3f} {:>14.3f} {:>14.3f}".format(name, *times))
+
+
+if __name__ == '__main__':
+    main()
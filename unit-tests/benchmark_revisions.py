@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Micro-benchmark for revision cleanup bucket assignment.
+
+Not part of the unit test suite. Run from this directory:
+
+    python benchmark_revisions.py
+"""
+
+__copyright__ = 'Copyright (c) 2024, Utrecht University'
+__license__   = 'GPLv3, see LICENSE'
+
+import random
+import sys
+import timeit
+
+sys.path.append('..')
+
+# Imports unittest, which limits the util imports to those usable outside iRODS.
+from test_revisions import legacy_deletion_candidates
+
+from revision_strategies import get_revision_strategy
+from revision_utils import get_deletion_candidates
+
+
+def main():
+    dummy_time = 1000000000
+    rng = random.Random(42)
+
+    print("{:<8} {:>10} {:>14} {:>14}".format("strategy", "revisions", "legacy (ms)", "current (ms)"))
+    for strategy_name in ["A", "B", "Simple"]:
+        revision_strategy = get_revision_strategy(strategy_name)
+        total_timespan = revision_strategy.get_total_bucket_timespan()
+        for nr_revisions in [10, 100, 1000, 10000]:
+            revisions = sorted([(i, dummy_time - rng.randint(0, 2 * total_timespan), "/foo/bar/baz")
+                                for i in range(nr_revisions)],
+                               key=lambda revision: revision[1], reverse=True)
+            number = max(1, 10000 // nr_revisions)
+
+            legacy = timeit.timeit(lambda: legacy_deletion_candidates(revision_strategy, revisions, dummy_time),
+                                   number=number)
+            current = timeit.timeit(lambda: get_deletion_candidates(None, revision_strategy, revisions, dummy_time, True, False),
+                                    number=number)
+
+            print("{:<8} {:>10} {:>14.3f} {:>14.3f}".format(strategy_name, nr_revisions,
+                                                            1000.0 * legacy / number, 1000.0 * current / number))
+
+
+if __name__ == '__main__':
+    main()
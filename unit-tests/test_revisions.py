@@ -4,6 +4,7 @@
 __copyright__ = 'Copyright (c) 2023-2024, Utrecht University'
 __license__   = 'GPLv3, see LICENSE'
 
+import random
 import sys
 from unittest import TestCase
 
@@ -13,6 +14,49 @@ from revision_strategies import get_revision_strategy
 from revision_utils import get_deletion_candidates, revision_cleanup_prefilter, revision_eligible
 
 
+# Reference implementation of get_deletion_candidates for an existing versioned data object,
+# using the original per-bucket scan over all revisions.
+def legacy_deletion_candidates(revision_strategy, revisions, initial_upper_time_bound):
+    buckets = revision_strategy.get_buckets()
+    deletion_candidates = []
+    t2 = initial_upper_time_bound
+    bucket_revisions = []
+    non_bucket_revisions = []
+    revision_found_in_bucket = False
+
+    for bucket in buckets:
+        t1 = t2
+        t2 = t1 - bucket[0]
+        revision_list = []
+        for revision in revisions:
+            if revision[1] <= t1 and revision[1] > t2:
+                revision_found_in_bucket = True
+                revision_list.append(revision[0])
+        bucket_revisions.append(revision_list)
+
+    for revision in revisions:
+        if revision[1] < t2:
+            non_bucket_revisions.append(revision[0])
+
+    for bucket, rev_list in zip(buckets, bucket_revisions):
+        max_bucket_size = bucket[1]
+        bucket_start_index = bucket[2]
+        if len(rev_list) > max_bucket_size:
+            nr_to_be_removed = len(rev_list) - max_bucket_size
+            for count in range(nr_to_be_removed):
+                if bucket_start_index >= 0:
+                    deletion_candidates.append(rev_list[bucket_start_index + count])
+                else:
+                    deletion_candidates.append(rev_list[len(rev_list) + bucket_start_index - count])
+
+    if len(non_bucket_revisions) > 1 or (len(non_bucket_revisions) == 1 and revision_found_in_bucket):
+        nr_to_be_removed = len(non_bucket_revisions) - (0 if revision_found_in_bucket else 1)
+        for count in range(nr_to_be_removed):
+            deletion_candidates.append(non_bucket_revisions[count + (0 if revision_found_in_bucket else 1)])
+
+    return deletion_candidates
+
+
 class RevisionTest(TestCase):
 
     def test_revision_eligible(self):
@@ -213,3 +257,36 @@ class RevisionTest(TestCase):
                      (3, dummy_time - 365 * 24 * 3600 - 180, "/foo/bar/baz")]
         output = get_deletion_candidates(None, revision_strategy, revisions, 1000000000, True, False)
         self.assertEqual(output, [2, 3])
+
+    def test_revision_sort_into_buckets_boundaries(self):
+        dummy_time = 1000000000
+        revision_strategy = get_revision_strategy("B")
+        total_timespan = revision_strategy.get_total_bucket_timespan()
+        revisions = [(1, dummy_time + 60, "/foo/bar/baz"),                  # Newer than upper bound
+                     (2, dummy_time, "/foo/bar/baz"),                       # First bucket (inclusive)
+                     (3, dummy_time - 12 * 3600, "/foo/bar/baz"),           # Second bucket (exclusive lower bound)
+                     (4, dummy_time - total_timespan, "/foo/bar/baz"),      # Exactly on lower bound of last bucket
+                     (5, dummy_time - total_timespan - 1, "/foo/bar/baz")]  # Predates all buckets
+        bucket_revisions, non_bucket_revisions = revision_strategy.sort_into_buckets(revisions, dummy_time)
+        self.assertEqual(bucket_revisions, [[2], [3], [], [], [], [], [], []])
+        self.assertEqual(non_bucket_revisions, [5])
+
+    def test_revision_deletion_candidates_equivalence(self):
+        dummy_time = 1000000000
+        rng = random.Random(42)
+        for strategy_name in ["A", "B", "Simple"]:
+            revision_strategy = get_revision_strategy(strategy_name)
+            total_timespan = revision_strategy.get_total_bucket_timespan()
+            # Ages at, just before and just after every bucket boundary, plus random ages.
+            edge_ages = [0, -1] + [boundary + delta
+                                   for boundary in revision_strategy.get_bucket_boundaries()
+                                   for delta in [-1, 0, 1]]
+            for _ in range(300):
+                nr_revisions = rng.randint(0, 40)
+                ages = [rng.choice(edge_ages) if rng.random() < 0.3 else rng.randint(0, 2 * total_timespan)
+                        for _ in range(nr_revisions)]
+                revisions = [(i, dummy_time - age, "/foo/bar/baz") for i, age in enumerate(ages)]
+                if rng.random() < 0.5:
+                    revisions.sort(key=lambda revision: revision[1], reverse=True)
+                self.assertEqual(get_deletion_candidates(None, revision_strategy, revisions, dummy_time, True, False),
+                                 legacy_deletion_candidates(revision_strategy, revisions, dummy_time))
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for the HTTP client utils module"""
+
+__copyright__ = 'Copyright (c) 2024, Utrecht University'
+__license__   = 'GPLv3, see LICENSE'
+
+import sys
+import threading
+from unittest import TestCase
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+import requests
+
+sys.path.append('../util')
+
+import http_client
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep connections alive, so that connection reuse can be observed.
+    protocol_version = 'HTTP/1.1'
+
+    def respond(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        server.requests.append((self.command, self.path, self.client_address))
+        status = server.statuses.pop(0) if server.statuses else 200
+        body = b'{}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UtilHttpClientTest(TestCase):
+
+    def setUp(self):
+        self.server = StubServer(('127.0.0.1', 0), StubHandler)
+        self.server.requests = []
+        self.server.statuses = []
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.01})
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{}/api'.format(self.server.server_address[1])
+        http_client.close()
+        http_client.reset_metrics()
+
+    def tearDown(self):
+        http_client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reuse(self):
+        for _ in range(3):
+            self.assertEqual(http_client.get('stub', self.url, timeout=5).status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(set(address for _, _, address in self.server.requests)), 1)
+
+    def test_retry_server_error(self):
+        self.server.statuses = [503, 500]
+        response = http_client.put('stub', self.url, data='{}', timeout=5, backoff_time=0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_retry_bounded(self):
+        self.server.statuses = [503] * 10
+        response = http_client.get('stub', self.url, timeout=5, retries=2, backoff_time=0)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_no_retry_post_server_error(self):
+        self.server.statuses = [500]
+        response = http_client.post('stub', self.url, data='{}', timeout=5, backoff_time=0)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_retry_post_too_many_requests(self):
+        self.server.statuses = [429]
+        response = http_client.post('stub', self.url, data='{}', timeout=5, backoff_time=0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_no_retry_client_error(self):
+        self.server.statuses = [404]
+        response = http_client.delete('stub', self.url, timeout=5, backoff_time=0)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_connection_error(self):
+        url = self.url
+        self.tearDown()
+        self.assertRaises(requests.ConnectionError, http_client.get, 'stub', url, timeout=5, retries=1, backoff_time=0)
+        self.assertEqual(http_client.get_metrics()['stub']['calls'], 2)
+        self.setUp()
+
+    def test_metrics(self):
+        self.server.statuses = [503]
+        http_client.get('stub', self.url, timeout=5, backoff_time=0)
+        http_client.get('other', self.url, timeout=5, backoff_time=0)
+        metrics = http_client.get_metrics()
+        self.assertEqual(metrics['stub']['calls'], 2)
+        self.assertEqual(metrics['stub']['retries'], 1)
+        self.assertEqual(metrics['stub']['errors'], 1)
+        self.assertEqual(metrics['other']['calls'], 1)
+        self.assertEqual(metrics['other']['errors'], 0)
+        self.assertGreaterEqual(metrics['stub']['max_time'], 0)
+        self.assertEqual(len(http_client.format_metrics()), 2)
+
+    def test_backoff(self):
+        for attempt in range(10):
+            self.assertGreaterEqual(http_client.backoff(attempt, 1), 0)
+            self.assertLessEqual(http_client.backoff(attempt, 1), min(2 ** attempt, 10))
@@ -108,8 +108,9 @@ class UtilMiscTest(TestCase):
         self.assertTrue(len(result['missing_avus']) == 0)
         self.assertTrue(len(result['unexpected_avus']) == 0)
 
-        # Success, extra optional avu
+        # Success, extra optional avus
         avs['org_publication_baseDOIAvailable'] = 'yes'
+        avs['org_publication_landingPageHash'] = 'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855'
         avus_success = [Avu(attr, val, "") for attr, val in avs.items()]
         result = check_data_package_system_avus(avus_success)
         self.assertTrue(result['no_missing_avus'])
@@ -117,6 +118,7 @@ class UtilMiscTest(TestCase):
         self.assertTrue(len(result['missing_avus']) == 0)
         self.assertTrue(len(result['unexpected_avus']) == 0)
         del avs['org_publication_baseDOIAvailable']
+        del avs['org_publication_landingPageHash']
 
         # Missing license Uri for non-custom license
         del avs['org_publication_licenseUri']
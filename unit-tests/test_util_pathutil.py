@@ -1,17 +1,61 @@
 # -*- coding: utf-8 -*-
 """Unit tests for the pathutil utils module"""
 
-__copyright__ = 'Copyright (c) 2023, Utrecht University'
+__copyright__ = 'Copyright (c) 2023-2024, Utrecht University'
 __license__   = 'GPLv3, see LICENSE'
 
+import re
 import sys
 from unittest import TestCase
 
 sys.path.append('../util')
 
+import pathutil
 from pathutil import basename, chop, chopext, dirname, info, Space
 
 
+# Reference implementation of info, as it was before the single precompiled regular expression and the cache.
+def legacy_info(path):
+    def f(x):
+        return '' if x is None else x
+
+    def g(m, i):
+        return '' if i > len(m.groups()) else f(m.group(i))
+
+    def result(s, m):
+        return (s, g(m, 1), g(m, 2), g(m, 3))
+
+    def test(r, space):
+        m = re.match(r, path)
+        return m and result(space, m)
+
+    from collections import namedtuple
+
+    return (namedtuple('PathInfo', 'space zone group subpath'.split())
+            (*test('^/([^/]+)/home/(vault-[^/]+)(?:/(.+))?$',         Space.VAULT)
+            or test('^/([^/]+)/home/(research-[^/]+)(?:/(.+))?$',     Space.RESEARCH)
+            or test('^/([^/]+)/home/(deposit-[^/]+)(?:/(.+))?$',      Space.DEPOSIT)
+            or test('^/([^/]+)/home/(datamanager-[^/]+)(?:/(.+))?$',  Space.DATAMANAGER)
+            or test('^/([^/]+)/home/(grp-intake-[^/]+)(?:/(.+))?$',   Space.INTAKE)
+            or test('^/([^/]+)/home/(intake-[^/]+)(?:/(.+))?$',       Space.INTAKE)
+            or test('^/([^/]+)/home/(datarequests-[^/]+)(?:/(.+))?$', Space.DATAREQUEST)
+            or test('^/([^/]+)/home/([^/]+)(?:/(.+))?$',              Space.OTHER)
+            or test('^/([^/]+)()(?:/(.+))?$',                         Space.OTHER)
+            or (Space.OTHER, '', '', '')))
+
+
+# Paths used by the pathutil tests and benchmark, including edge cases.
+info_test_paths = ["", "/", "//", "tempZone", "/tempZone", "/tempZone/", "/tempZone/yoda", "/tempZone/yoda/x",
+                   "/tempZone/home", "/tempZone/home/", "/tempZone/home/rods", "/tempZone/home/rods/x/y",
+                   "/tempZone/home/vault-", "/tempZone/home/vault-/x", "/tempZone/home/vaults-x",
+                   "/tempZone/home/research-x/", "/tempZone/home/research-x//y", "/tempZone/home/research-x/y\n",
+                   "/tempZone/home/research-x\ny", "/tempZone/home/grp-intake-x/y", "/tempZone/home/intake-x/y",
+                   "/tempZone/home/grp-x/y", "/tempZone/home/home/research-x", "/tempZone/trash/home/rods/research-x"]
+info_test_paths += [u"/tempZone/home/{}-test{}".format(prefix, subpath)
+                    for prefix in ["vault", "research", "deposit", "datamanager", "grp-intake", "intake", "datarequests"]
+                    for subpath in ["", "/y", "/y/z.txt", u"/y/ z/\u00e9.txt"]]
+
+
 class UtilPathutilTest(TestCase):
 
     def test_chop(self):
@@ -125,3 +169,28 @@ class UtilPathutilTest(TestCase):
         self.assertEquals(output, (Space.INTAKE, 'tempZone', 'grp-intake-test', ''))
         output = info("/tempZone/home/datarequests-test")
         self.assertEquals(output, (Space.DATAREQUEST, 'tempZone', 'datarequests-test', ''))
+        output = info("/tempZone/home/research-test/test")
+        self.assertEquals((output.space, output.zone, output.group, output.subpath),
+                          (Space.RESEARCH, 'tempZone', 'research-test', 'test'))
+
+    def test_info_legacy(self):
+        for path in info_test_paths:
+            self.assertEqual(info(path), legacy_info(path), path)
+            self.assertEqual(pathutil._parse_info(path), legacy_info(path), path)
+
+    def test_info_cache(self):
+        pathutil._info_cache.clear()
+        pathutil._info_cache_previous.clear()
+        info("/tempZone/home/research-test/first")
+        for i in range(2 * pathutil._INFO_CACHE_SIZE):
+            info("/tempZone/home/research-test/{}".format(i))
+            info("/tempZone/home/research-test/recent")
+        self.assertLessEqual(len(pathutil._info_cache), pathutil._INFO_CACHE_SIZE)
+        self.assertLessEqual(len(pathutil._info_cache_previous), pathutil._INFO_CACHE_SIZE)
+
+        # Paths that are used again are kept, other paths are dropped after two generations.
+        self.assertIn("/tempZone/home/research-test/recent", pathutil._info_cache)
+        self.assertNotIn("/tempZone/home/research-test/first", pathutil._info_cache)
+        self.assertNotIn("/tempZone/home/research-test/first", pathutil._info_cache_previous)
+        self.assertEqual(info("/tempZone/home/research-test/recent"),
+                         (Space.RESEARCH, 'tempZone', 'research-test', 'recent'))
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for the slots utils module"""
+
+__copyright__ = 'Copyright (c) 2024, Utrecht University'
+__license__   = 'GPLv3, see LICENSE'
+
+import shutil
+import sys
+import tempfile
+from unittest import TestCase
+
+sys.path.append('../util')
+
+import constants
+import slots
+
+
+class UtilSlotsTest(TestCase):
+
+    def setUp(self):
+        self.original_directory = constants.SLOT_MAIN_DIRECTORY
+        self.directory = tempfile.mkdtemp()
+        constants.SLOT_MAIN_DIRECTORY = self.directory
+
+    def tearDown(self):
+        constants.SLOT_MAIN_DIRECTORY = self.original_directory
+        shutil.rmtree(self.directory)
+
+    def test_slot_limit(self):
+        with slots.slot("resc", 2) as first:
+            self.assertTrue(first)
+            with slots.slot("resc", 2) as second:
+                self.assertTrue(second)
+                with slots.slot("resc", 2) as third:
+                    self.assertFalse(third)
+                with slots.slot("other/resc", 2) as other:
+                    self.assertTrue(other)
+
+            # Slots are released when the context is left.
+            with slots.slot("resc", 2) as second:
+                self.assertTrue(second)
+
+    def test_slot_unlimited(self):
+        with slots.slot("resc", 0) as first:
+            self.assertTrue(first)
+            with slots.slot("resc", 0) as second:
+                self.assertTrue(second)
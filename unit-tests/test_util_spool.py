@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for the spool utils module"""
+
+__copyright__ = 'Copyright (c) 2024, Utrecht University'
+__license__   = 'GPLv3, see LICENSE'
+
+import shutil
+import sys
+import tempfile
+from unittest import TestCase
+
+sys.path.append('../util')
+
+import constants
+import spool
+
+
+class UtilSpoolTest(TestCase):
+
+    def setUp(self):
+        self.original_directory = constants.SPOOL_MAIN_DIRECTORY
+        self.directory = tempfile.mkdtemp()
+        constants.SPOOL_MAIN_DIRECTORY = self.directory
+        spool._initialized_processes.clear()
+        self.process = constants.PROC_REVISION_CLEANUP
+
+    def tearDown(self):
+        constants.SPOOL_MAIN_DIRECTORY = self.original_directory
+        spool._initialized_processes.clear()
+        shutil.rmtree(self.directory)
+
+    def test_spool_put_get(self):
+        self.assertFalse(spool.has_spool_data(self.process))
+        self.assertIsNone(spool.get_spool_data(self.process))
+        spool.put_spool_data(self.process, [[1, 2], {"a": 1}])
+        self.assertEqual(spool.num_spool_data(self.process), 2)
+        self.assertEqual(spool.get_spool_data(self.process), [1, 2])
+        self.assertEqual(spool.get_spool_data(self.process), {"a": 1})
+        self.assertIsNone(spool.get_spool_data(self.process))
+        self.assertFalse(spool.has_spool_data(self.process))
+
+    def test_spool_lease_ack(self):
+        spool.put_spool_data(self.process, ["first", "second"])
+        lease_id, data = spool.lease_spool_data(self.process)
+        self.assertEqual(data, "first")
+
+        # Leased data is not delivered to other jobs, but is still counted.
+        self.assertEqual(spool.lease_spool_data(self.process)[1], "second")
+        self.assertIsNone(spool.lease_spool_data(self.process))
+        self.assertEqual(spool.num_spool_data(self.process), 2)
+
+        spool.ack_spool_data(self.process, lease_id)
+        self.assertEqual(spool.num_spool_data(self.process), 1)
+
+    def test_spool_nack(self):
+        spool.put_spool_data(self.process, ["data"])
+        lease_id, _ = spool.lease_spool_data(self.process)
+        spool.nack_spool_data(self.process, lease_id)
+        self.assertEqual(spool.lease_spool_data(self.process)[1], "data")
+
+    def test_spool_lease_expiry(self):
+        spool.put_spool_data(self.process, ["data"])
+        expired_lease_id, _ = spool.lease_spool_data(self.process, lease_time=-1)
+
+        # Unacknowledged data is delivered again after its lease expires.
+        lease_id, data = spool.lease_spool_data(self.process)
+        self.assertEqual(data, "data")
+
+        # Acknowledgement of the expired lease is ignored.
+        spool.ack_spool_data(self.process, expired_lease_id)
+        self.assertEqual(spool.num_spool_data(self.process), 1)
+        spool.ack_spool_data(self.process, lease_id)
+        self.assertEqual(spool.num_spool_data(self.process), 0)
+
+    def test_spool_max_deliveries(self):
+        spool.put_spool_data(self.process, ["poison", "data"])
+        for _ in range(constants.SPOOL_MAX_DELIVERIES):
+            lease_id, data = spool.lease_spool_data(self.process)
+            self.assertEqual(data, "poison")
+            spool.nack_spool_data(self.process, lease_id)
+
+        self.assertEqual(spool.lease_spool_data(self.process)[1], "data")
+        self.assertEqual(spool.num_failed_spool_data(self.process), 1)
+
+    def test_spool_unknown_process(self):
+        self.assertRaises(Exception, spool.put_spool_data, "unknown", ["data"])
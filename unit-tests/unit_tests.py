@@ -10,8 +10,11 @@ from test_intake import IntakeTest
 from test_policies import PoliciesTest
 from test_revisions import RevisionTest
 from test_schema_transformations import CorrectifyIsniTest, CorrectifyOrcidTest, CorrectifyScopusTest
+from test_util_http_client import UtilHttpClientTest
 from test_util_misc import UtilMiscTest
 from test_util_pathutil import UtilPathutilTest
+from test_util_slots import UtilSlotsTest
+from test_util_spool import UtilSpoolTest
 from test_util_yoda_names import UtilYodaNamesTest
 
 
@@ -24,7 +27,10 @@ def suite():
     test_suite.addTest(makeSuite(IntakeTest))
     test_suite.addTest(makeSuite(PoliciesTest))
     test_suite.addTest(makeSuite(RevisionTest))
+    test_suite.addTest(makeSuite(UtilHttpClientTest))
     test_suite.addTest(makeSuite(UtilMiscTest))
     test_suite.addTest(makeSuite(UtilPathutilTest))
+    test_suite.addTest(makeSuite(UtilSlotsTest))
+    test_suite.addTest(makeSuite(UtilSpoolTest))
     test_suite.addTest(makeSuite(UtilYodaNamesTest))
     return test_suite
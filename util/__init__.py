@@ -35,10 +35,15 @@ if 'unittest' not in sys.modules:
     import group
     import avu
     import misc
+    import batch
+    import slots
+    import http_client
     import resource
     import arb_data_manager
     import cached_data_manager
+    import group_membership_data_manager
     import irods_type_info
+    import json_validator
 
     # Config items can be accessed directly as 'config.foo' by any module
     # that imports * from util.
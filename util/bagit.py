@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 """Functions to copy packages to the vault and manage permissions of vault packages."""
 
-__copyright__ = 'Copyright (c) 2023, Utrecht University'
+__copyright__ = 'Copyright (c) 2023-2024, Utrecht University'
 __license__   = 'GPLv3, see LICENSE'
 
+import hashlib
 import itertools
 
 import genquery
@@ -15,6 +16,13 @@ import log
 import msi
 
 
+MANIFEST = "manifest-sha256.txt"
+"""Name of the BagIt payload manifest"""
+
+TAGMANIFEST = "tagmanifest-sha256.txt"
+"""Name of the BagIt tag manifest"""
+
+
 def manifest(ctx, coll):
     """Generate a BagIt manifest of collection.
 
@@ -26,10 +34,19 @@ def manifest(ctx, coll):
 
     :returns: String with BagIt manifest
     """
+    return "".join(manifest_lines(ctx, coll))
+
+
+def manifest_lines(ctx, coll):
+    """Generate the lines of a BagIt manifest of collection, without keeping the manifest in memory.
+
+    :param ctx:  Combined type of a callback and rei struct
+    :param coll: Collection to generate manifest of
+
+    :yields: Lines of BagIt manifest
+    """
     length = len(coll) + 1
-    return "\n".join([
-        data_object.decode_checksum(row[2]) + " " + (row[0] + "/" + row[1])[length:]
-        for row in itertools.chain(
+    for row in itertools.chain(
             genquery.row_iterator("COLL_NAME, ORDER(DATA_NAME), DATA_CHECKSUM",
                                   "COLL_NAME = '{}'".format(coll),
                                   genquery.AS_LIST,
@@ -37,9 +54,36 @@ def manifest(ctx, coll):
             genquery.row_iterator("ORDER(COLL_NAME), ORDER(DATA_NAME), DATA_CHECKSUM",
                                   "COLL_NAME like '{}/%'".format(coll),
                                   genquery.AS_LIST,
-                                  ctx))
-        if row[0] != coll or not row[1].startswith("yoda-metadata")
-    ]) + "\n"
+                                  ctx)):
+        if row[0] == coll and (row[1].startswith("yoda-metadata") or row[1] in (MANIFEST, TAGMANIFEST)):
+            continue
+
+        yield data_object.decode_checksum(row[2]) + " " + (row[0] + "/" + row[1])[length:] + "\n"
+
+
+def write_manifest(ctx, coll, chunk_size=constants.IIDATA_STREAM_CHUNK_SIZE):
+    """Write BagIt manifest and tag manifest of collection to the collection.
+
+    The manifest is written in chunks while the collection is queried,
+    so memory usage does not depend on the number of data objects in the collection.
+
+    :param ctx:        Combined type of a callback and rei struct
+    :param coll:       Collection to write manifests of
+    :param chunk_size: Maximum number of bytes of manifest to buffer before writing it
+    """
+    manifest_path = coll + "/" + MANIFEST
+    manifest_sha256 = hashlib.sha256()
+
+    with data_object.open_stream(ctx, manifest_path, 'w', chunk_size) as stream:
+        for line in manifest_lines(ctx, coll):
+            manifest_sha256.update(line)
+            stream.write(line)
+
+    msi.data_obj_chksum(ctx, manifest_path, "", irods_types.BytesBuf())
+
+    # Tag manifest with checksum of the manifest, computed while writing the manifest.
+    data_object.write(ctx, coll + "/" + TAGMANIFEST, "{} {}\n".format(manifest_sha256.hexdigest(), MANIFEST))
+    msi.data_obj_chksum(ctx, coll + "/" + TAGMANIFEST, "", irods_types.BytesBuf())
 
 
 def status(ctx, coll):
@@ -53,22 +97,18 @@ def status(ctx, coll):
 
 
 def create(ctx, archive, coll, resource):
-    # Create manifest file.
+    # Create manifest files.
     log.write(ctx, "Creating manifest file for data package <{}>".format(coll))
-    data_object.write(ctx, coll + "/manifest-sha256.txt", manifest(ctx, coll))
-    msi.data_obj_chksum(ctx, coll + "/manifest-sha256.txt", "",
-                        irods_types.BytesBuf())
+    write_manifest(ctx, coll)
 
     try:
         # Create archive.
         log.write(ctx, "Creating archive file for data package <{}>".format(coll))
         ret = msi.archive_create(ctx, archive, coll, resource, 0)
-    except Exception:
-        data_object.remove(ctx, coll + "/manifest-sha256.txt")
-        pass
-
-    # Remove manifest file.
-    data_object.remove(ctx, coll + "/manifest-sha256.txt")
+    finally:
+        # Remove manifest files.
+        data_object.remove(ctx, coll + "/" + MANIFEST)
+        data_object.remove(ctx, coll + "/" + TAGMANIFEST)
 
     if ret < 0:
         raise Exception("Archive creation failed: {}".format(ret))
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Utility functions for scheduled batch jobs that process data objects.
+
+Data objects are scheduled for a batch job with an AVU whose value ends with a balance id between 1-64,
+e.g. "resource,balance_id". Parallel batch jobs each process a range of balance ids. The functions in
+this module select the data objects of a balance id range in the catalog, and page through them in
+chunks ordered by data ID, so that a job does not fetch data objects of other jobs.
+"""
+
+__copyright__ = 'Copyright (c) 2024, Utrecht University'
+__license__   = 'GPLv3, see LICENSE'
+
+import heapq
+
+import genquery
+
+
+def balance_id_rows(ctx, columns, condition, balance_id_min, balance_id_max, chunk_size):
+    """Yields rows of data objects with a balance id within a range, ordered by data ID.
+
+    The balance id is matched against the end of the AVU value in the catalog query,
+    so the condition must select the AVU that schedules the data objects.
+
+    :param ctx:            Combined type of a callback and rei struct
+    :param columns:        List of columns to select, in addition to the data ID
+    :param condition:      Query condition that selects the scheduled data objects
+    :param balance_id_min: Minimum balance id (value 1-64)
+    :param balance_id_max: Maximum balance id (value 1-64)
+    :param chunk_size:     Maximum number of rows to query at once for each balance id
+
+    :returns: Iterator of rows, with the data ID as first column
+    """
+    return merge_rows(chunked_rows(ctx,
+                                   columns,
+                                   "{} AND META_DATA_ATTR_VALUE like '%,{}'".format(condition, balance_id),
+                                   chunk_size)
+                      for balance_id in range(int(balance_id_min), int(balance_id_max) + 1))
+
+
+def chunked_rows(ctx, columns, condition, chunk_size):
+    """Yields rows of a data object query ordered by data ID, querying at most chunk_size rows at once.
+
+    Chunks are paged on data ID rather than offset, so that data objects that no longer match
+    the condition after they have been processed do not cause other data objects to be skipped.
+    The columns must select one row per data object.
+
+    :param ctx:        Combined type of a callback and rei struct
+    :param columns:    List of columns to select, in addition to the data ID
+    :param condition:  Query condition
+    :param chunk_size: Maximum number of rows to query at once
+
+    :yields: Rows, with the data ID as first column
+    """
+    last_data_id = None
+    while True:
+        chunk_condition = condition
+        if last_data_id is not None:
+            chunk_condition += " AND DATA_ID n> '{}'".format(last_data_id)
+
+        rows = list(genquery.Query(ctx, ['ORDER(DATA_ID)'] + columns, chunk_condition,
+                                   offset=0, limit=int(chunk_size), output=genquery.AS_LIST))
+        for row in rows:
+            yield row
+
+        if len(rows) < int(chunk_size):
+            break
+        last_data_id = rows[-1][0]
+
+
+def merge_rows(iterables):
+    """Merges iterables of rows that are ordered by data ID into one iterator ordered by data ID.
+
+    :param iterables: Iterables of rows, with the data ID as first column
+
+    :yields: Rows, with the data ID as first column
+    """
+    keyed = [((int(row[0]), row) for row in iterable) for iterable in iterables]
+    for _, row in heapq.merge(*keyed):
+        yield row
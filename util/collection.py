@@ -1,20 +1,19 @@
 # -*- coding: utf-8 -*-
 """Utility / convenience functions for dealing with collections."""
 
-__copyright__ = 'Copyright (c) 2019-2021, Utrecht University'
+__copyright__ = 'Copyright (c) 2019-2024, Utrecht University'
 __license__   = 'GPLv3, see LICENSE'
 
 import itertools
 import json
-import sys
-if sys.version_info > (2, 7):
-    from functools import reduce
+import time
 
 import genquery
 import irods_types
 
 import data_object
 import msi
+from config import config
 
 
 def exists(ctx, path):
@@ -45,40 +44,152 @@ def empty(ctx, path):
                     genquery.AS_LIST, ctx))) == 0)
 
 
-def size(ctx, path):
-    """Get a collection's size in bytes."""
-    def func(x, row):
-        return x + int(row[1])
+def size(ctx, path, cache=False):
+    """Get a collection's size in bytes.
 
-    return reduce(func,
-                  itertools.chain(genquery.row_iterator("DATA_ID, DATA_SIZE",
-                                                        "COLL_NAME like '{}'".format(path),
-                                                        genquery.AS_LIST, ctx),
-                                  genquery.row_iterator("DATA_ID, DATA_SIZE",
-                                                        "COLL_NAME like '{}/%'".format(path),
-                                                        genquery.AS_LIST, ctx)), 0)
+    Replicas of a data object with the same size are counted once.
 
+    :param ctx:   Combined type of a callback and rei struct
+    :param path:  A collection path
+    :param cache: Reuse statistics of this collection retrieved in the last
+                  collection_stats_cache_ttl seconds
 
-def data_count(ctx, path, recursive=True):
+    :returns: Collection size in bytes
+    """
+    return _cached(ctx, 'data', path, True, cache, _data_stats_aggregate)[1]
+
+
+def data_count(ctx, path, recursive=True, cache=False):
     """Get a collection's data count.
 
     :param ctx:       Combined type of a callback and rei struct
     :param path:      A collection path
     :param recursive: Measure subcollections as well
+    :param cache:     Reuse statistics of this collection retrieved in the last
+                      collection_stats_cache_ttl seconds
 
     :returns: Number of data objects
     """
-    # Generators can't be fed to len(), so here we are...
-    return sum(1 for _ in data_objects(ctx, path, recursive=recursive))
+    return _cached(ctx, 'data', path, recursive, cache, _data_stats_aggregate)[0]
+
+
+def collection_count(ctx, path, recursive=True, cache=False):
+    """Get a collection's collection count (the amount of collections within a collection).
+
+    :param ctx:       Combined type of a callback and rei struct
+    :param path:      A collection path
+    :param recursive: Measure subcollections as well
+    :param cache:     Reuse statistics of this collection retrieved in the last
+                      collection_stats_cache_ttl seconds
+
+    :returns: Number of collections
+    """
+    return _cached(ctx, 'collection', path, recursive, cache, _collection_count_aggregate)
+
+
+# Short-lived memo of collection statistics: (kind, path, recursive) -> (time retrieved, statistics).
+# An agent serves a single client, so statistics are not shared between users.
+_stats_cache = {}
+
+
+def _cached(ctx, kind, path, recursive, cache, func):
+    """Retrieve collection statistics, reusing recently retrieved statistics if requested."""
+    key = (kind, path, recursive)
+    now = time.time()
+    if cache and key in _stats_cache:
+        retrieved, stats = _stats_cache[key]
+        if now - retrieved < config.collection_stats_cache_ttl:
+            return stats
+
+    stats = func(ctx, path, recursive)
+    _stats_cache[key] = (now, stats)
+    return stats
+
+
+def _data_conditions(path, recursive):
+    """Query conditions for data objects in a collection and, if recursive, its subcollections."""
+    conditions = ["COLL_NAME = '{}'".format(path)]
+    if recursive:
+        conditions.append("COLL_NAME like '{}/%'".format(path))
+    return conditions
+
+
+def _data_stats_rows(ctx, path, recursive=True):
+    """Get the data object count and size of a collection by streaming all replica rows.
+
+    :param ctx:       Combined type of a callback and rei struct
+    :param path:      A collection path
+    :param recursive: Measure subcollections as well
+
+    :returns: Tuple of number of data objects and size in bytes
+    """
+    data_ids = set()
+    total_size = 0
+    for condition in _data_conditions(path, recursive):
+        # GenQuery returns distinct rows, so replicas with the same size are returned once.
+        for data_id, data_size in genquery.row_iterator("DATA_ID, DATA_SIZE", condition, genquery.AS_LIST, ctx):
+            data_ids.add(data_id)
+            total_size += int(data_size)
+
+    return len(data_ids), total_size
+
+
+def _data_stats_aggregate(ctx, path, recursive=True):
+    """Get the data object count and size of a collection using catalog-side aggregates.
+
+    Replica numbers are unique per data object, so if all replicas in the collection
+    have the same replica number, each data object has a single replica and the
+    aggregates are exact. Otherwise the replicas are deduplicated by streaming rows.
+    GenQuery cannot restrict aggregates to one replica per data object, so when
+    replication is configured (resource_replica) the rows are streamed right away.
+
+    :param ctx:       Combined type of a callback and rei struct
+    :param path:      A collection path
+    :param recursive: Measure subcollections as well
+
+    :returns: Tuple of number of data objects and size in bytes
+    """
+    if len(config.resource_replica) > 0:
+        # Data objects have multiple replicas, so the aggregates would not be used.
+        return _data_stats_rows(ctx, path, recursive)
+
+    totals = {}
+    for condition in _data_conditions(path, recursive):
+        for repl_num, count, total_size in genquery.row_iterator("DATA_REPL_NUM, COUNT(DATA_ID), SUM(DATA_SIZE)",
+                                                                 condition, genquery.AS_LIST, ctx):
+            if count == '':
+                continue
+            previous_count, previous_size = totals.get(repl_num, (0, 0))
+            totals[repl_num] = (previous_count + int(count), previous_size + int(total_size or 0))
+
+    if len(totals) > 1:
+        return _data_stats_rows(ctx, path, recursive)
+
+    return next(iter(totals.values()), (0, 0))
+
+
+def _collection_condition(path, recursive):
+    """Query condition for the subcollections of a collection."""
+    if recursive:
+        return "COLL_NAME like '{}/%'".format(path)
+    else:
+        return "COLL_PARENT_NAME = '{}' AND COLL_NAME like '{}/%'".format(path, path)
+
+
+def _collection_count_rows(ctx, path, recursive=True):
+    """Get a collection's collection count by streaming all collection rows."""
+    return sum(1 for _ in genquery.row_iterator("COLL_ID", _collection_condition(path, recursive),
+                                                genquery.AS_LIST, ctx))
+
 
+def _collection_count_aggregate(ctx, path, recursive=True):
+    """Get a collection's collection count using a catalog-side aggregate."""
+    for row in genquery.row_iterator("COUNT(COLL_ID)", _collection_condition(path, recursive),
+                                     genquery.AS_LIST, ctx):
+        if row[0] != '':
+            return int(row[0])
 
-def collection_count(ctx, path, recursive=True):
-    """Get a collection's collection count (the amount of collections within a collection)."""
-    return sum(1 for _ in genquery.row_iterator(
-               "COLL_ID",
-               "COLL_NAME like '{}/%'".format(path) if recursive else
-               "COLL_PARENT_NAME = '{}' AND COLL_NAME like '{}/%'".format(path, path),
-               genquery.AS_LIST, ctx))
+    return 0
 
 
 def subcollections(ctx, path, recursive=False):
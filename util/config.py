@@ -117,8 +117,17 @@ config = Config(environment=None,
                 token_expiration_notification=0,
                 async_replication_delay_time=0,
                 async_replication_max_rss=1000000000,
+                async_replication_chunk_size=100,
+                async_replication_resource_concurrency=4,
+                async_replication_large_file_size=1073741824,
+                async_replication_slot_wait_time=60,
                 async_revision_delay_time=0,
                 async_revision_max_rss=1000000000,
+                async_revision_chunk_size=100,
+                publication_update_workers=4,
+                http_max_retries=3,
+                http_backoff_time=1,
+                http_backoff_max_time=10,
                 yoda_portal_fqdn=None,
                 epic_pid_enabled=False,
                 epic_url=None,
@@ -147,7 +156,13 @@ config = Config(environment=None,
                 vault_copy_multithread_enabled=True,
                 user_max_connections_enabled=False,
                 user_max_connections_number=4,
-                python3_interpreter='/usr/local/bin/python3')
+                python3_interpreter='/usr/local/bin/python3',
+                json_validation_workers=1,
+                json_validation_max_pending=16,
+                schema_cache_ttl=60,
+                template_cache_ttl=60,
+                collection_stats_cache_ttl=10,
+                group_membership_cache_ttl=0)
 
 # }}}
 
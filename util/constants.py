@@ -32,6 +32,21 @@ SPOOL_PROCESSES = {PROC_REVISION_CLEANUP, PROC_REVISION_CLEANUP_SCAN}
 SPOOL_MAIN_DIRECTORY = "/var/lib/irods/yoda-spool"
 """Directory that is used for storing Yoda batch process spool data on the provider"""
 
+SPOOL_LEASE_TIME = 6 * 3600
+"""Default number of seconds before leased spool data that has not been acknowledged is delivered again"""
+
+SPOOL_MAX_DELIVERIES = 3
+"""Number of times spool data is delivered before it is set aside as failed"""
+
+SPOOL_LOCK_TIMEOUT = 60
+"""Number of seconds to wait for access to the spool database of a process"""
+
+SLOT_MAIN_DIRECTORY = "/var/lib/irods/yoda-slots"
+"""Directory that is used for storing lock files of slots of shared resources on the provider"""
+
+SLOT_POLL_INTERVAL = 1
+"""Number of seconds to wait before trying again to acquire a slot of a shared resource"""
+
 UUBLOCKLIST = ["._*", ".DS_Store"]
 """ List of file extensions not to be copied to revision"""
 
@@ -62,6 +77,10 @@ IIDATA_MAX_SLURP_SIZE = 4 * 1024 * 1024  # 4 MiB
 """The maximum file size that can be read into a string in memory, to prevent
    DOSing / out of control memory consumption."""
 
+IIDATA_STREAM_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+"""The default amount of data that is read from or written to a data object at once
+   when it is read or written incrementally."""
+
 UUUSERMETADATAROOT = 'usr'
 """JSONAVU JSON root / namespace of user metadata (applied via JSON metadata file changes)."""
 
@@ -76,6 +95,7 @@ IIBAGITOR             = UUORGMETADATAPREFIX + 'bagitor'
 IICOPYPARAMSNAME      = UUORGMETADATAPREFIX + 'copy_to_vault_params'
 IICOPYRETRYCOUNT      = UUORGMETADATAPREFIX + 'retry_count'
 IICOPYLASTRUN         = UUORGMETADATAPREFIX + 'last_run'
+IIRETENTIONENDDATE    = UUORGMETADATAPREFIX + 'retention_end_date'
 
 DATA_PACKAGE_REFERENCE = UUORGMETADATAPREFIX + 'data_package_reference'
 
@@ -6,6 +6,7 @@ __license__   = 'GPLv3, see LICENSE'
 
 import binascii
 import json
+from contextlib import contextmanager
 
 import genquery
 import irods_types
@@ -85,6 +86,23 @@ def size(ctx, path):
         return int(row[0])
 
 
+def fingerprint(ctx, path):
+    """Determine a fingerprint of a data object that changes when the data object changes.
+
+    :param ctx:  Combined type of a callback and rei struct
+    :param path: Path to iRODS data object
+
+    :returns: Tuple of checksum, modify time and size of all replicas
+    """
+    iter = genquery.row_iterator(
+        "DATA_CHECKSUM, DATA_MODIFY_TIME, DATA_SIZE",
+        "COLL_NAME = '%s' AND DATA_NAME = '%s'" % pathutil.chop(path),
+        genquery.AS_LIST, ctx
+    )
+
+    return tuple(sorted(set(tuple(row) for row in iter)))
+
+
 def has_replica_with_status(ctx, path, statuses):
     """Check if data object has replica with specified replica statuses.
 
@@ -107,6 +125,92 @@ def has_replica_with_status(ctx, path, statuses):
     return False
 
 
+class DataObjectStream(object):
+    """Stream to read or write an iRODS data object in chunks (see open_stream)."""
+
+    def __init__(self, ctx, handle, mode, chunk_size):
+        self.ctx = ctx
+        self.handle = handle
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self._buffer = []
+        self._buffer_size = 0
+
+    def __iter__(self):
+        """Iterate over the chunks of data of a data object opened for reading.
+
+        :yields: Chunks of at most chunk_size bytes
+
+        :raises ValueError: If the data object is not opened for reading
+        """
+        if self.mode != 'r':
+            raise ValueError('data_object stream is not opened for reading')
+
+        while True:
+            ret = msi.data_obj_read(self.ctx, self.handle, self.chunk_size, irods_types.BytesBuf())
+            buf = ret['arguments'][2]
+            if buf.len == 0:
+                break
+            yield ''.join(buf.buf[:buf.len])
+
+    def read(self):
+        """Read the remaining data of a data object opened for reading.
+
+        :returns: Remaining data of the data object
+        """
+        return ''.join(self)
+
+    def write(self, data):
+        """Write data to a data object opened for writing.
+
+        Data is buffered, and written to the data object in chunks of at least chunk_size bytes.
+
+        :param data: Data to write to the data object
+
+        :raises ValueError: If the data object is not opened for writing
+        """
+        if self.mode != 'w':
+            raise ValueError('data_object stream is not opened for writing')
+
+        self._buffer.append(data)
+        self._buffer_size += len(data)
+        if self._buffer_size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write buffered data to the data object."""
+        if self._buffer_size > 0:
+            msi.data_obj_write(self.ctx, self.handle, ''.join(self._buffer), 0)
+        self._buffer = []
+        self._buffer_size = 0
+
+
+@contextmanager
+def open_stream(ctx, path, mode='r', chunk_size=constants.IIDATA_STREAM_CHUNK_SIZE):
+    """Open an iRODS data object for reading ('r') or writing ('w') in chunks, as a DataObjectStream."""
+    if mode == 'r':
+        ret = msi.data_obj_open(ctx, 'objPath=' + path, 0)
+        handle = ret['arguments'][1]
+    elif mode == 'w':
+        # This will overwrite the data object if it exists.
+        if exists(ctx, path):
+            ret = msi.data_obj_open(ctx, 'openFlags=O_WRONLYO_TRUNC++++objPath=' + path, 0)
+            handle = ret['arguments'][1]
+        else:
+            ret = msi.data_obj_create(ctx, path, '', 0)
+            handle = ret['arguments'][2]
+    else:
+        raise ValueError('data_object.open_stream: invalid mode ({})'.format(mode))
+
+    stream = DataObjectStream(ctx, handle, mode, chunk_size)
+    try:
+        yield stream
+        if mode == 'w':
+            stream.flush()
+    finally:
+        msi.data_obj_close(ctx, handle, 0)
+
+
 def write(ctx, path, data):
     """Write a string to an iRODS data object.
 
@@ -116,15 +220,8 @@ def write(ctx, path, data):
     :param path: Path to iRODS data object
     :param data: Data to write to data object
     """
-    if exists(ctx, path):
-        ret = msi.data_obj_open(ctx, 'openFlags=O_WRONLYO_TRUNC++++objPath=' + path, 0)
-        handle = ret['arguments'][1]
-    else:
-        ret = msi.data_obj_create(ctx, path, '', 0)
-        handle = ret['arguments'][2]
-
-    msi.data_obj_write(ctx, handle, data, 0)
-    msi.data_obj_close(ctx, handle, 0)
+    with open_stream(ctx, path, 'w') as stream:
+        stream.write(data)
 
 
 def read(ctx, path, max_size=constants.IIDATA_MAX_SLURP_SIZE):
@@ -142,19 +239,8 @@ def read(ctx, path, max_size=constants.IIDATA_MAX_SLURP_SIZE):
         # Don't bother reading an empty file.
         return ''
 
-    ret = msi.data_obj_open(ctx, 'objPath=' + path, 0)
-    handle = ret['arguments'][1]
-
-    ret = msi.data_obj_read(ctx,
-                            handle,
-                            sz,
-                            irods_types.BytesBuf())
-
-    buf = ret['arguments'][2]
-
-    msi.data_obj_close(ctx, handle, 0)
-
-    return ''.join(buf.buf[:buf.len])
+    with open_stream(ctx, path, 'r', chunk_size=min(sz, constants.IIDATA_STREAM_CHUNK_SIZE)) as stream:
+        return stream.read()
 
 
 def copy(ctx, path_org, path_copy, force=True):
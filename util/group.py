@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 """Utility / convenience functions for querying group info."""
 
-__copyright__ = 'Copyright (c) 2019-2023, Utrecht University'
+__copyright__ = 'Copyright (c) 2019-2024, Utrecht University'
 __license__   = 'GPLv3, see LICENSE'
 
 import genquery
 
+import group_membership_data_manager
 import user
 
 
@@ -29,9 +30,7 @@ def members(ctx, grp):
 
     :returns: Members of given group
     """
-    return genquery.Query(ctx, "USER_NAME, USER_ZONE",
-                          "USER_GROUP_NAME = '{}' AND USER_TYPE != 'rodsgroup'"
-                          .format(grp))
+    return group_membership_data_manager.GroupMembershipDataManager().get_group_members(ctx, grp)
 
 
 def is_member(ctx, grp, usr=None):
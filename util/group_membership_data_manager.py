@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""This file contains functions that implement cached data storage for group memberships
+   and roles, which are checked by authorization code on nearly every API call and policy.
+
+   Caching is opt-in: it is disabled unless config.group_membership_cache_ttl is set to a
+   positive number of seconds. Cached data is only invalidated by the group management
+   APIs of this ruleset, and only in the Redis instance of the server that made the change.
+   Changes made in other ways (e.g. with iadmin, the deprovisioning tool or on another
+   server) are picked up when the cached data expires. Until then, authorization checks
+   may use outdated memberships, e.g. a removed user keeps access to a group.
+"""
+
+__copyright__ = 'Copyright (c) 2024, Utrecht University'
+__license__   = 'GPLv3, see LICENSE'
+
+import genquery
+
+import cached_data_manager
+import jsonutil
+from config import config
+
+
+class GroupMembershipDataManager(cached_data_manager.CachedDataManager):
+    """Caches the groups of users, and the members and roles of groups.
+
+       Keys have the following formats:
+
+       - "groups::<user#zone>": list of groups the user is a member of
+       - "members::<group>":    list of (user, zone) members of a group
+       - "roles::<group>":      dict of user#zone to role of the user in a group
+                                ('reader' | 'normal' | 'manager')
+    """
+
+    def get(self, ctx, keyname):
+        """Retrieves data from the cache if possible, otherwise retrieves
+           the original. The cache is not used if caching is disabled.
+
+           :param ctx:     Combined type of a callback and rei struct
+           :param keyname: name of the key
+
+           :returns:       data for this key
+        """
+        if config.group_membership_cache_ttl <= 0:
+            return jsonutil.parse(self._get_original_data(ctx, keyname))
+        return jsonutil.parse(super(GroupMembershipDataManager, self).get(ctx, keyname))
+
+    def get_user_groups(self, ctx, user_name):
+        """Get the groups a user is a member of.
+
+           :param ctx:       Combined type of a callback and rei struct
+           :param user_name: User name, formatted as user#zone
+
+           :returns: List of group names
+        """
+        return self.get(ctx, "groups::" + user_name)
+
+    def get_group_members(self, ctx, group_name):
+        """Get the members of a group.
+
+           :param ctx:        Combined type of a callback and rei struct
+           :param group_name: Group name
+
+           :returns: List of (user, zone) tuples
+        """
+        return [tuple(member) for member in self.get(ctx, "members::" + group_name)]
+
+    def get_group_roles(self, ctx, group_name):
+        """Get the roles of the users in a group.
+
+           :param ctx:        Combined type of a callback and rei struct
+           :param group_name: Group name
+
+           :returns: Dict of user#zone to role ('reader' | 'normal' | 'manager')
+        """
+        return self.get(ctx, "roles::" + group_name)
+
+    def clear_user(self, ctx, user_name):
+        """Clears cached data of a user after its group memberships have changed.
+
+           :param ctx:       Combined type of a callback and rei struct
+           :param user_name: User name, formatted as user#zone
+        """
+        self._clear_keys(ctx, ["groups::" + user_name])
+
+    def clear_group(self, ctx, group_name):
+        """Clears cached data of a group after its members have changed. This includes
+           the read group of research groups, which holds the readers of the group.
+
+           :param ctx:        Combined type of a callback and rei struct
+           :param group_name: Group name
+        """
+        keys = ["members::" + group_name, "roles::" + group_name]
+        read_group_name = _get_read_group_name(group_name)
+        if read_group_name is not None:
+            keys.append("members::" + read_group_name)
+        self._clear_keys(ctx, keys)
+
+    def _clear_keys(self, ctx, keynames):
+        if self._cache_available():
+            for keyname in keynames:
+                self.clear(ctx, keyname)
+
+    def _get_context_string(self):
+        """ :returns: a string that identifies the particular type of data manager
+
+           :returns: context string for this type of data manager
+        """
+        return "groupmembership"
+
+    def _get_original_data(self, ctx, keyname):
+        """This function is called when data needs to be retrieved from the original
+           (non-cached) location.
+
+           :param ctx:     Combined type of a callback and rei struct
+           :param keyname: name of the key
+
+           :returns:       Original data for this key, as JSON
+
+           :raises Exception: if the key has an unknown format
+        """
+        kind, _, name = keyname.partition("::")
+        if kind == "groups":
+            user_name, _, user_zone = name.partition("#")
+            data = [row[0] for row in genquery.row_iterator(
+                "USER_GROUP_NAME",
+                "USER_NAME = '{}' AND USER_ZONE = '{}'".format(user_name, user_zone),
+                genquery.AS_LIST, ctx)]
+        elif kind == "members":
+            data = self._get_original_members(ctx, name)
+        elif kind == "roles":
+            data = self._get_original_roles(ctx, name)
+        else:
+            raise Exception("Unknown group membership key '{}'.".format(keyname))
+
+        return jsonutil.dump(data, separators=(',', ':'))
+
+    def _get_original_members(self, ctx, group_name):
+        return [[row[0], row[1]] for row in genquery.row_iterator(
+            "USER_NAME, USER_ZONE",
+            "USER_GROUP_NAME = '{}' AND USER_TYPE != 'rodsgroup'".format(group_name),
+            genquery.AS_LIST, ctx)]
+
+    def _get_original_roles(self, ctx, group_name):
+        # Roles are determined in the same way as groups.getGroupData() does.
+        managers = []
+        has_metadata = False
+        for row in genquery.row_iterator(
+                "META_USER_ATTR_NAME, META_USER_ATTR_VALUE",
+                "USER_GROUP_NAME = '{}' AND USER_TYPE = 'rodsgroup'".format(group_name),
+                genquery.AS_LIST, ctx):
+            has_metadata = True
+            if row[0] == "manager":
+                managers.append(row[1])
+
+        roles = {}
+        if not has_metadata:
+            return roles
+
+        if not group_name.startswith("vault-"):
+            read_group_name = _get_read_group_name(group_name)
+            if read_group_name is not None:
+                for user_name, user_zone in self._get_original_members(ctx, read_group_name):
+                    if user_name != read_group_name:
+                        roles[user_name + "#" + user_zone] = "reader"
+
+            for user_name, user_zone in self._get_original_members(ctx, group_name):
+                if group_name not in (user_name, 'rodsadmin', 'public'):
+                    roles[user_name + "#" + user_zone] = "normal"
+
+        for manager in managers:
+            roles[manager] = "manager"
+
+        return roles
+
+    def _update_cache(self, ctx, keyname, data):
+        """Update a value in the cache, expiring it after the configured time to live
+
+           :param ctx:     Combined type of a callback and rei struct
+           :param keyname: name of the key
+           :param data: data for this key
+        """
+        cache_keyname = self._get_cache_keyname(keyname)
+        self._get_connection().set(cache_keyname, data, ex=config.group_membership_cache_ttl)
+
+    def _should_populate_cache_on_get(self):
+        """This function controls whether the manager populates the cache
+           after retrieving original data.
+
+           :returns: Boolean value that states whether the cache should be populated when original data
+                     is retrieved.
+        """
+        return config.group_membership_cache_ttl > 0
+
+
+def _get_read_group_name(group_name):
+    """Returns the name of the read group of a research group, or None for other groups."""
+    for prefix in ["research-", "initial-"]:
+        if group_name.startswith(prefix):
+            return "read-" + group_name[len(prefix):]
+    return None
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""Pooled HTTP sessions for calls to external services, such as DataCite, SRAM and the EUS.
+
+Sessions are kept for the lifetime of the agent, one per endpoint, so that connections
+to a service are kept alive and reused, instead of setting up a new TCP and TLS connection
+for every call. Calls that fail with a connection error or with a 429 or 5xx response are
+retried a bounded number of times, with jittered exponential backoff. The latency of every
+call is recorded per endpoint.
+
+Sessions can be shared by worker threads (e.g. of the bulk publication update), so this
+module does not use the callback.
+"""
+
+__copyright__ = 'Copyright (c) 2024, Utrecht University'
+__license__   = 'GPLv3, see LICENSE'
+
+import random
+import threading
+import time
+
+import requests
+
+from config import config
+
+# Responses that indicate that a request can be tried again.
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+# Methods that can be retried after a connection error or server error,
+# because repeating them has no additional effect.
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+_sessions = {}
+_metrics = {}
+_lock = threading.Lock()
+
+
+def session(endpoint):
+    """Return the pooled session of an endpoint, creating it when needed.
+
+    :param endpoint: Name of the endpoint (e.g. 'datacite')
+
+    :returns: Session of the endpoint
+    """
+    with _lock:
+        if endpoint not in _sessions:
+            _sessions[endpoint] = requests.Session()
+        return _sessions[endpoint]
+
+
+def close():
+    """Close the sessions of all endpoints, and their connections."""
+    with _lock:
+        for s in _sessions.values():
+            s.close()
+        _sessions.clear()
+
+
+def request(endpoint, method, url, retries=None, backoff_time=None, **kwargs):
+    """Perform an HTTP request using the pooled session of an endpoint.
+
+    Requests with an idempotent method are retried after a connection error or a response
+    with a status code in RETRY_STATUS_CODES. Other requests are only retried after a 429
+    response, because the server may already have processed them.
+
+    :param endpoint:     Name of the endpoint (e.g. 'datacite')
+    :param method:       HTTP method
+    :param url:          URL of the request
+    :param retries:      Maximum number of retries, defaults to config.http_max_retries
+    :param backoff_time: Base backoff time in seconds, defaults to config.http_backoff_time
+    :param kwargs:       Arguments for requests, such as headers, data, timeout and verify
+
+    :returns: Response of the last attempt
+
+    :raises requests.ConnectionError: If the last attempt failed to connect
+    """
+    method = method.upper()
+    if retries is None:
+        retries = config.http_max_retries
+    if backoff_time is None:
+        backoff_time = config.http_backoff_time
+
+    attempt = 0
+    while True:
+        start = time.time()
+        try:
+            response = session(endpoint).request(method, url, **kwargs)
+        except requests.ConnectionError:
+            _record(endpoint, time.time() - start, None, attempt > 0)
+            if attempt >= retries or method not in IDEMPOTENT_METHODS:
+                raise
+        else:
+            _record(endpoint, time.time() - start, response.status_code, attempt > 0)
+            if (attempt >= retries
+                    or response.status_code not in RETRY_STATUS_CODES
+                    or (method not in IDEMPOTENT_METHODS and response.status_code != 429)):
+                return response
+
+        time.sleep(backoff(attempt, backoff_time))
+        attempt += 1
+
+
+def get(endpoint, url, **kwargs):
+    """Perform a GET request using the pooled session of an endpoint (see request).
+
+    :param endpoint: Name of the endpoint
+    :param url:      URL of the request
+    :param kwargs:   Arguments for request
+
+    :returns: Response of the last attempt
+    """
+    return request(endpoint, 'GET', url, **kwargs)
+
+
+def post(endpoint, url, **kwargs):
+    """Perform a POST request using the pooled session of an endpoint (see request).
+
+    :param endpoint: Name of the endpoint
+    :param url:      URL of the request
+    :param kwargs:   Arguments for request
+
+    :returns: Response of the last attempt
+    """
+    return request(endpoint, 'POST', url, **kwargs)
+
+
+def put(endpoint, url, **kwargs):
+    """Perform a PUT request using the pooled session of an endpoint (see request).
+
+    :param endpoint: Name of the endpoint
+    :param url:      URL of the request
+    :param kwargs:   Arguments for request
+
+    :returns: Response of the last attempt
+    """
+    return request(endpoint, 'PUT', url, **kwargs)
+
+
+def delete(endpoint, url, **kwargs):
+    """Perform a DELETE request using the pooled session of an endpoint (see request).
+
+    :param endpoint: Name of the endpoint
+    :param url:      URL of the request
+    :param kwargs:   Arguments for request
+
+    :returns: Response of the last attempt
+    """
+    return request(endpoint, 'DELETE', url, **kwargs)
+
+
+def backoff(attempt, backoff_time):
+    """Determine the time to wait before retrying a request, with full jitter.
+
+    :param attempt:      Number of the failed attempt, starting at 0
+    :param backoff_time: Base backoff time in seconds
+
+    :returns: Time to wait in seconds
+    """
+    return random.uniform(0, min(config.http_backoff_max_time, backoff_time * 2 ** attempt))
+
+
+def _record(endpoint, duration, status_code, retry):
+    with _lock:
+        metrics = _metrics.setdefault(endpoint, {"calls": 0, "retries": 0, "errors": 0,
+                                                 "total_time": 0.0, "max_time": 0.0})
+        metrics["calls"] += 1
+        metrics["total_time"] += duration
+        metrics["max_time"] = max(metrics["max_time"], duration)
+        if retry:
+            metrics["retries"] += 1
+        if status_code is None or status_code in RETRY_STATUS_CODES:
+            metrics["errors"] += 1
+
+
+def get_metrics():
+    """Return the call metrics of all endpoints since the agent started (or since reset_metrics).
+
+    :returns: Dict of endpoint to a dict with the number of calls, retries and errors,
+              and the total and maximum latency in seconds
+    """
+    with _lock:
+        return dict((endpoint, dict(metrics)) for endpoint, metrics in _metrics.items())
+
+
+def reset_metrics():
+    """Reset the call metrics of all endpoints."""
+    with _lock:
+        _metrics.clear()
+
+
+def format_metrics():
+    """Format the call metrics of all endpoints, for logging.
+
+    :returns: List of lines, one per endpoint
+    """
+    return ["{}: {} calls, {} retries, {} errors, {:.1f} ms average, {:.1f} ms maximum latency".format(
+            endpoint, metrics["calls"], metrics["retries"], metrics["errors"],
+            1000.0 * metrics["total_time"] / metrics["calls"], 1000.0 * metrics["max_time"])
+            for endpoint, metrics in sorted(get_metrics().items())]
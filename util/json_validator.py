@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""Persistent JSON schema validation workers.
+
+Validation is handed to a Python 3 interpreter to validate with the Draft201909 validator.
+This can be removed when we can use Python 3 in the ruleset (iRODS 4.3.x).
+
+Starting a Python 3 interpreter and importing jsonschema is expensive, so the gateways
+are kept alive for the lifetime of the agent and shared by all validation callers.
+Each worker keeps its compiled validators cached by schema key (the schema's $id and
+a digest of its contents), so a schema is only sent to and compiled by a worker once,
+while a schema that is updated in place under the same $id is compiled again.
+"""
+
+__copyright__ = 'Copyright (c) 2024, Utrecht University'
+__license__   = 'GPLv3, see LICENSE'
+
+import atexit
+import hashlib
+import json
+from collections import deque
+
+import error
+from config import config
+
+# Code executed by the Python 3 worker.
+# Messages are (schema_key, schema, metadata, ignore_required) tuples, schema is None
+# when the worker has already compiled a validator for schema_key.
+# The reply is a list of errors, or a dict with the exception if the document could not
+# be validated (e.g. because of an invalid schema or an unresolvable $ref).
+_WORKER_SOURCE = """
+import jsonschema
+
+validators = {}
+
+def transform_error(e):
+    return {'message':     e.message,
+            'path':        list(e.path),
+            'schema_path': list(e.schema_path),
+            'validator':   e.validator}
+
+while 1:
+    message = channel.receive()
+    if message is None:
+        break
+
+    schema_key, schema, metadata, ignore_required = message
+    try:
+        if schema is not None:
+            validators[schema_key] = None
+            validators[schema_key] = jsonschema.Draft201909Validator(schema)
+        if validators[schema_key] is None:
+            raise ValueError('schema could not be compiled')
+
+        # Perform validation and filter errors.
+        errors = validators[schema_key].iter_errors(metadata)
+
+        if ignore_required:
+            errors = filter(lambda e: e.validator not in ['required', 'dependencies'], errors)
+
+        result = list(map(transform_error, errors))
+    except Exception as e:
+        # Report the failure of this document and keep serving the others.
+        result = {'exception': '{}: {}'.format(type(e).__name__, e)}
+
+    channel.send(result)
+"""
+
+
+class _Worker(object):
+    """A Python 3 validation gateway, restarted on failure."""
+
+    def __init__(self):
+        self._gateway = None
+        self._channel = None
+        self._schema_keys = set()
+
+    def _start(self):
+        import execnet
+        self._gateway = execnet.makegateway("popen//python=" + config.python3_interpreter)
+        self._channel = self._gateway.remote_exec(_WORKER_SOURCE)
+        self._schema_keys = set()
+
+    def stop(self):
+        """Stop the worker process, if it is running."""
+        try:
+            if self._channel is not None and not self._channel.isclosed():
+                self._channel.send(None)
+            if self._gateway is not None:
+                self._gateway.exit()
+        except Exception:
+            # Worker is already gone.
+            pass
+
+        self._gateway = None
+        self._channel = None
+        self._schema_keys = set()
+
+    def restart(self):
+        self.stop()
+        self._start()
+
+    def send(self, schema_key, schema, metadata, ignore_required):
+        """Send a validation request to the worker, starting it if needed."""
+        if self._channel is None or self._channel.isclosed():
+            self.restart()
+
+        try:
+            self._send(schema_key, schema, metadata, ignore_required)
+        except Exception:
+            # Worker went away between requests.
+            self.restart()
+            self._send(schema_key, schema, metadata, ignore_required)
+
+    def _send(self, schema_key, schema, metadata, ignore_required):
+        if schema_key in self._schema_keys:
+            schema = None
+        self._channel.send((schema_key, schema, metadata, ignore_required))
+        self._schema_keys.add(schema_key)
+
+    def receive(self):
+        """Receive the result of the oldest pending validation request."""
+        return self._channel.receive()
+
+
+_workers = []
+
+
+def _get_workers():
+    """Return the worker pool of this agent, creating it when needed."""
+    if len(_workers) == 0:
+        _workers.extend(_Worker() for _ in range(max(1, config.json_validation_workers)))
+    return _workers
+
+
+@atexit.register
+def shutdown():
+    """Stop all validation workers of this agent."""
+    for worker in _workers:
+        worker.stop()
+    del _workers[:]
+
+
+def _plain(data):
+    """Turn a (possibly ordered) JSON structure into plain types that can be sent to a worker."""
+    # Can't serialize OrderedDict, so transform to dicts.
+    return json.loads(json.dumps(data))
+
+
+def _schema_key(schema):
+    """Determine the key a compiled validator is cached under by the workers.
+
+    :param schema: Parsed JSON schema
+
+    :returns: The schema $id (if any) and a digest of the schema contents
+    """
+    digest = hashlib.sha1(json.dumps(schema, sort_keys=True)).hexdigest()
+    schema_id = schema.get('$id')
+    if schema_id:
+        return '{} {}'.format(schema_id, digest)
+    return digest
+
+
+def validate_many(documents):
+    """Validate JSON documents against JSON schemas using the validation workers.
+
+    Documents are distributed over the workers, with at most json_validation_max_pending
+    requests in flight per worker. A worker that fails is restarted and its pending
+    requests are resubmitted once.
+
+    A document that the validator cannot process (e.g. because its schema is invalid)
+    does not stop the batch: a UUJsonValidationError is yielded in place of its errors.
+
+    :param documents: Iterable of (schema, metadata, ignore_required) tuples
+
+    :yields: Error lists, or UUJsonValidationError instances, in the same order as the documents
+    """
+    workers = _get_workers()
+    max_pending = len(workers) * max(1, config.json_validation_max_pending)
+    schemas = {}
+
+    # Schema keys by schema object, so that callers passing the same (cached) schema
+    # object for many documents only have it digested once. The schema is kept
+    # referenced, so that its id cannot be reused.
+    schema_keys = {}
+
+    # Pending requests, oldest first: [worker, schema_key, metadata, ignore_required, retried].
+    pending = deque()
+
+    def collect():
+        request = pending.popleft()
+        worker = request[0]
+        try:
+            result = worker.receive()
+        except Exception:
+            if request[4]:
+                raise
+
+            # Restart the worker and resubmit everything that was sent to it, in order.
+            pending.appendleft(request)
+            worker.restart()
+            for item in pending:
+                if item[0] is worker:
+                    item[4] = True
+                    worker.send(item[1], schemas[item[1]], item[2], item[3])
+            return collect()
+
+        if isinstance(result, dict):
+            return error.UUJsonValidationError(result['exception'])
+        return result
+
+    try:
+        for i, (schema, metadata, ignore_required) in enumerate(documents):
+            if id(schema) not in schema_keys:
+                schema_keys[id(schema)] = (schema, _schema_key(schema))
+            schema_key = schema_keys[id(schema)][1]
+            if schema_key not in schemas:
+                schemas[schema_key] = _plain(schema)
+
+            request = [workers[i % len(workers)], schema_key, _plain(metadata), ignore_required, False]
+            request[0].send(schema_key, schemas[schema_key], request[2], ignore_required)
+            pending.append(request)
+
+            if len(pending) >= max_pending:
+                yield collect()
+
+        while len(pending) > 0:
+            yield collect()
+    finally:
+        # Caller stopped early or something failed: make sure no stale results
+        # are left behind on the channels of the workers.
+        for worker in set(item[0] for item in pending):
+            worker.stop()
+
+
+def validate(schema, metadata, ignore_required=False):
+    """Validate a JSON document against a JSON schema.
+
+    :param schema:          Parsed JSON schema
+    :param metadata:        Parsed JSON document
+    :param ignore_required: Ignore required fields
+
+    :returns: List of validation errors
+
+    :raises UUJsonValidationError: If the document could not be validated
+    """
+    result = next(validate_many([(schema, metadata, ignore_required)]))
+    if isinstance(result, error.UUJsonValidationError):
+        raise error.UUJsonValidationError(str(result))
+    return result
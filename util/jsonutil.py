@@ -117,8 +117,13 @@ def read(callback, path, **options):
 
 
 def write(callback, path, data, **options):
-    """Write a JSON object to an iRODS data object."""
-    return data_object.write(callback, path, dump(data, **options))
+    """Write a JSON object to an iRODS data object, without creating the complete JSON string in memory."""
+    encoder = json.JSONEncoder(ensure_ascii=False,
+                               encoding='utf-8',
+                               **({'indent': 4} if options == {} else options))
+    with data_object.open_stream(callback, path, 'w') as stream:
+        for chunk in encoder.iterencode(_promote_strings(data)):
+            stream.write(chunk.encode('utf-8'))
 
 
 def set_on_object(ctx, path, type, namespace, json_string):
@@ -62,7 +62,9 @@ def check_data_package_system_avus(extracted_avus):
 
     # optional avus
     avu_names_optional_suffix = {
-        'versionDOIAvailable', 'baseDOIAvailable'
+        'versionDOIAvailable', 'baseDOIAvailable',
+        'combiJsonHash', 'dataCiteJsonHash', 'landingPageHash',
+        'baseLandingPageUploaded', 'baseOaiUploaded'
     }
 
     combined_avu_names_suffix = avu_names_suffix
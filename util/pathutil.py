@@ -3,10 +3,11 @@
 
 # (ideally this module would be named 'path', but name conflicts cause too much pain)
 
-__copyright__ = 'Copyright (c) 2019-2023, Utrecht University'
+__copyright__ = 'Copyright (c) 2019-2024, Utrecht University'
 __license__   = 'GPLv3, see LICENSE'
 
 import re
+from collections import namedtuple
 from enum import Enum
 
 
@@ -69,6 +70,30 @@ def chopext(path):
     return path.rsplit('.', 1)
 
 
+PathInfo = namedtuple('PathInfo', 'space zone group subpath')
+
+# Spaces of groups, by group name prefix.
+_GROUP_SPACES = {'vault':        Space.VAULT,
+                 'research':     Space.RESEARCH,
+                 'deposit':      Space.DEPOSIT,
+                 'datamanager':  Space.DATAMANAGER,
+                 'grp-intake':   Space.INTAKE,
+                 'intake':       Space.INTAKE,
+                 'datarequests': Space.DATAREQUEST}
+
+# Matches /zone/home/group[/subpath] (groups 1, 2 and 4, with the prefix of the group name
+# in group 3 if it has a known space), or else /zone[/subpath] (groups 1 and 5).
+_INFO_PATTERN = re.compile(r'^/([^/]+)(?:/home/((?:({})-)?[^/]+)(?:/(.+))?|(?:/(.+))?)$'
+                           .format('|'.join(_GROUP_SPACES)))
+
+# Paths are parsed many times per policy, so results are cached. The cache keeps the paths
+# used in the current and the previous generation of _INFO_CACHE_SIZE paths, which bounds it
+# like an LRU cache without the cost of reordering entries on every hit.
+_INFO_CACHE_SIZE = 1024
+_info_cache = {}
+_info_cache_previous = {}
+
+
 def info(path):
     """Parse a path into a (Space, zone, group, subpath) tuple.
 
@@ -92,33 +117,30 @@ def info(path):
 
     :param path: Path to parse
 
-    :returns: Tuple with space, zone, group and subpath
+    :returns: PathInfo tuple with space, zone, group and subpath
     """
-    # Turn empty match groups into empty strings.
-    def f(x):
-        return '' if x is None else x
-
-    def g(m, i):
-        return '' if i > len(m.groups()) else f(m.group(i))
-
-    def result(s, m):
-        return (s, g(m, 1), g(m, 2), g(m, 3))
-
-    # Try a pattern and report success if it matches.
-    def test(r, space):
-        m = re.match(r, path)
-        return m and result(space, m)
-
-    from collections import namedtuple
-
-    return (namedtuple('PathInfo', 'space zone group subpath'.split())
-            (*test('^/([^/]+)/home/(vault-[^/]+)(?:/(.+))?$',         Space.VAULT)
-            or test('^/([^/]+)/home/(research-[^/]+)(?:/(.+))?$',     Space.RESEARCH)
-            or test('^/([^/]+)/home/(deposit-[^/]+)(?:/(.+))?$',      Space.DEPOSIT)
-            or test('^/([^/]+)/home/(datamanager-[^/]+)(?:/(.+))?$',  Space.DATAMANAGER)
-            or test('^/([^/]+)/home/(grp-intake-[^/]+)(?:/(.+))?$',   Space.INTAKE)
-            or test('^/([^/]+)/home/(intake-[^/]+)(?:/(.+))?$',       Space.INTAKE)
-            or test('^/([^/]+)/home/(datarequests-[^/]+)(?:/(.+))?$', Space.DATAREQUEST)
-            or test('^/([^/]+)/home/([^/]+)(?:/(.+))?$',              Space.OTHER)
-            or test('^/([^/]+)()(?:/(.+))?$',                         Space.OTHER)
-            or (Space.OTHER, '', '', '')))  # (matches '/' and empty paths)
+    result = _info_cache.get(path)
+    if result is None:
+        result = _info_cache_previous.get(path) or _parse_info(path)
+        if len(_info_cache) >= _INFO_CACHE_SIZE:
+            # Start a new generation. Paths that were not used again are dropped.
+            _info_cache_previous.clear()
+            _info_cache_previous.update(_info_cache)
+            _info_cache.clear()
+        _info_cache[path] = result
+
+    return result
+
+
+def _parse_info(path):
+    """Parse a path into a PathInfo tuple, without caching (see info)."""
+    m = _INFO_PATTERN.match(path)
+    if m is None:
+        # (matches '/' and empty paths)
+        return PathInfo(Space.OTHER, '', '', '')
+
+    zone, group, prefix, group_subpath, subpath = m.groups()
+    if group is None:
+        return PathInfo(Space.OTHER, zone, '', subpath or '')
+
+    return PathInfo(_GROUP_SPACES.get(prefix, Space.OTHER), zone, group, group_subpath or '')
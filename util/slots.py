@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""This file contains functions that limit the number of processes on this server that can use a shared resource
+   (e.g. a storage resource) at the same time.
+
+   A named resource has a number of slots. Each slot is a lock file, so a slot is released automatically
+   if the process that holds it exits.
+"""
+
+__copyright__ = 'Copyright (c) 2024, Utrecht University'
+__license__   = 'GPLv3, see LICENSE'
+
+import fcntl
+import os
+import time
+from contextlib import contextmanager
+
+import constants
+
+
+@contextmanager
+def slot(name, num_slots, timeout=0):
+    """Acquires one of the slots of a named resource, and yields whether a slot was acquired."""
+    lock_file = _acquire_slot(name, num_slots, timeout) if num_slots > 0 else None
+    try:
+        yield num_slots <= 0 or lock_file is not None
+    finally:
+        if lock_file is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+
+def _acquire_slot(name, num_slots, timeout):
+    if not os.path.exists(constants.SLOT_MAIN_DIRECTORY):
+        try:
+            os.mkdir(constants.SLOT_MAIN_DIRECTORY)
+        except OSError:
+            # Created by another process in the mean time.
+            pass
+
+    deadline = time.time() + timeout
+    while True:
+        for i in range(num_slots):
+            lock_file = open(os.path.join(constants.SLOT_MAIN_DIRECTORY, "{}.{}.lock".format(name.replace("/", "_"), i)), "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return lock_file
+            except IOError:
+                lock_file.close()
+
+        if time.time() >= deadline:
+            return None
+        time.sleep(constants.SLOT_POLL_INTERVAL)
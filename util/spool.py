@@ -2,40 +2,106 @@
    temporary data for batch processing. The intended use case is that one job collects data to be processed
    and stores it in the spooling system, while another job retrieves the data and processes it.
 
-   The current implementation does not have confirmations. It assumes that after spool data has been retrieved
-   from the spool system it is either processed, or any errors during processing will be taken
-   care of outside the spooling system (e.g. by having the job that collects data for the spooling system
-   re-submit spool data that has not been processed for a retry).
+   Spool data is stored in an SQLite database per process. Jobs retrieve spool data with a lease
+   (see lease_spool_data), and acknowledge it after it has been processed. Spool data that is not
+   acknowledged before its lease expires (e.g. because the job crashed) is delivered again, up to a
+   maximum number of deliveries. Each spooled data object is leased by at most one job at a time,
+   so multiple jobs can retrieve data from the same process queue concurrently.
 
    It is assumed that functions that use the spool subsystem take care of authorization and logging.
 """
 
+import fcntl
+import json
 import os
-
-import persistqueue
-import persistqueue.serializers.json
+import sqlite3
+import time
+from contextlib import contextmanager
 
 import constants
 
+_SQL_CREATE = """CREATE TABLE IF NOT EXISTS spool (
+                     id           INTEGER PRIMARY KEY AUTOINCREMENT,
+                     data         TEXT NOT NULL,
+                     lease_expiry REAL,
+                     deliveries   INTEGER NOT NULL DEFAULT 0,
+                     failed       INTEGER NOT NULL DEFAULT 0)"""
+
 
 def get_spool_data(process):
     """Retrieves one data object for a given batch process for processing.
+       The data object is acknowledged immediately, so it will not be delivered again.
        This function is non-blocking.
 
     :param process:      Spool process name (see util.constants for defined names)
 
     :returns: Spool data object, or None if there is no spool data for this process
     """
-    _ensure_spool_process_initialized(process)
-    q = _get_spool_queue(process)
+    lease = lease_spool_data(process)
+    if lease is None:
+        return None
 
-    try:
-        result = q.get(block=False)
-        q.task_done()
-    except persistqueue.exceptions.Empty:
-        result = None
+    lease_id, data = lease
+    ack_spool_data(process, lease_id)
+    return data
+
+
+def lease_spool_data(process, lease_time=None):
+    """Retrieves one data object for a given batch process for processing, with a lease.
+       The data object must be acknowledged with ack_spool_data after it has been processed.
+       If it is not acknowledged before the lease expires, it is delivered again.
+       This function is non-blocking.
+
+    :param process:      Spool process name (see util.constants for defined names)
+    :param lease_time:   Number of seconds before the data object is delivered again if it has not
+                         been acknowledged (default: constants.SPOOL_LEASE_TIME)
+
+    :returns: 2-tuple (lease ID, spool data object), or None if there is no spool data for this process
+    """
+    if lease_time is None:
+        lease_time = constants.SPOOL_LEASE_TIME
+
+    with _spool_database(process) as db:
+        while True:
+            now = time.time()
+            row = db.execute("""SELECT id, data, deliveries FROM spool
+                                WHERE failed = 0 AND (lease_expiry IS NULL OR lease_expiry < ?)
+                                ORDER BY id LIMIT 1""", (now,)).fetchone()
+            if row is None:
+                return None
 
-    return result
+            spool_id, data, deliveries = row
+            if deliveries >= constants.SPOOL_MAX_DELIVERIES:
+                # Data object keeps failing, so set it aside for manual inspection.
+                db.execute("UPDATE spool SET failed = 1 WHERE id = ?", (spool_id,))
+                continue
+
+            db.execute("UPDATE spool SET lease_expiry = ?, deliveries = ? WHERE id = ?",
+                       (now + lease_time, deliveries + 1, spool_id))
+            return "{}.{}".format(spool_id, deliveries + 1), json.loads(data)
+
+
+def ack_spool_data(process, lease_id):
+    """Acknowledges that a leased data object has been processed, and removes it from the spool system.
+       Acknowledgements of expired leases of data objects that have been delivered again are ignored.
+
+    :param process:      Spool process name (see util.constants for defined names)
+    :param lease_id:     Lease ID, as returned by lease_spool_data
+    """
+    spool_id, deliveries = _parse_lease_id(lease_id)
+    with _spool_database(process) as db:
+        db.execute("DELETE FROM spool WHERE id = ? AND deliveries = ?", (spool_id, deliveries))
+
+
+def nack_spool_data(process, lease_id):
+    """Releases a leased data object that has not been processed, so that it is delivered again right away.
+
+    :param process:      Spool process name (see util.constants for defined names)
+    :param lease_id:     Lease ID, as returned by lease_spool_data
+    """
+    spool_id, deliveries = _parse_lease_id(lease_id)
+    with _spool_database(process) as db:
+        db.execute("UPDATE spool SET lease_expiry = NULL WHERE id = ? AND deliveries = ?", (spool_id, deliveries))
 
 
 def put_spool_data(process, data_list):
@@ -45,10 +111,10 @@ def put_spool_data(process, data_list):
     :param data_list:    List (or other iterable) of arbitrary serializable data objects to store
                          in the spooling system
     """
-    _ensure_spool_process_initialized(process)
-    q = _get_spool_queue(process)
-    for data in data_list:
-        q.put(data)
+    rows = [(json.dumps(data),) for data in data_list]
+
+    with _spool_database(process) as db:
+        db.executemany("INSERT INTO spool (data) VALUES (?)", rows)
 
 
 def has_spool_data(process):
@@ -63,46 +129,126 @@ def has_spool_data(process):
 
 
 def num_spool_data(process):
-    """ Returns the number of items in the spool system for a given process
+    """ Returns the number of items in the spool system for a given process, including leased items
+        that have not been acknowledged yet.
 
     :param process:      Spool process name (see util.constants for defined names)
 
     :returns:            The number of data items in the spool system for this process
     """
-    _ensure_spool_process_initialized(process)
-    return _get_spool_queue(process).qsize()
+    with _spool_database(process) as db:
+        return db.execute("SELECT COUNT(*) FROM spool WHERE failed = 0").fetchone()[0]
 
 
-def _get_spool_directory(process):
-    if process in constants.SPOOL_PROCESSES:
-        return os.path.join(constants.SPOOL_MAIN_DIRECTORY, process, "spool")
-    else:
-        raise Exception("Spool process {} not found.".format(process))
+def num_failed_spool_data(process):
+    """ Returns the number of items in the spool system for a given process that have been set aside,
+        because they were not acknowledged after the maximum number of deliveries.
+
+    :param process:      Spool process name (see util.constants for defined names)
+
+    :returns:            The number of failed data items in the spool system for this process
+    """
+    with _spool_database(process) as db:
+        return db.execute("SELECT COUNT(*) FROM spool WHERE failed = 1").fetchone()[0]
+
 
+def _parse_lease_id(lease_id):
+    spool_id, deliveries = lease_id.split(".")
+    return int(spool_id), int(deliveries)
 
-def _get_temp_directory(process):
+
+def _get_process_directory(process):
     if process in constants.SPOOL_PROCESSES:
-        return os.path.join(constants.SPOOL_MAIN_DIRECTORY, process, "tmp")
+        return os.path.join(constants.SPOOL_MAIN_DIRECTORY, process)
     else:
         raise Exception("Spool process {} not found.".format(process))
 
 
-def _get_spool_queue(process):
-    directory = _get_spool_directory(process)
-    # JSON serialization is used to make it easier to examine spooled objects manually
-    return persistqueue.Queue(directory,
-                              tempdir=_get_temp_directory(process),
-                              serializer=persistqueue.serializers.json,
-                              chunksize=1)
+def _connect(process):
+    return sqlite3.connect(os.path.join(_get_process_directory(process), "spool.db"),
+                           timeout=constants.SPOOL_LOCK_TIMEOUT,
+                           isolation_level=None)
+
+
+@contextmanager
+def _spool_database(process):
+    """Opens the spool database of a process in an exclusive transaction, committed on success."""
+    _ensure_spool_process_initialized(process)
+
+    db = _connect(process)
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+    finally:
+        db.close()
+
+
+# Processes for which the spool database has been initialized by this agent.
+_initialized_processes = set()
 
 
 def _ensure_spool_process_initialized(process):
     if process not in constants.SPOOL_PROCESSES:
         raise Exception("Spool process {} not found.".format(process))
 
-    for directory in [constants.SPOOL_MAIN_DIRECTORY,
-                      os.path.join(constants.SPOOL_MAIN_DIRECTORY, process),
-                      _get_spool_directory(process),
-                      _get_temp_directory(process)]:
+    if process in _initialized_processes:
+        return
+
+    for directory in [constants.SPOOL_MAIN_DIRECTORY, _get_process_directory(process)]:
         if not os.path.exists(directory):
             os.mkdir(directory)
+
+    db = _connect(process)
+    try:
+        db.execute(_SQL_CREATE)
+    finally:
+        db.close()
+
+    _migrate_legacy_spool(process)
+    _initialized_processes.add(process)
+
+
+def _migrate_legacy_spool(process):
+    """Moves spool data of the previous, file-based spool queue of a process (if any) to the spool database."""
+    legacy_directory = os.path.join(_get_process_directory(process), "spool")
+    if not os.path.exists(legacy_directory):
+        return
+
+    import persistqueue
+    import persistqueue.serializers.json
+
+    with open(os.path.join(_get_process_directory(process), "lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(legacy_directory):
+                # Already migrated by another job.
+                return
+
+            q = persistqueue.Queue(legacy_directory,
+                                   tempdir=os.path.join(_get_process_directory(process), "tmp"),
+                                   serializer=persistqueue.serializers.json,
+                                   chunksize=1)
+            rows = []
+            while True:
+                try:
+                    rows.append((json.dumps(q.get(block=False)),))
+                except persistqueue.exceptions.Empty:
+                    break
+
+            db = _connect(process)
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                db.executemany("INSERT INTO spool (data) VALUES (?)", rows)
+                db.execute("COMMIT")
+            finally:
+                db.close()
+
+            q.task_done()
+            os.rename(legacy_directory, legacy_directory + ".migrated")
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -10,6 +10,7 @@ from collections import namedtuple
 import genquery
 import session_vars
 
+import group_membership_data_manager
 import log
 
 # User is a tuple consisting of a name and a zone, which stringifies into 'user#zone'.
@@ -101,9 +102,8 @@ def is_member_of(ctx, group, user=None):
     elif type(user) is str:
         user = from_str(ctx, user)
 
-    return genquery.Query(ctx, 'USER_GROUP_NAME',
-                          "USER_NAME = '{}' AND USER_ZONE = '{}' AND USER_GROUP_NAME = '{}'"
-                          .format(*list(user) + [group])).first() is not None
+    manager = group_membership_data_manager.GroupMembershipDataManager()
+    return group in manager.get_user_groups(ctx, '{}#{}'.format(*user))
 
 
 def name_from_id(ctx, user_id):
@@ -115,12 +115,10 @@ def create_archive(ctx, coll):
     # create extra archive files
     log.write(ctx, "Generating metadata for archive of data package <{}>".format(coll))
     data_object.copy(ctx, user_metadata, coll + "/archive/user-metadata.json")
-    data_object.write(ctx, coll + "/archive/system-metadata.json",
-                      jsonutil.dump(system_metadata))
+    jsonutil.write(ctx, coll + "/archive/system-metadata.json", system_metadata)
     msi.data_obj_chksum(ctx, coll + "/archive/system-metadata.json", "",
                         irods_types.BytesBuf())
-    data_object.write(ctx, coll + "/archive/provenance-log.json",
-                      jsonutil.dump(provenance_log))
+    jsonutil.write(ctx, coll + "/archive/provenance-log.json", provenance_log)
     msi.data_obj_chksum(ctx, coll + "/archive/provenance-log.json", "",
                         irods_types.BytesBuf())
 